@@ -0,0 +1,286 @@
+# encoding: utf-8
+"""
+常驻的 Playwright 浏览器池：浏览器只启动一次，每次取 cookies 新建一个无痕上下文，
+取 cookies 的耗时从“启动浏览器 + 加载页面”降到只剩加载页面
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from loguru import logger
+from playwright.async_api import async_playwright
+
+BROWSER_POOL_SIZE = int(os.getenv('XHS_BROWSER_POOL_SIZE', 1))
+# 每个浏览器最多创建多少个上下文后重启，避免长时间运行后内存膨胀
+BROWSER_MAX_CONTEXTS = int(os.getenv('XHS_BROWSER_MAX_CONTEXTS', 50))
+BROWSER_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-gpu'
+]
+BROWSER_CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
+}
+XHS_HOME_URL = 'https://www.xiaohongshu.com'
+# 快速模式：拦截这些类型的请求，出现必需的 cookies 就结束，最长等待 deadline 秒
+FAST_BLOCKED_RESOURCES = {'image', 'media', 'font', 'stylesheet'}
+FAST_REQUIRED_COOKIES = [name for name in os.getenv('XHS_GUEST_REQUIRED_COOKIES', 'a1,webId').split(',') if name]
+FAST_DEADLINE = float(os.getenv('XHS_GUEST_COOKIE_DEADLINE', 10))
+FAST_POLL_INTERVAL = 0.1
+
+
+async def block_heavy_resources(route):
+    if route.request.resource_type in FAST_BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def format_cookies(cookies: list):
+    """把 context.cookies() 的结果转成 (cookies_str, cookies_dict)"""
+    cookies_dict = {cookie['name']: cookie['value'] for cookie in cookies}
+    cookies_str = '; '.join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+    return cookies_str, cookies_dict
+
+
+class BrowserSlot():
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.contexts = 0
+        self.launches = 0
+
+
+class BrowserPool():
+    def __init__(self, size: int = BROWSER_POOL_SIZE, max_contexts: int = BROWSER_MAX_CONTEXTS, headless: bool = True, timeout: int = 30000):
+        """
+        浏览器池跑在一个独立线程的事件循环里，对外提供同步接口，可以直接在 FastAPI 的线程池或脚本里调用
+        :param size: 常驻浏览器数量，也是同时进行的取 cookies 次数上限
+        :param max_contexts: 单个浏览器创建多少个上下文后重启
+        :param headless: 是否无头模式
+        :param timeout: 页面操作超时时间(毫秒)
+        """
+        self.size = size
+        self.max_contexts = max_contexts
+        self.headless = headless
+        self.timeout = timeout
+        self.loop = None
+        self.thread = None
+        self.playwright = None
+        self.slots = None
+        self.all_slots = []
+        self.lock = threading.Lock()
+        self.fetches = 0
+        self.failures = 0
+        self.recycles = 0
+        self.fetch_time = 0.0
+
+    def ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='browser-pool', daemon=True)
+                thread.start()
+                try:
+                    asyncio.run_coroutine_threadsafe(self.start_async(), loop).result()
+                except BaseException:
+                    # 启动失败（例如没装 playwright）时停掉这次的事件循环线程，下次调用重新创建，不会越积越多
+                    loop.call_soon_threadsafe(loop.stop)
+                    thread.join()
+                    loop.close()
+                    raise
+                self.loop, self.thread = loop, thread
+            return self.loop
+
+    def call(self, coro, timeout: float = None):
+        """在浏览器池的事件循环里执行协程并同步等待结果"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.ensure_loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # 超时后取消协程，不让没人等的请求继续排队或占着浏览器
+            future.cancel()
+            raise
+
+    async def start_async(self):
+        self.playwright = await async_playwright().start()
+        self.slots = asyncio.Queue()
+        self.all_slots = [BrowserSlot(index) for index in range(self.size)]
+        for slot in self.all_slots:
+            self.slots.put_nowait(slot)
+
+    async def launch(self, slot: BrowserSlot):
+        slot.browser = await self.playwright.chromium.launch(headless=self.headless, args=BROWSER_ARGS)
+        slot.contexts = 0
+        slot.launches += 1
+        logger.info(f'🚀 浏览器池 #{slot.index} 已启动（第 {slot.launches} 次）')
+
+    async def recycle(self, slot: BrowserSlot, reason: str):
+        self.recycles += 1
+        logger.info(f'♻️  回收浏览器 #{slot.index}: {reason}')
+        browser, slot.browser = slot.browser, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+
+    async def acquire(self):
+        """取一个健康的浏览器：已断开或用满上下文数的先重启"""
+        slot = await self.slots.get()
+        try:
+            if slot.browser is not None and not slot.browser.is_connected():
+                await self.recycle(slot, '浏览器已断开')
+            elif slot.browser is not None and slot.contexts >= self.max_contexts:
+                await self.recycle(slot, f'已创建 {slot.contexts} 个上下文')
+            if slot.browser is None:
+                await self.launch(slot)
+        except BaseException:
+            # 含调用方超时后的取消
+            self.slots.put_nowait(slot)
+            raise
+        return slot
+
+    async def wait_for_cookies(self, context, required: list, deadline: float):
+        """轮询上下文里的 cookies，必需的全部出现或到达截止时间就返回"""
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        while True:
+            cookies = await context.cookies()
+            missing = set(required) - {cookie['name'] for cookie in cookies}
+            if not missing:
+                return cookies
+            if loop.time() >= end:
+                logger.warning(f"⚠️  {deadline}s 内未等到关键cookies: {sorted(missing)}")
+                return cookies
+            await asyncio.sleep(FAST_POLL_INTERVAL)
+
+    async def fetch_cookies_async(self, url: str, wait_time: float, fast: bool = False):
+        slot = await self.acquire()
+        context = None
+        try:
+            slot.contexts += 1
+            context = await slot.browser.new_context(**BROWSER_CONTEXT_OPTIONS)
+            page = await context.new_page()
+            page.set_default_timeout(self.timeout)
+            if fast:
+                # 只需要页面脚本写入的 cookies，图片、视频、字体、样式都不用加载
+                await context.route('**/*', block_heavy_resources)
+                response = await page.goto(url, wait_until='commit')
+            else:
+                response = await page.goto(url, wait_until='networkidle')
+            if response is not None and response.status != 200:
+                logger.warning(f"⚠️  页面响应状态码: {response.status}")
+            if fast:
+                cookies = await self.wait_for_cookies(context, FAST_REQUIRED_COOKIES, FAST_DEADLINE)
+            else:
+                if wait_time:
+                    await asyncio.sleep(wait_time)
+                cookies = await context.cookies()
+            return format_cookies(cookies)
+        except Exception:
+            # 页面级错误不一定是浏览器的问题，但崩溃后的浏览器留着只会让后续请求继续失败
+            if not slot.browser.is_connected():
+                await self.recycle(slot, '浏览器崩溃')
+            raise
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            self.slots.put_nowait(slot)
+
+    def get_guest_cookies(self, wait_time: float = 3, retry_count: int = 3, url: str = XHS_HOME_URL, fast: bool = False):
+        """
+        获取小红书游客cookies，接口与 XHSCookieGetter.get_guest_cookies 一致
+        :param wait_time: 页面加载完成后再等待的秒数（快速模式下不使用）
+        :param retry_count: 重试次数
+        :param fast: 快速模式，拦截图片/视频/字体/样式，关键 cookies 一出现就返回
+        :return: (success, cookies_str, cookies_dict)
+        """
+        for attempt in range(retry_count):
+            start = time.monotonic()
+            try:
+                cookies_str, cookies_dict = self.call(self.fetch_cookies_async(url, wait_time, fast), timeout=self.timeout / 1000 + wait_time + FAST_DEADLINE + 30)
+                if not cookies_dict:
+                    logger.warning("⚠️  未获取到任何cookies")
+                    continue
+                self.fetches += 1
+                self.fetch_time += time.monotonic() - start
+                logger.info(f"✅ 成功获取 {len(cookies_dict)} 个cookies，耗时 {time.monotonic() - start:.2f}s")
+                return True, cookies_str, cookies_dict
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"❌ 第 {attempt + 1} 次尝试失败: {str(e)}")
+        return False, "", {}
+
+    async def close_async(self):
+        for slot in self.all_slots:
+            await self.recycle_quietly(slot)
+        self.slots = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+    async def recycle_quietly(self, slot: BrowserSlot):
+        if slot.browser is not None:
+            try:
+                await slot.browser.close()
+            except Exception:
+                pass
+            slot.browser = None
+
+    def close(self):
+        # 关闭完成前一直持有锁，期间的 get_guest_cookies 等关闭结束后再启动新的事件循环，不会同时存在两个 Playwright
+        with self.lock:
+            loop, thread = self.loop, self.thread
+            if loop is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self.close_async(), loop).result(30)
+            except Exception as e:
+                logger.warning(f'关闭浏览器池失败: {e}')
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+            self.loop, self.thread = None, None
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': self.slots.qsize() if self.slots is not None else 0,
+            'browsers': [{'index': slot.index, 'running': slot.browser is not None, 'contexts': slot.contexts, 'launches': slot.launches} for slot in self.all_slots],
+            'fetches': self.fetches,
+            'failures': self.failures,
+            'recycles': self.recycles,
+            'fetch_avg': round(self.fetch_time / self.fetches, 3) if self.fetches else 0,
+        }
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """进程内共享的浏览器池"""
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool()
+        return _browser_pool
+
+
+def close_browser_pool():
+    global _browser_pool
+    with _browser_pool_lock:
+        pool, _browser_pool = _browser_pool, None
+    if pool is not None:
+        pool.close()
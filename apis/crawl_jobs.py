@@ -0,0 +1,345 @@
+# encoding: utf-8
+"""
+异步爬取任务：提交后在后台线程池中执行，进度与结果持久化到本地 SQLite，
+每爬完一页就把结果和断点（cursor / 进度）在同一个事务里落盘，进程重启后从断点继续
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from apis.xhs_pc_apis import XHS_Apis
+from xhs_utils.scheduler_util import upstream_context
+
+JOB_DB_PATH = os.getenv('XHS_JOB_DB', os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/jobs.db')))
+JOB_WORKERS = int(os.getenv('XHS_JOB_WORKERS', 2))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore():
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        """
+        任务持久化存储
+        :param db_path: sqlite 文件路径
+        """
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                checkpoint TEXT NOT NULL DEFAULT '{}',
+                msg TEXT NOT NULL DEFAULT '',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS job_results (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                item TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )''')
+            # 下载任务要处理的笔记链接只在开始时写一次，失败原因逐条补在对应行上，断点里只留进度
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS job_notes (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                msg TEXT,
+                PRIMARY KEY (job_id, seq)
+            )''')
+
+    def create(self, kind: str, params: dict):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute('INSERT INTO jobs (job_id, kind, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                              (job_id, kind, json.dumps(params, ensure_ascii=False), 'pending', now, now))
+        return job_id
+
+    def get(self, job_id: str):
+        with self.lock:
+            row = self.conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['checkpoint'] = json.loads(job['checkpoint'])
+        return job
+
+    def list(self, status: str = None, limit: int = 50):
+        sql, args = 'SELECT job_id FROM jobs', []
+        if status:
+            sql, args = sql + ' WHERE status = ?', [status]
+        with self.lock:
+            rows = self.conn.execute(sql + ' ORDER BY created_at DESC LIMIT ?', args + [limit]).fetchall()
+        return [self.get(row['job_id']) for row in rows]
+
+    def set_status(self, job_id: str, status: str, msg: str = ''):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE jobs SET status = ?, msg = ?, updated_at = ? WHERE job_id = ?', (status, msg, time.time(), job_id))
+
+    def save_page(self, job_id: str, items: list, checkpoint: dict, failures: list = ()):
+        """
+        把一页结果和新的断点在同一个事务里写入，保证重启后不重复也不丢
+        :param failures: 本次新增的失败笔记 [(序号, 失败原因)]，记在 job_notes 对应行上
+        """
+        with self.lock, self.conn:
+            progress = self.conn.execute('SELECT progress FROM jobs WHERE job_id = ?', (job_id,)).fetchone()['progress']
+            self.conn.executemany('INSERT OR REPLACE INTO job_results (job_id, seq, item) VALUES (?, ?, ?)',
+                                  [(job_id, progress + i, json.dumps(item, ensure_ascii=False)) for i, item in enumerate(items)])
+            self.conn.executemany('UPDATE job_notes SET msg = ? WHERE job_id = ? AND seq = ?', [(msg, job_id, seq) for seq, msg in failures])
+            self.conn.execute('UPDATE jobs SET progress = ?, checkpoint = ?, updated_at = ? WHERE job_id = ?',
+                              (progress + len(items), json.dumps(checkpoint, ensure_ascii=False), time.time(), job_id))
+
+    def save_notes(self, job_id: str, note_urls: list, checkpoint: dict):
+        """下载任务开始时写入全部笔记链接和初始断点"""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM job_notes WHERE job_id = ?', (job_id,))
+            self.conn.executemany('INSERT INTO job_notes (job_id, seq, url) VALUES (?, ?, ?)',
+                                  [(job_id, seq, note_url) for seq, note_url in enumerate(note_urls)])
+            self.conn.execute('UPDATE jobs SET checkpoint = ?, updated_at = ? WHERE job_id = ?',
+                              (json.dumps(checkpoint, ensure_ascii=False), time.time(), job_id))
+
+    def notes(self, job_id: str, offset: int = 0):
+        with self.lock:
+            rows = self.conn.execute('SELECT url FROM job_notes WHERE job_id = ? AND seq >= ? ORDER BY seq', (job_id, offset)).fetchall()
+        return [row['url'] for row in rows]
+
+    def failures(self, job_id: str):
+        with self.lock:
+            rows = self.conn.execute('SELECT url, msg FROM job_notes WHERE job_id = ? AND msg IS NOT NULL ORDER BY seq', (job_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 100):
+        with self.lock:
+            rows = self.conn.execute('SELECT item FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+                                     (job_id, offset, limit)).fetchall()
+        return [json.loads(row['item']) for row in rows]
+
+    def iter_results(self, job_id: str, batch: int = 500):
+        offset = 0
+        while True:
+            items = self.results(job_id, offset, batch)
+            if not items:
+                break
+            yield from items
+            offset += len(items)
+
+    def unfinished(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT job_id FROM jobs WHERE status IN ('pending', 'running') ORDER BY created_at").fetchall()
+        return [row['job_id'] for row in rows]
+
+
+class CrawlJobManager():
+    def __init__(self, store: JobStore = None, max_workers: int = JOB_WORKERS):
+        """
+        爬取任务管理器
+        :param store: 任务存储
+        :param max_workers: 同时执行的任务数
+        """
+        self.store = store or JobStore()
+        self.xhs_apis = XHS_Apis()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawl-job')
+        self.cancelled = set()
+        self.runners = {
+            'user_notes': self.run_user_notes,
+            'search_notes': self.run_search_notes,
+            'note_comments': self.run_note_comments,
+            'spider': self.run_spider,
+        }
+
+    def start(self):
+        """恢复上次进程退出时未完成的任务"""
+        job_ids = self.store.unfinished()
+        for job_id in job_ids:
+            self.executor.submit(self.run, job_id)
+        if job_ids:
+            logger.info(f'恢复 {len(job_ids)} 个未完成的爬取任务')
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind: str, params: dict):
+        if kind not in self.runners:
+            raise ValueError(f'未知的任务类型 {kind}')
+        job_id = self.store.create(kind, params)
+        self.executor.submit(self.run, job_id)
+        return job_id
+
+    def cancel(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job['status'] not in ('pending', 'running'):
+            return False
+        self.cancelled.add(job_id)
+        if job['status'] == 'pending':
+            self.store.set_status(job_id, 'cancelled', '已取消')
+        return True
+
+    def check_cancelled(self, job_id: str):
+        if job_id in self.cancelled:
+            raise JobCancelled()
+
+    def run(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job['status'] not in ('pending', 'running'):
+            self.cancelled.discard(job_id)
+            return
+        self.store.set_status(job_id, 'running')
+        logger.info(f'开始执行任务 {job_id} ({job["kind"]})，断点 {job["checkpoint"]}')
+        try:
+            # 后台任务走 bulk 通道，每个任务一个租户，不与交互请求争抢
+            with upstream_context('bulk', f'job:{job_id}'):
+                # 先预检 cookies，失效的不必开始翻页
+                success, msg, _ = self.xhs_apis.check_cookies(job['params']['cookies_str'], job['params'].get('proxies'))
+                if success:
+                    success, msg = self.runners[job['kind']](job)
+            self.store.set_status(job_id, 'succeeded' if success else 'failed', msg)
+        except JobCancelled:
+            self.store.set_status(job_id, 'cancelled', '已取消')
+        except Exception as e:
+            logger.exception(f'任务 {job_id} 执行异常')
+            self.store.set_status(job_id, 'failed', str(e))
+        finally:
+            self.cancelled.discard(job_id)
+        logger.info(f'任务 {job_id} 结束: {self.store.get(job_id)["status"]}')
+
+    def run_pages(self, job: dict, pages, cursor_key: str):
+        """消费 XHS_Apis.iter_* 分页生成器，每页落盘一次"""
+        success, msg = True, '成功'
+        try:
+            for success, msg, items, next_cursor in pages:
+                if not success:
+                    break
+                self.store.save_page(job['job_id'], items, {cursor_key: next_cursor})
+                self.check_cancelled(job['job_id'])
+        finally:
+            pages.close()
+        return success, msg
+
+    def run_user_notes(self, job: dict):
+        params = job['params']
+        cursor = job['checkpoint'].get('cursor', '')
+        pages = self.xhs_apis.iter_user_all_notes(params['user_url'], params['cookies_str'], params.get('proxies'), cursor)
+        return self.run_pages(job, pages, 'cursor')
+
+    def run_search_notes(self, job: dict):
+        params = job['params']
+        page = job['checkpoint'].get('page', 1)
+        remain = params['require_num'] - job['progress']
+        if remain <= 0:
+            return True, '成功'
+        pages = self.xhs_apis.iter_search_some_note(params['query'], remain, params['cookies_str'], params.get('sort_type_choice', 0),
+                                                    params.get('note_type', 0), params.get('note_time', 0), params.get('note_range', 0),
+                                                    params.get('pos_distance', 0), params.get('geo'), params.get('proxies'), page)
+        return self.run_pages(job, pages, 'page')
+
+    def run_note_comments(self, job: dict):
+        params = job['params']
+        cursor = job['checkpoint'].get('cursor', '')
+        pages = self.xhs_apis.iter_note_all_comment(params['url'], params['cookies_str'], params.get('proxies'), cursor)
+        success, msg = self.run_pages(job, pages, 'cursor')
+        if success and params.get('save_choice'):
+            self.export_comments(job)
+        return success, msg
+
+    def export_comments(self, job: dict):
+        """评论任务完成后从全部任务结果统一导出，parquet 按笔记 id 分区"""
+        from xhs_utils.common_util import init
+        from xhs_utils.data_util import comment_records, save_to_xlsx
+        params = job['params']
+        _, base_path = init()
+        comments = comment_records(params['url'], self.store.iter_results(job['job_id']))
+        if params['save_choice'] == 'excel':
+            save_to_xlsx(comments, os.path.abspath(os.path.join(base_path['excel'], f"{params.get('excel_name') or job['job_id']}.xlsx")), 'comment')
+        elif params['save_choice'] == 'parquet':
+            from xhs_utils.parquet_util import save_comments_to_parquet
+            save_comments_to_parquet(comments, os.path.abspath(os.path.join(base_path['parquet'], 'comments')))
+        elif params['save_choice'] == 'sqlite':
+            from xhs_utils.sqlite_store_util import get_xhs_store
+            store = get_xhs_store()
+            store.add_many('comment', comments)
+            store.flush()
+
+    def run_spider(self, job: dict):
+        """
+        Data_Spider 式的下载任务：先收集笔记链接写入断点，再交给 Data_Spider 的流水线并发爬取详情并下载，
+        每个笔记处理完（含失败）就按顺序推进断点，结果为处理后的笔记信息；笔记链接在开始时写入 job_notes 一次，
+        失败原因补在对应行上，断点里只有 {total, index, failed}，每个笔记落盘的数据量与笔记总数无关
+        """
+        from apis.data_spider import Data_Spider
+        from xhs_utils.common_util import init
+        from xhs_utils.data_util import save_to_xlsx
+        params = job['params']
+        checkpoint = job['checkpoint']
+        cookies_str, proxies, save_choice = params['cookies_str'], params.get('proxies'), params['save_choice']
+        data_spider = Data_Spider()
+        if 'total' not in checkpoint:
+            if params.get('user_url'):
+                success, msg, notes = data_spider.xhs_apis.get_user_all_notes(params['user_url'], cookies_str, proxies)
+                note_urls = [f"https://www.xiaohongshu.com/explore/{note['note_id']}?xsec_token={note['xsec_token']}" for note in notes]
+            elif params.get('query'):
+                success, msg, notes = data_spider.xhs_apis.search_some_note(params['query'], params.get('require_num', 20), cookies_str, proxies=proxies)
+                notes = [note for note in notes if note['model_type'] == 'note']
+                note_urls = [f"https://www.xiaohongshu.com/explore/{note['id']}?xsec_token={note['xsec_token']}" for note in notes]
+            else:
+                success, msg, note_urls = True, '成功', params.get('notes', [])
+            if not success:
+                return success, msg
+            checkpoint = {'total': len(note_urls), 'index': 0, 'failed': 0}
+            self.store.save_notes(job['job_id'], note_urls, checkpoint)
+        _, base_path = init()
+
+        def remaining():
+            for note_url in self.store.notes(job['job_id'], checkpoint['index']):
+                # 取消后不再送入新的笔记，已在流水线里的处理完再退出
+                if job['job_id'] in self.cancelled:
+                    return
+                yield note_url
+
+        def on_complete(note_url, note_info, error):
+            # 最后一个阶段按输入顺序回调，当前序号就是断点位置
+            failures = [] if note_info is not None else [(checkpoint['index'], error or '未知错误')]
+            checkpoint['index'] += 1
+            checkpoint['failed'] += len(failures)
+            self.store.save_page(job['job_id'], [note_info] if note_info is not None else [], checkpoint, failures)
+
+        # excel / parquet 在最后从全部任务结果统一导出，断点续跑前后的笔记都在同一个文件里
+        data_spider.run_note_pipeline(remaining(), cookies_str, base_path, save_choice, proxies=proxies, export=False, on_complete=on_complete)
+        self.check_cancelled(job['job_id'])
+        if save_choice == 'all' or save_choice == 'excel':
+            file_path = os.path.abspath(os.path.join(base_path['excel'], f"{params.get('excel_name') or job['job_id']}.xlsx"))
+            save_to_xlsx(self.store.iter_results(job['job_id']), file_path)
+        elif save_choice == 'parquet':
+            from xhs_utils.parquet_util import save_to_parquet
+            file_path = os.path.abspath(os.path.join(base_path['parquet'], f"{params.get('excel_name') or job['job_id']}.parquet"))
+            save_to_parquet(self.store.iter_results(job['job_id']), file_path)
+        if checkpoint['failed']:
+            return False, f"{checkpoint['failed']}/{checkpoint['total']} 个笔记处理失败"
+        return True, '成功'
+
+    def public_job(self, job: dict):
+        """对外展示任务时去掉 cookies 等敏感参数和庞大的断点内容"""
+        if job is None:
+            return None
+        job = dict(job)
+        job['params'] = {k: v for k, v in job['params'].items() if k not in ('cookies_str', 'proxies')}
+        checkpoint = job.pop('checkpoint')
+        if job['kind'] == 'spider' and 'total' in checkpoint:
+            job['total'] = checkpoint['total']
+            job['done'] = checkpoint['index']
+            job['failures'] = self.store.failures(job['job_id'])
+        return job
@@ -0,0 +1,307 @@
+import os
+import time
+from loguru import logger
+from apis.xhs_pc_apis import XHS_Apis
+from xhs_utils.archive_util import get_note_archive
+from xhs_utils.data_util import handle_note_info, handle_user_info, comment_records, download_note, archive_note
+from xhs_utils.excel_util import StreamingXlsxWriter
+from xhs_utils.jsonl_util import JsonlSink
+from xhs_utils.parquet_util import ParquetExporter, PartitionedParquetExporter
+from xhs_utils.pipeline_util import Pipeline, Stage
+from xhs_utils.scheduler_util import upstream_context
+from xhs_utils.sqlite_store_util import get_xhs_store
+
+
+SPIDER_WORKERS = int(os.getenv('XHS_SPIDER_WORKERS', 4))
+SPIDER_DOWNLOAD_WORKERS = int(os.getenv('XHS_SPIDER_DOWNLOAD_WORKERS', 4))
+# 需要输出文件名（excel_name）的 save_choice
+NAMED_SAVE_CHOICES = ('all', 'excel', 'parquet')
+# 评论和用户信息只导出记录，不下载媒体
+RECORD_SAVE_CHOICES = ('excel', 'parquet', 'sqlite')
+
+
+class Data_Spider():
+    def __init__(self, max_workers: int = SPIDER_WORKERS, download_workers: int = SPIDER_DOWNLOAD_WORKERS, raw_sink: JsonlSink = None):
+        """
+        :param max_workers: 并发获取笔记详情的线程数，实际发往上游的并发仍受上游调度器限制
+        :param download_workers: 并发下载媒体的线程数
+        :param raw_sink: 传入后每个笔记整理前的原始数据都追加到这个 JSONL 归档
+        """
+        self.xhs_apis = XHS_Apis()
+        self.max_workers = max_workers
+        self.download_workers = download_workers
+        self.raw_sink = raw_sink
+        self.last_pipeline_stats = None
+        self.last_failures = []
+
+    def fetch_note(self, note_url: str, cookies_str: str, proxies=None):
+        """获取一个笔记的原始信息，失败时抛出异常"""
+        success, msg, note_info = self.xhs_apis.get_note_info(note_url, cookies_str, proxies)
+        if not success:
+            raise Exception(msg)
+        note_info = note_info['data']['items'][0]
+        note_info['url'] = note_url
+        if self.raw_sink is not None:
+            self.raw_sink.write({'ts': time.time(), 'kind': 'note', 'url': note_url, 'data': note_info})
+        return note_info
+
+    def spider_note(self, note_url: str, cookies_str: str, proxies=None):
+        """
+        爬取一个笔记的信息
+        :param note_url:
+        :param cookies_str:
+        :return:
+        """
+        note_info = None
+        try:
+            note_info = handle_note_info(self.fetch_note(note_url, cookies_str, proxies))
+            success, msg = True, '成功'
+        except Exception as e:
+            success = False
+            msg = e
+        logger.info(f'爬取笔记信息 {note_url}: {success}, msg: {msg}')
+        return success, msg, note_info
+
+    def run_note_pipeline(self, note_urls, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None, collect: bool = False, export: bool = True, on_complete=None):
+        """
+        笔记流水线：获取详情 → 整理字段 → 下载媒体 → 按输入顺序落盘，阶段之间用有界队列连接，
+        上游边翻页边产出笔记链接时，前面的笔记已经在下载了
+        :param note_urls: 笔记链接的可迭代对象
+        :param collect: 是否在内存里收集处理后的笔记并返回；大量爬取时不要开启，内存占用会随笔记数增长
+        :param export: 是否在落盘阶段写 excel / parquet，由调用方自己统一导出时传 False
+        :param on_complete: 每个笔记处理完（含失败）后按输入顺序调用 on_complete(笔记链接, 笔记信息, 失败原因)，失败时笔记信息为 None
+        :return: (成功的笔记列表，collect 为 False 时为空列表, 失败的笔记 [{url, stage, msg}])
+        """
+        note_list = []
+        archive = get_note_archive(base_path['archive']) if save_choice.startswith('archive') else None
+        writer = None
+        store = get_xhs_store() if save_choice == 'sqlite' else None
+        # 落盘阶段按顺序边处理边写入 excel / parquet，不在最后一次性生成
+        if export and (save_choice == 'all' or save_choice == 'excel'):
+            writer = StreamingXlsxWriter(os.path.abspath(os.path.join(base_path['excel'], f'{excel_name}.xlsx')))
+        elif export and save_choice == 'parquet':
+            writer = ParquetExporter(os.path.abspath(os.path.join(base_path['parquet'], f'{excel_name}.parquet')))
+
+        def fetch(note_url):
+            note_info = self.fetch_note(note_url, cookies_str, proxies)
+            logger.info(f'爬取笔记信息 {note_url}: True')
+            return note_info
+
+        def download(note_info):
+            if archive is not None:
+                archive_note(note_info, archive, save_choice)
+            else:
+                download_note(note_info, base_path['media'], save_choice)
+            return note_info
+
+        def persist(note_info):
+            if collect:
+                note_list.append(note_info)
+            if writer is not None:
+                writer.append(note_info)
+            if store is not None:
+                store.add('note', note_info)
+            return note_info
+
+        stages = [Stage('fetch', fetch, self.max_workers), Stage('normalize', handle_note_info)]
+        if save_choice == 'all' or 'media' in save_choice or archive is not None:
+            stages.append(Stage('download', download, self.download_workers))
+        stages.append(Stage('persist', persist, ordered=True))
+        # 批量爬取走 bulk 通道
+        with upstream_context('bulk'):
+            try:
+                failures, self.last_pipeline_stats = Pipeline(stages, on_complete=on_complete).run(note_urls)
+            finally:
+                if archive is not None:
+                    archive.close()
+                if writer is not None:
+                    writer.close()
+                if store is not None:
+                    store.flush()
+        failures = [{'url': failure['item'], 'stage': failure['stage'], 'msg': failure['msg']} for failure in failures]
+        if failures:
+            logger.warning(f'{len(failures)} 个笔记处理失败: {[failure["url"] for failure in failures]}')
+        self.last_failures = failures
+        return note_list, failures
+
+    @staticmethod
+    def pipeline_result(state: dict, failures: list):
+        """翻页和逐条处理的结果合并：翻页失败或有笔记处理失败都算失败"""
+        if not state['success']:
+            return False, state['msg']
+        if failures:
+            return False, f'{len(failures)}/{state["count"]} 个笔记处理失败'
+        return True, state['msg']
+
+    def spider_some_note(self, notes: list, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None):
+        """
+        爬取一些笔记的信息
+        :param notes:
+        :param cookies_str:
+        :param base_path:
+        :return: (成功的笔记列表, 失败的笔记 [{url, stage, msg}])
+        """
+        if save_choice in NAMED_SAVE_CHOICES and excel_name == '':
+            raise ValueError('excel_name 不能为空')
+        return self.run_note_pipeline(notes, cookies_str, base_path, save_choice, excel_name, proxies, collect=True)
+
+    def spider_user_all_note(self, user_url: str, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None, collect: bool = False):
+        """
+        爬取一个用户的所有笔记
+        :param user_url:
+        :param cookies_str:
+        :param base_path:
+        :param collect: 是否收集并返回全部笔记链接
+        :return: (笔记链接列表，collect 为 False 时为空列表, success, msg)；有笔记处理失败时 success 为 False，明细见 last_failures
+        """
+        note_list = []
+        state = {'success': True, 'msg': '成功', 'count': 0}
+
+        def note_urls():
+            for success, msg, notes, _ in self.xhs_apis.iter_user_all_notes(user_url, cookies_str, proxies):
+                state['success'], state['msg'] = success, msg
+                for simple_note_info in notes:
+                    note_url = f"https://www.xiaohongshu.com/explore/{simple_note_info['note_id']}?xsec_token={simple_note_info['xsec_token']}"
+                    state['count'] += 1
+                    if collect:
+                        note_list.append(note_url)
+                    yield note_url
+
+        try:
+            if save_choice in NAMED_SAVE_CHOICES:
+                excel_name = user_url.split('/')[-1].split('?')[0]
+            _, failures = self.run_note_pipeline(note_urls(), cookies_str, base_path, save_choice, excel_name, proxies)
+            success, msg = self.pipeline_result(state, failures)
+            logger.info(f'用户 {user_url} 作品数量: {state["count"]}')
+        except Exception as e:
+            success = False
+            msg = e
+        logger.info(f'爬取用户所有视频 {user_url}: {success}, msg: {msg}')
+        return note_list, success, msg
+
+    def spider_some_search_note(self, query: str, require_num: int, cookies_str: str, base_path: dict, save_choice: str, sort_type_choice=0, note_type=0, note_time=0, note_range=0, pos_distance=0, geo: dict = None,  excel_name: str = '', proxies=None, collect: bool = False):
+        """
+            指定数量搜索笔记，设置排序方式和笔记类型和笔记数量
+            :param query 搜索的关键词
+            :param require_num 搜索的数量
+            :param cookies_str 你的cookies
+            :param base_path 保存路径
+            :param sort_type_choice 排序方式 0 综合排序, 1 最新, 2 最多点赞, 3 最多评论, 4 最多收藏
+            :param note_type 笔记类型 0 不限, 1 视频笔记, 2 普通笔记
+            :param note_time 笔记时间 0 不限, 1 一天内, 2 一周内天, 3 半年内
+            :param note_range 笔记范围 0 不限, 1 已看过, 2 未看过, 3 已关注
+            :param pos_distance 位置距离 0 不限, 1 同城, 2 附近 指定这个必须要指定 geo
+            :param collect 是否收集并返回全部笔记链接
+            返回 (笔记链接列表，collect 为 False 时为空列表, success, msg)；有笔记处理失败时 success 为 False，明细见 last_failures
+        """
+        note_list = []
+        state = {'success': True, 'msg': '成功', 'count': 0}
+
+        def note_urls():
+            pages = self.xhs_apis.iter_search_some_note(query, require_num, cookies_str, sort_type_choice, note_type, note_time, note_range, pos_distance, geo, proxies)
+            for success, msg, notes, _ in pages:
+                state['success'], state['msg'] = success, msg
+                for note in filter(lambda x: x['model_type'] == "note", notes):
+                    note_url = f"https://www.xiaohongshu.com/explore/{note['id']}?xsec_token={note['xsec_token']}"
+                    state['count'] += 1
+                    if collect:
+                        note_list.append(note_url)
+                    yield note_url
+
+        try:
+            if save_choice in NAMED_SAVE_CHOICES:
+                excel_name = query
+            _, failures = self.run_note_pipeline(note_urls(), cookies_str, base_path, save_choice, excel_name, proxies)
+            success, msg = self.pipeline_result(state, failures)
+            logger.info(f'搜索关键词 {query} 笔记数量: {state["count"]}')
+        except Exception as e:
+            success = False
+            msg = e
+        logger.info(f'搜索关键词 {query} 笔记: {success}, msg: {msg}')
+        return note_list, success, msg
+
+    def spider_note_comments(self, note_url: str, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None):
+        """
+        爬取一个笔记的全部评论（含已展开的二级评论），边翻页边写入，不在内存里收集
+        :param note_url: 笔记链接，含 xsec_token
+        :param save_choice: excel: 保存到 excel, parquet: 按笔记 id 分区保存到 datas/parquet_datas/comments, sqlite: 写入本地库
+        :param excel_name: excel 文件名，默认为笔记 id
+        :return: (评论条数, success, msg)
+        """
+        if save_choice not in RECORD_SAVE_CHOICES:
+            raise ValueError(f'评论不支持 save_choice {save_choice}')
+        note_id = note_url.split('/')[-1].split('?')[0]
+        writer = None
+        store = get_xhs_store() if save_choice == 'sqlite' else None
+        if save_choice == 'excel':
+            writer = StreamingXlsxWriter(os.path.abspath(os.path.join(base_path['excel'], f'{excel_name or note_id}.xlsx')), 'comment')
+        elif save_choice == 'parquet':
+            writer = PartitionedParquetExporter(os.path.abspath(os.path.join(base_path['parquet'], 'comments')), 'comment')
+        count = 0
+        success, msg = True, '成功'
+        try:
+            with upstream_context('bulk'):
+                for success, msg, comments, _ in self.xhs_apis.iter_note_all_comment(note_url, cookies_str, proxies):
+                    # 翻页失败时已取到的评论也一起写入
+                    for comment in comment_records(note_url, comments):
+                        if writer is not None:
+                            writer.append(comment)
+                        else:
+                            store.add('comment', comment)
+                        count += 1
+                    if not success:
+                        break
+        except Exception as e:
+            success = False
+            msg = e
+        finally:
+            if writer is not None:
+                writer.close()
+            if store is not None:
+                store.flush()
+        logger.info(f'爬取笔记评论 {note_url}: {success}, 评论数量: {count}, msg: {msg}')
+        return count, success, msg
+
+    def spider_some_user(self, user_urls: list, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None):
+        """
+        爬取一些用户的信息
+        :param user_urls: 用户主页链接或用户 id
+        :param save_choice: excel / parquet: 保存到 {excel_name}.xlsx / {excel_name}.parquet, sqlite: 写入本地库
+        :return: (成功的用户列表, 失败的用户 [{url, msg}])
+        """
+        if save_choice not in RECORD_SAVE_CHOICES:
+            raise ValueError(f'用户信息不支持 save_choice {save_choice}')
+        if save_choice in NAMED_SAVE_CHOICES and excel_name == '':
+            raise ValueError('excel_name 不能为空')
+        user_list, failures = [], []
+        writer = None
+        store = get_xhs_store() if save_choice == 'sqlite' else None
+        if save_choice == 'excel':
+            writer = StreamingXlsxWriter(os.path.abspath(os.path.join(base_path['excel'], f'{excel_name}.xlsx')), 'user')
+        elif save_choice == 'parquet':
+            writer = ParquetExporter(os.path.abspath(os.path.join(base_path['parquet'], f'{excel_name}.parquet')), 'user')
+        try:
+            with upstream_context('bulk'):
+                for user_url in user_urls:
+                    user_id = user_url.split('/')[-1].split('?')[0]
+                    try:
+                        success, msg, res_json = self.xhs_apis.get_user_info(user_id, cookies_str, proxies)
+                        if not success:
+                            raise Exception(msg)
+                        user_info = handle_user_info(res_json['data'], user_id)
+                    except Exception as e:
+                        logger.warning(f'爬取用户信息 {user_url} 失败: {e}')
+                        failures.append({'url': user_url, 'msg': str(e)})
+                        continue
+                    user_list.append(user_info)
+                    if writer is not None:
+                        writer.append(user_info)
+                    else:
+                        store.add('user', user_info)
+        finally:
+            if writer is not None:
+                writer.close()
+            if store is not None:
+                store.flush()
+        logger.info(f'爬取用户信息: 成功 {len(user_list)} 个, 失败 {len(failures)} 个')
+        return user_list, failures
@@ -0,0 +1,371 @@
+# encoding: utf-8
+"""
+游客 cookies 管理：后台提前刷新、过期后先返回旧值再异步刷新、同一时间只跑一次刷新、
+最近一次成功的 cookies 落盘以便重启后直接使用
+"""
+
+import json
+import os
+import threading
+import time
+from loguru import logger
+from xhs_utils.cookie_util import register_cookie_alias, trans_cookies, mask_a1
+
+GUEST_COOKIE_TTL = int(os.getenv('XHS_GUEST_COOKIE_TTL', 300))
+# 距离过期还剩多少秒时开始后台刷新
+GUEST_COOKIE_REFRESH_AHEAD = int(os.getenv('XHS_GUEST_COOKIE_REFRESH_AHEAD', 60))
+# 过期后最多还能作为旧值返回多少秒，超过则必须同步等待刷新
+GUEST_COOKIE_MAX_STALE = int(os.getenv('XHS_GUEST_COOKIE_MAX_STALE', 3600))
+GUEST_COOKIE_FILE = os.getenv('XHS_GUEST_COOKIE_FILE', os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/guest_cookies.json')))
+# 使用浏览器池的快速模式获取（拦截静态资源，关键 cookies 出现即返回）
+GUEST_COOKIE_FAST = os.getenv('XHS_GUEST_COOKIE_FAST', '1') == '1'
+GUEST_COOKIE_RETRY_MIN = 30
+GUEST_COOKIE_RETRY_MAX = 300
+
+
+def fetch_guest_cookies():
+    """用常驻浏览器池打开首页获取一份游客 cookies，返回 (success, msg, cookies_str)"""
+    from apis.browser_pool import get_browser_pool
+    success, cookies_str, _ = get_browser_pool().get_guest_cookies(fast=GUEST_COOKIE_FAST)
+    if not success or not cookies_str:
+        return False, '获取游客cookies失败', ''
+    return True, '成功', cookies_str
+
+
+class GuestCookieManager():
+    def __init__(self, fetcher=fetch_guest_cookies, ttl: int = GUEST_COOKIE_TTL, refresh_ahead: int = GUEST_COOKIE_REFRESH_AHEAD,
+                 max_stale: int = GUEST_COOKIE_MAX_STALE, file_path: str = GUEST_COOKIE_FILE):
+        """
+        :param fetcher: 获取 cookies 的函数，返回 (success, msg, cookies_str)
+        :param ttl: cookies 有效期（秒）
+        :param refresh_ahead: 提前刷新的秒数
+        :param max_stale: 过期后仍可返回旧值的秒数
+        :param file_path: 落盘路径，为空则不落盘
+        """
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_stale = max_stale
+        self.file_path = file_path
+        self.cond = threading.Condition()
+        self.value = ''
+        self.fetched_at = 0
+        self.expires_at = 0
+        self.refreshing = False
+        self.last_result = (False, '尚未获取游客cookies', '')
+        self.failures = 0
+        self.retry_at = 0
+        self.refresh_count = 0
+        self.stale_served = 0
+        self.thread = None
+        self.stopped = threading.Event()
+        self.load()
+
+    def load(self):
+        if not self.file_path or not os.path.exists(self.file_path):
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.value, self.fetched_at, self.expires_at = saved['cookies_str'], saved['fetched_at'], saved['expires_at']
+            logger.info(f'从 {self.file_path} 恢复游客cookies，{"仍有效" if self.expires_at > time.time() else "已过期，将后台刷新"}')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f'读取游客cookies文件失败: {e}')
+
+    def save(self):
+        if not self.file_path:
+            return
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'cookies_str': self.value, 'fetched_at': self.fetched_at, 'expires_at': self.expires_at}, f, ensure_ascii=False)
+        os.replace(temp_path, self.file_path)
+
+    def refresh(self):
+        """
+        同步刷新；已有刷新在进行时不再重复启动浏览器，而是等它结束并共享结果
+        返回 (success, msg, cookies_str)
+        """
+        with self.cond:
+            if self.refreshing:
+                while self.refreshing:
+                    self.cond.wait()
+                return self.last_result
+            self.refreshing = True
+        result = (False, '获取游客cookies失败', '')
+        try:
+            result = self.fetcher()
+        except Exception as e:
+            result = (False, f'获取游客cookies异常: {e}', '')
+        finally:
+            with self.cond:
+                success, msg, cookies_str = result
+                now = time.time()
+                self.refresh_count += 1
+                if success:
+                    self.value, self.fetched_at, self.expires_at = cookies_str, now, now + self.ttl
+                    self.failures = 0
+                    self.retry_at = 0
+                else:
+                    # 失败不覆盖已有的 cookies，按指数退避安排下次后台重试
+                    self.failures += 1
+                    self.retry_at = now + min(GUEST_COOKIE_RETRY_MIN * 2 ** (self.failures - 1), GUEST_COOKIE_RETRY_MAX)
+                    logger.warning(f'游客cookies刷新失败（连续 {self.failures} 次）: {msg}')
+                self.last_result = result
+                self.refreshing = False
+                self.cond.notify_all()
+        if result[0]:
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning(f'保存游客cookies失败: {e}')
+        return result
+
+    def refresh_in_background(self):
+        with self.cond:
+            if self.refreshing or time.time() < self.retry_at:
+                return
+        threading.Thread(target=self.refresh, name='guest-cookie-refresh', daemon=True).start()
+
+    def get(self):
+        """
+        取游客 cookies，返回 (success, msg, cookies_str)
+        未过期直接返回（临近过期时顺带触发后台刷新）；过期不久先返回旧值再后台刷新；没有可用值时同步刷新
+        """
+        now = time.time()
+        with self.cond:
+            value, expires_at = self.value, self.expires_at
+        if value and now < expires_at:
+            if now >= expires_at - self.refresh_ahead:
+                self.refresh_in_background()
+            return True, '成功', value
+        if value and now < expires_at + self.max_stale:
+            self.stale_served += 1
+            self.refresh_in_background()
+            return True, '成功（cookies 已过期，后台刷新中）', value
+        return self.refresh()
+
+    def start(self):
+        """启动后台线程，在过期前 refresh_ahead 秒主动刷新"""
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='guest-cookie-refresher', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.thread = None
+        if self.fetcher is fetch_guest_cookies:
+            from apis.browser_pool import close_browser_pool
+            close_browser_pool()
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.cond:
+                due = max(self.expires_at - self.refresh_ahead, self.retry_at)
+            delay = due - time.time()
+            if delay > 0:
+                self.stopped.wait(min(delay, 60))
+                continue
+            self.refresh()
+
+    def stats(self):
+        now = time.time()
+        with self.cond:
+            return {
+                'has_value': bool(self.value),
+                'age': round(now - self.fetched_at, 1) if self.value else None,
+                'expires_in': round(self.expires_at - now, 1) if self.value else None,
+                'refreshing': self.refreshing,
+                'refresh_count': self.refresh_count,
+                'failures': self.failures,
+                'stale_served': self.stale_served,
+            }
+
+
+GUEST_POOL_SIZE = int(os.getenv('XHS_GUEST_POOL_SIZE', 3))
+# 单个游客身份最多发多少次请求后退役
+GUEST_IDENTITY_MAX_REQUESTS = int(os.getenv('XHS_GUEST_IDENTITY_MAX_REQUESTS', 500))
+# 连续收到几次限流信号后退役
+GUEST_IDENTITY_MAX_STRIKES = int(os.getenv('XHS_GUEST_IDENTITY_MAX_STRIKES', 2))
+# 单个游客身份最长使用多少秒，与游客 cookies 的有效期加上允许的过期时长一致
+GUEST_IDENTITY_MAX_AGE = int(os.getenv('XHS_GUEST_IDENTITY_MAX_AGE', GUEST_COOKIE_TTL + GUEST_COOKIE_MAX_STALE))
+# 用量或使用时长达到上限的这个比例时提前补充新身份，保证退役前替补已就位
+GUEST_IDENTITY_REPLACE_AT = 0.8
+# 池为空时请求线程最多等待后台补充多少秒，超时直接报错，不长时间占着准入名额
+GUEST_IDENTITY_CHECKOUT_TIMEOUT = float(os.getenv('XHS_GUEST_IDENTITY_CHECKOUT_TIMEOUT', 5))
+GUEST_COOKIES_ALIAS = 'guest'
+# 视为限流/风控的 HTTP 状态码和业务 code
+THROTTLE_STATUS_CODES = {429, 461, 471}
+THROTTLE_RESPONSE_CODES = {300012, 300013, 300015}
+
+
+class GuestPoolEmptyError(Exception):
+    pass
+
+
+class GuestIdentity():
+    def __init__(self, cookies_str: str, a1: str):
+        self.cookies_str = cookies_str
+        self.a1 = a1
+        self.created_at = time.time()
+        self.requests = 0
+        self.strikes = 0
+        self.throttled = 0
+        self.retired = False
+
+
+class GuestIdentityPool():
+    def __init__(self, size: int = GUEST_POOL_SIZE, max_requests: int = GUEST_IDENTITY_MAX_REQUESTS,
+                 max_strikes: int = GUEST_IDENTITY_MAX_STRIKES, max_age: int = GUEST_IDENTITY_MAX_AGE, fetcher=fetch_guest_cookies):
+        """
+        游客身份池：后台各自独立获取 size 份游客 cookies，匿名请求轮流使用，
+        单个身份达到请求次数上限、使用时长上限或连续被限流后退役，退役前由后台补上新身份
+        :param size: 保持可用的身份数
+        :param max_requests: 单个身份的请求次数上限
+        :param max_strikes: 连续限流几次后退役
+        :param max_age: 身份入池多少秒后退役
+        :param fetcher: 获取 cookies 的函数，返回 (success, msg, cookies_str)
+        """
+        self.size = size
+        self.max_requests = max_requests
+        self.max_strikes = max_strikes
+        self.max_age = max_age
+        self.fetcher = fetcher
+        self.cond = threading.Condition()
+        self.identities = []
+        self.by_a1 = {}
+        self.next_index = 0
+        self.acquired = 0
+        self.retired = 0
+        self.fetch_failures = 0
+        self.thread = None
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+
+    def healthy_count(self):
+        """还不需要替补的身份数"""
+        now = time.time()
+        return sum(1 for identity in self.identities if identity.requests < self.max_requests * GUEST_IDENTITY_REPLACE_AT and identity.strikes == 0
+                   and now - identity.created_at < self.max_age * GUEST_IDENTITY_REPLACE_AT)
+
+    def retire_expired_locked(self):
+        now = time.time()
+        for identity in [identity for identity in self.identities if now - identity.created_at >= self.max_age]:
+            self.retire_locked(identity, f'已使用 {now - identity.created_at:.0f} 秒')
+
+    def acquire_one(self):
+        success, msg, cookies_str = self.fetcher()
+        a1 = trans_cookies(cookies_str).get('a1') if success else None
+        if not a1:
+            self.fetch_failures += 1
+            logger.warning(f'游客身份获取失败: {msg if not success else "缺少 a1"}')
+            return False
+        with self.cond:
+            if a1 not in self.by_a1:
+                identity = GuestIdentity(cookies_str, a1)
+                self.identities.append(identity)
+                self.by_a1[a1] = identity
+                self.acquired += 1
+                logger.info(f'游客身份入池 {mask_a1(a1)}，当前 {len(self.identities)} 个')
+            self.cond.notify_all()
+        return True
+
+    def checkout(self):
+        """轮流取一个身份的 cookies 字符串；池为空时最多等待 GUEST_IDENTITY_CHECKOUT_TIMEOUT 秒让后台补充，仍为空时抛出 GuestPoolEmptyError"""
+        with self.cond:
+            self.retire_expired_locked()
+            if not self.identities:
+                self.wakeup.set()
+                self.cond.wait_for(lambda: self.identities or self.stopped.is_set(), timeout=GUEST_IDENTITY_CHECKOUT_TIMEOUT)
+            if not self.identities:
+                raise GuestPoolEmptyError(f'游客身份池为空，{GUEST_IDENTITY_CHECKOUT_TIMEOUT:.0f} 秒内未补充到新身份，请稍后重试')
+            self.next_index %= len(self.identities)
+            identity = self.identities[self.next_index]
+            self.next_index += 1
+            identity.requests += 1
+            if identity.requests >= self.max_requests:
+                self.retire_locked(identity, f'已发出 {identity.requests} 次请求')
+            elif identity.requests >= self.max_requests * GUEST_IDENTITY_REPLACE_AT:
+                self.wakeup.set()
+            return identity.cookies_str
+
+    def retire_locked(self, identity: GuestIdentity, reason: str):
+        if identity.retired:
+            return
+        identity.retired = True
+        self.identities.remove(identity)
+        self.by_a1.pop(identity.a1, None)
+        self.retired += 1
+        logger.info(f'游客身份退役 {mask_a1(identity.a1)}: {reason}')
+        self.wakeup.set()
+
+    def report(self, cookies: dict, response):
+        """响应钩子：按状态码和业务 code 识别限流，连续限流的身份退役"""
+        a1 = cookies.get('a1') if cookies else None
+        identity = self.by_a1.get(a1)
+        if identity is None:
+            return
+        throttled = response.status_code in THROTTLE_STATUS_CODES
+        if not throttled and response.status_code == 200:
+            try:
+                throttled = response.json().get('code') in THROTTLE_RESPONSE_CODES
+            except ValueError:
+                pass
+        with self.cond:
+            if throttled:
+                identity.strikes += 1
+                identity.throttled += 1
+                if identity.strikes >= self.max_strikes:
+                    self.retire_locked(identity, f'连续 {identity.strikes} 次被限流')
+                else:
+                    self.wakeup.set()
+            else:
+                identity.strikes = 0
+
+    def start(self):
+        """注册 guest 别名和响应钩子，启动后台补充线程"""
+        from apis.xhs_pc_apis import XHS_Apis
+        if self.thread is not None or self.size <= 0:
+            return
+        register_cookie_alias(GUEST_COOKIES_ALIAS, self.checkout)
+        XHS_Apis.add_response_hook(self.report)
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='guest-identity-pool', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread = None
+        with self.cond:
+            self.cond.notify_all()
+
+    def run(self):
+        failures = 0
+        while not self.stopped.is_set():
+            with self.cond:
+                self.retire_expired_locked()
+                need = self.healthy_count() < self.size
+            if not need:
+                self.wakeup.wait(60)
+                self.wakeup.clear()
+                continue
+            if self.acquire_one():
+                failures = 0
+            else:
+                failures += 1
+                self.stopped.wait(min(GUEST_COOKIE_RETRY_MIN * 2 ** (failures - 1), GUEST_COOKIE_RETRY_MAX))
+
+    def stats(self):
+        with self.cond:
+            return {
+                'size': self.size,
+                'active': len(self.identities),
+                'acquired': self.acquired,
+                'retired': self.retired,
+                'fetch_failures': self.fetch_failures,
+                'identities': [{'a1': mask_a1(identity.a1), 'requests': identity.requests, 'strikes': identity.strikes,
+                                'throttled': identity.throttled, 'age': round(time.time() - identity.created_at, 1)} for identity in self.identities],
+            }
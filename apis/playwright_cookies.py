@@ -7,6 +7,7 @@ import json
 import time
 from playwright.sync_api import sync_playwright
 from loguru import logger
+from apis.browser_pool import FAST_BLOCKED_RESOURCES, FAST_REQUIRED_COOKIES, FAST_DEADLINE, FAST_POLL_INTERVAL
 
 class XHSCookieGetter:
     def __init__(self, headless: bool = True, timeout: int = 30000):
@@ -18,11 +19,12 @@ class XHSCookieGetter:
         self.headless = headless
         self.timeout = timeout
         
-    def get_guest_cookies(self, wait_time: int = 3, retry_count: int = 3):
+    def get_guest_cookies(self, wait_time: int = 3, retry_count: int = 3, fast: bool = False):
         """
         获取小红书游客cookies
         :param wait_time: 等待页面加载时间(秒)
         :param retry_count: 重试次数
+        :param fast: 快速模式，拦截图片/视频/字体/样式，关键 cookies 一出现就返回，不做固定等待
         :return: (success, cookies_str, cookies_dict)
         """
         for attempt in range(retry_count):
@@ -58,25 +60,37 @@ class XHSCookieGetter:
                     
                     logger.info("🌐 正在访问小红书首页...")
                     
-                    # 访问小红书首页
-                    response = page.goto('https://www.xiaohongshu.com', wait_until='networkidle')
-                    
-                    if response.status != 200:
-                        logger.warning(f"⚠️  页面响应状态码: {response.status}")
-                    
-                    # 等待页面完全加载
-                    logger.info(f"⏳ 等待页面加载 {wait_time} 秒...")
-                    time.sleep(wait_time)
-                    
-                    # 尝试等待一些关键元素加载
-                    try:
-                        page.wait_for_selector('body', timeout=10000)
-                        logger.info("✅ 页面基本元素已加载")
-                    except:
-                        logger.warning("⚠️  未检测到页面基本元素，继续尝试获取cookies")
-                    
-                    # 获取cookies
-                    cookies = context.cookies()
+                    if fast:
+                        context.route('**/*', lambda route: route.abort() if route.request.resource_type in FAST_BLOCKED_RESOURCES else route.continue_())
+                        response = page.goto('https://www.xiaohongshu.com', wait_until='commit')
+                        if response.status != 200:
+                            logger.warning(f"⚠️  页面响应状态码: {response.status}")
+                        # 轮询关键cookies，出现即结束
+                        deadline = time.monotonic() + FAST_DEADLINE
+                        cookies = context.cookies()
+                        while set(FAST_REQUIRED_COOKIES) - {cookie['name'] for cookie in cookies} and time.monotonic() < deadline:
+                            page.wait_for_timeout(FAST_POLL_INTERVAL * 1000)
+                            cookies = context.cookies()
+                    else:
+                        # 访问小红书首页
+                        response = page.goto('https://www.xiaohongshu.com', wait_until='networkidle')
+
+                        if response.status != 200:
+                            logger.warning(f"⚠️  页面响应状态码: {response.status}")
+
+                        # 等待页面完全加载
+                        logger.info(f"⏳ 等待页面加载 {wait_time} 秒...")
+                        time.sleep(wait_time)
+
+                        # 尝试等待一些关键元素加载
+                        try:
+                            page.wait_for_selector('body', timeout=10000)
+                            logger.info("✅ 页面基本元素已加载")
+                        except:
+                            logger.warning("⚠️  未检测到页面基本元素，继续尝试获取cookies")
+
+                        # 获取cookies
+                        cookies = context.cookies()
                     
                     if not cookies:
                         logger.warning("⚠️  未获取到任何cookies")
@@ -246,7 +260,7 @@ def test_cookie_getter():
         return 200, cookies_str
     else:
         print("❌ 自动获取失败")
-        return None
+        return None, ""
 
 if __name__ == "__main__":
     test_cookie_getter()
\ No newline at end of file
@@ -4,6 +4,9 @@ import re
 import urllib
 import requests
 from xhs_utils.xhs_util import splice_str, generate_request_params, generate_x_b3_traceid, get_common_headers
+from xhs_utils.scheduler_util import upstream_scheduler
+from xhs_utils.cookie_health_util import cookie_health
+from xhs_utils.jsonl_util import get_raw_sink
 from loguru import logger
 
 """
@@ -11,9 +14,66 @@ from loguru import logger
     :param cookies_str: 你的cookies
 """
 class XHS_Apis():
+    # 响应钩子：每个 edith 响应都会以 hook(cookies, response) 调用，用于按结果更新 cookies 的状态
+    response_hooks = [cookie_health.record]
+
     def __init__(self):
         self.base_url = "https://edith.xiaohongshu.com"
 
+    @classmethod
+    def add_response_hook(cls, hook):
+        if hook not in cls.response_hooks:
+            cls.response_hooks.append(hook)
+
+    def send_request(self, method: str, url: str, **kwargs):
+        """
+            所有对 edith 接口的请求都从这里发出，经上游调度器按优先级通道和租户排队
+            :param method: GET / POST
+            :param url: 完整url
+        """
+        with upstream_scheduler.slot():
+            response = requests.request(method, url, **kwargs)
+        for hook in self.response_hooks:
+            try:
+                hook(kwargs.get('cookies'), response)
+            except Exception as e:
+                logger.warning(f'响应钩子执行失败: {e}')
+        return response
+
+    def check_cookies(self, cookies_str: str, proxies: dict = None, force: bool = False):
+        """
+            预检cookies是否可用，用 get_user_self_info2 做一次轻量请求，结果按有效期缓存
+            :param cookies_str: 你的cookies
+            :param force: 忽略缓存重新检查
+            返回 (success, msg, 健康记录)
+        """
+        return cookie_health.preflight(cookies_str, lambda: self.get_user_self_info2(cookies_str, proxies), force)
+
+    @staticmethod
+    def iter_cursor_pages(fetch_page, list_key: str, cursor: str = '', stop_on_empty: bool = False):
+        """
+            按cursor逐页翻页的通用生成器
+            :param fetch_page: 接收cursor并返回 (success, msg, res_json) 的函数
+            :param list_key: 每页数据列表在 res_json["data"] 中的字段名
+            :param cursor: 起始cursor，用于断点续爬
+            :param stop_on_empty: 当页数据为空时是否停止
+            每页产出 (success, msg, items, next_cursor)，失败时产出一次后结束
+        """
+        try:
+            while True:
+                success, msg, res_json = fetch_page(cursor)
+                if not success:
+                    raise Exception(msg)
+                items = res_json["data"][list_key]
+                if 'cursor' not in res_json["data"]:
+                    break
+                cursor = str(res_json["data"]["cursor"])
+                yield True, msg, items, cursor
+                if (stop_on_empty and len(items) == 0) or not res_json["data"]["has_more"]:
+                    break
+        except Exception as e:
+            yield False, str(e), [], cursor
+
     def get_homefeed_all_channel(self, cookies_str: str, proxies: dict = None):
         """
             获取主页的所有频道
@@ -23,7 +83,7 @@ class XHS_Apis():
         try:
             api = "/api/sns/web/v1/homefeed/category"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -63,7 +123,7 @@ class XHS_Apis():
                 "need_filter_image": False
             }
             headers, cookies, trans_data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=trans_data, cookies=cookies, proxies=proxies)
+            response = self.send_request('POST', self.base_url + api, headers=headers, data=trans_data, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -117,7 +177,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -135,7 +195,7 @@ class XHS_Apis():
         try:
             api = f"/api/sns/web/v1/user/selfinfo"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -154,7 +214,7 @@ class XHS_Apis():
         try:
             api = f"/api/sns/web/v2/user/me"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -183,7 +243,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -192,15 +252,14 @@ class XHS_Apis():
         return success, msg, res_json
 
 
-    def get_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None):
+    def iter_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
         """
-           获取用户所有笔记
-           :param user_id: 你想要获取的用户的id
+           逐页获取用户所有笔记
+           :param user_url: 用户主页的url
            :param cookies_str: 你的cookies
-           返回用户的所有笔记
+           :param cursor: 起始cursor，用于断点续爬
+           每页产出 (success, msg, notes, next_cursor)
         """
-        cursor = ''
-        note_list = []
         try:
             urlParse = urllib.parse.urlparse(user_url)
             user_id = urlParse.path.split("/")[-1]
@@ -208,21 +267,23 @@ class XHS_Apis():
             kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
             xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
             xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_search"
-            while True:
-                success, msg, res_json = self.get_user_note_info(user_id, cursor, cookies_str, xsec_token, xsec_source, proxies)
-                if not success:
-                    raise Exception(msg)
-                notes = res_json["data"]["notes"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_list.extend(notes)
-                if len(notes) == 0 or not res_json["data"]["has_more"]:
-                    break
         except Exception as e:
-            success = False
-            msg = str(e)
+            yield False, str(e), [], cursor
+            return
+        fetch_page = lambda c: self.get_user_note_info(user_id, c, cookies_str, xsec_token, xsec_source, proxies)
+        yield from self.iter_cursor_pages(fetch_page, "notes", cursor, stop_on_empty=True)
+
+    def get_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None):
+        """
+           获取用户所有笔记
+           :param user_id: 你想要获取的用户的id
+           :param cookies_str: 你的cookies
+           返回用户的所有笔记
+        """
+        success, msg = True, '成功'
+        note_list = []
+        for success, msg, notes, cursor in self.iter_user_all_notes(user_url, cookies_str, proxies):
+            note_list.extend(notes)
         return success, msg, note_list
 
     def get_user_like_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
@@ -246,7 +307,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -254,15 +315,14 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
-    def get_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
+    def iter_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
         """
-            获取用户所有喜欢笔记
-            :param user_id: 你想要获取的用户的id
+            逐页获取用户所有喜欢笔记
+            :param user_url: 用户主页的url
             :param cookies_str: 你的cookies
-            返回用户的所有喜欢笔记
+            :param cursor: 起始cursor，用于断点续爬
+            每页产出 (success, msg, notes, next_cursor)
         """
-        cursor = ''
-        note_list = []
         try:
             urlParse = urllib.parse.urlparse(user_url)
             user_id = urlParse.path.split("/")[-1]
@@ -270,22 +330,23 @@ class XHS_Apis():
             kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
             xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
             xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_user"
-            while True:
-                success, msg, res_json = self.get_user_like_note_info(user_id, cursor, cookies_str, xsec_token,
-                                                                      xsec_source, proxies)
-                if not success:
-                    raise Exception(msg)
-                notes = res_json["data"]["notes"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_list.extend(notes)
-                if len(notes) == 0 or not res_json["data"]["has_more"]:
-                    break
         except Exception as e:
-            success = False
-            msg = str(e)
+            yield False, str(e), [], cursor
+            return
+        fetch_page = lambda c: self.get_user_like_note_info(user_id, c, cookies_str, xsec_token, xsec_source, proxies)
+        yield from self.iter_cursor_pages(fetch_page, "notes", cursor, stop_on_empty=True)
+
+    def get_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取用户所有喜欢笔记
+            :param user_id: 你想要获取的用户的id
+            :param cookies_str: 你的cookies
+            返回用户的所有喜欢笔记
+        """
+        success, msg = True, '成功'
+        note_list = []
+        for success, msg, notes, cursor in self.iter_user_all_like_note_info(user_url, cookies_str, proxies):
+            note_list.extend(notes)
         return success, msg, note_list
 
     def get_user_collect_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
@@ -309,7 +370,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -317,15 +378,14 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
-    def get_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
+    def iter_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
         """
-            获取用户所有收藏笔记
-            :param user_id: 你想要获取的用户的id
+            逐页获取用户所有收藏笔记
+            :param user_url: 用户主页的url
             :param cookies_str: 你的cookies
-            返回用户的所有收藏笔记
+            :param cursor: 起始cursor，用于断点续爬
+            每页产出 (success, msg, notes, next_cursor)
         """
-        cursor = ''
-        note_list = []
         try:
             urlParse = urllib.parse.urlparse(user_url)
             user_id = urlParse.path.split("/")[-1]
@@ -333,22 +393,23 @@ class XHS_Apis():
             kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
             xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
             xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_search"
-            while True:
-                success, msg, res_json = self.get_user_collect_note_info(user_id, cursor, cookies_str, xsec_token,
-                                                                         xsec_source, proxies)
-                if not success:
-                    raise Exception(msg)
-                notes = res_json["data"]["notes"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_list.extend(notes)
-                if len(notes) == 0 or not res_json["data"]["has_more"]:
-                    break
         except Exception as e:
-            success = False
-            msg = str(e)
+            yield False, str(e), [], cursor
+            return
+        fetch_page = lambda c: self.get_user_collect_note_info(user_id, c, cookies_str, xsec_token, xsec_source, proxies)
+        yield from self.iter_cursor_pages(fetch_page, "notes", cursor, stop_on_empty=True)
+
+    def get_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取用户所有收藏笔记
+            :param user_id: 你想要获取的用户的id
+            :param cookies_str: 你的cookies
+            返回用户的所有收藏笔记
+        """
+        success, msg = True, '成功'
+        note_list = []
+        for success, msg, notes, cursor in self.iter_user_all_collect_note_info(user_url, cookies_str, proxies):
+            note_list.extend(notes)
         return success, msg, note_list
 
     def get_note_info(self, url: str, cookies_str: str, proxies: dict = None):
@@ -380,7 +441,7 @@ class XHS_Apis():
                 "xsec_token": kvDist['xsec_token']
             }
             headers, cookies, data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=data, cookies=cookies, proxies=proxies)
+            response = self.send_request('POST', self.base_url + api, headers=headers, data=data, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -404,7 +465,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -511,7 +572,7 @@ class XHS_Apis():
                 ]
             }
             headers, cookies, data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
+            response = self.send_request('POST', self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -519,6 +580,29 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    def iter_search_some_note(self, query: str, require_num: int, cookies_str: str, sort_type_choice=0, note_type=0, note_time=0, note_range=0, pos_distance=0, geo="", proxies: dict = None, page: int = 1):
+        """
+            逐页搜索指定数量的笔记，参数同 search_some_note
+            :param page 起始页数，用于断点续爬
+            每页产出 (success, msg, notes, next_page)，总数超出 require_num 的部分会被截掉
+        """
+        count = 0
+        try:
+            while True:
+                success, msg, res_json = self.search_note(query, cookies_str, page, sort_type_choice, note_type, note_time, note_range, pos_distance, geo, proxies)
+                if not success:
+                    raise Exception(msg)
+                if "items" not in res_json["data"]:
+                    break
+                notes = res_json["data"]["items"][:max(require_num - count, 0)]
+                count += len(notes)
+                page += 1
+                yield True, msg, notes, page
+                if count >= require_num or not res_json["data"]["has_more"]:
+                    break
+        except Exception as e:
+            yield False, str(e), [], page
+
     def search_some_note(self, query: str, require_num: int, cookies_str: str, sort_type_choice=0, note_type=0, note_time=0, note_range=0, pos_distance=0, geo="", proxies: dict = None):
         """
             指定数量搜索笔记，设置排序方式和笔记类型和笔记数量
@@ -533,25 +617,10 @@ class XHS_Apis():
             :param geo: 定位信息 经纬度
             返回搜索的结果
         """
-        page = 1
+        success, msg = True, '成功'
         note_list = []
-        try:
-            while True:
-                success, msg, res_json = self.search_note(query, cookies_str, page, sort_type_choice, note_type, note_time, note_range, pos_distance, geo, proxies)
-                if not success:
-                    raise Exception(msg)
-                if "items" not in res_json["data"]:
-                    break
-                notes = res_json["data"]["items"]
-                note_list.extend(notes)
-                page += 1
-                if len(note_list) >= require_num or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        if len(note_list) > require_num:
-            note_list = note_list[:require_num]
+        for success, msg, notes, page in self.iter_search_some_note(query, require_num, cookies_str, sort_type_choice, note_type, note_time, note_range, pos_distance, geo, proxies):
+            note_list.extend(notes)
         return success, msg, note_list
 
     def search_user(self, query: str, cookies_str: str, page=1, proxies: dict = None):
@@ -576,7 +645,7 @@ class XHS_Apis():
                 }
             }
             headers, cookies, data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
+            response = self.send_request('POST', self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -633,7 +702,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -648,24 +717,13 @@ class XHS_Apis():
             :param cookies_str 你的cookies
             返回笔记的全部一级评论
         """
-        cursor = ''
+        success, msg = True, '成功'
         note_out_comment_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_note_out_comment(note_id, cursor, xsec_token, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                comments = res_json["data"]["comments"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_out_comment_list.extend(comments)
-                if len(note_out_comment_list) == 0 or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
+        fetch_page = lambda c: self.get_note_out_comment(note_id, c, xsec_token, cookies_str, proxies)
+        for success, msg, comments, cursor in self.iter_cursor_pages(fetch_page, "comments"):
+            note_out_comment_list.extend(comments)
+            if len(note_out_comment_list) == 0:
+                break
         return success, msg, note_out_comment_list
 
     def get_note_inner_comment(self, comment: dict, cursor: str, xsec_token: str, cookies_str: str, proxies: dict = None):
@@ -690,7 +748,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -728,29 +786,53 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, comment
 
-    def get_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None):
+    def iter_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
         """
-            获取一篇文章的所有评论
-            :param note_id: 你想要获取的笔记的id
+            逐页获取一篇文章的所有评论，每条一级评论都已补全二级评论
+            :param url: 笔记的url
             :param cookies_str: 你的cookies
-            返回一篇文章的所有评论
+            :param cursor: 一级评论的起始cursor，用于断点续爬
+            每页产出 (success, msg, comments, next_cursor)
         """
-        out_comment_list = []
         try:
             urlParse = urllib.parse.urlparse(url)
             note_id = urlParse.path.split("/")[-1]
             kvs = urlParse.query.split('&')
             kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
-            success, msg, out_comment_list = self.get_note_all_out_comment(note_id, kvDist['xsec_token'], cookies_str, proxies)
+            xsec_token = kvDist['xsec_token']
+        except Exception as e:
+            yield False, str(e), [], cursor
+            return
+        fetch_page = lambda c: self.get_note_out_comment(note_id, c, xsec_token, cookies_str, proxies)
+        count = 0
+        for success, msg, comments, next_cursor in self.iter_cursor_pages(fetch_page, "comments", cursor):
             if not success:
-                raise Exception(msg)
-            for comment in out_comment_list:
-                success, msg, new_comment = self.get_note_all_inner_comment(comment, kvDist['xsec_token'], cookies_str, proxies)
+                yield success, msg, comments, next_cursor
+                return
+            for comment in comments:
+                success, msg, new_comment = self.get_note_all_inner_comment(comment, xsec_token, cookies_str, proxies)
                 if not success:
-                    raise Exception(msg)
-        except Exception as e:
-            success = False
-            msg = str(e)
+                    # 与原来的 get_note_all_comment 一致，补全二级评论失败时仍返回已取到的一级评论；
+                    # cursor 仍指向本页，断点续爬时重新获取这一页
+                    yield False, msg, comments, cursor
+                    return
+            cursor = next_cursor
+            count += len(comments)
+            yield True, msg, comments, next_cursor
+            if count == 0:
+                return
+
+    def get_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取一篇文章的所有评论
+            :param note_id: 你想要获取的笔记的id
+            :param cookies_str: 你的cookies
+            返回一篇文章的所有评论
+        """
+        success, msg = True, '成功'
+        out_comment_list = []
+        for success, msg, comments, cursor in self.iter_note_all_comment(url, cookies_str, proxies):
+            out_comment_list.extend(comments)
         return success, msg, out_comment_list
 
     def get_unread_message(self, cookies_str: str, proxies: dict = None):
@@ -763,7 +845,7 @@ class XHS_Apis():
         try:
             api = "/api/sns/web/unread_count"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -787,7 +869,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -795,30 +877,26 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    def iter_all_metions(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的评论和@提醒
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，用于断点续爬
+            每页产出 (success, msg, messages, next_cursor)
+        """
+        fetch_page = lambda c: self.get_metions(c, cookies_str, proxies)
+        yield from self.iter_cursor_pages(fetch_page, "message_list", cursor)
+
     def get_all_metions(self, cookies_str: str, proxies: dict = None):
         """
             获取全部的评论和@提醒
             :param cookies_str: 你的cookies
             返回全部的评论和@提醒
         """
-        cursor = ''
+        success, msg = True, '成功'
         metions_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_metions(cursor, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                metions = res_json["data"]["message_list"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                metions_list.extend(metions)
-                if not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
+        for success, msg, metions, cursor in self.iter_all_metions(cookies_str, proxies):
+            metions_list.extend(metions)
         return success, msg, metions_list
 
     def get_likesAndcollects(self, cursor: str, cookies_str: str, proxies: dict = None):
@@ -837,7 +915,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -845,30 +923,26 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    def iter_all_likesAndcollects(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的赞和收藏
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，用于断点续爬
+            每页产出 (success, msg, messages, next_cursor)
+        """
+        fetch_page = lambda c: self.get_likesAndcollects(c, cookies_str, proxies)
+        yield from self.iter_cursor_pages(fetch_page, "message_list", cursor)
+
     def get_all_likesAndcollects(self, cookies_str: str, proxies: dict = None):
         """
             获取全部的赞和收藏
             :param cookies_str: 你的cookies
             返回全部的赞和收藏
         """
-        cursor = ''
+        success, msg = True, '成功'
         likesAndcollects_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_likesAndcollects(cursor, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                likesAndcollects = res_json["data"]["message_list"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                likesAndcollects_list.extend(likesAndcollects)
-                if not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
+        for success, msg, likesAndcollects, cursor in self.iter_all_likesAndcollects(cookies_str, proxies):
+            likesAndcollects_list.extend(likesAndcollects)
         return success, msg, likesAndcollects_list
 
     def get_new_connections(self, cursor: str, cookies_str: str, proxies: dict = None):
@@ -887,7 +961,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.send_request('GET', self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -895,30 +969,26 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    def iter_all_new_connections(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的新增关注
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，用于断点续爬
+            每页产出 (success, msg, messages, next_cursor)
+        """
+        fetch_page = lambda c: self.get_new_connections(c, cookies_str, proxies)
+        yield from self.iter_cursor_pages(fetch_page, "message_list", cursor)
+
     def get_all_new_connections(self, cookies_str: str, proxies: dict = None):
         """
             获取全部的新增关注
             :param cookies_str: 你的cookies
             返回全部的新增关注
         """
-        cursor = ''
+        success, msg = True, '成功'
         connections_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_new_connections(cursor, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                connections = res_json["data"]["message_list"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                connections_list.extend(connections)
-                if not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
+        for success, msg, connections, cursor in self.iter_all_new_connections(cookies_str, proxies):
+            connections_list.extend(connections)
         return success, msg, connections_list
 
     @staticmethod
@@ -979,6 +1049,10 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, new_url
 
+# 配置了 XHS_RAW_SINK_DIR 时，每个原始响应都追加到压缩 JSONL 归档
+if get_raw_sink() is not None:
+    XHS_Apis.add_response_hook(get_raw_sink().record_response)
+
 if __name__ == '__main__':
     """
         此文件为小红书api的使用示例
@@ -0,0 +1,106 @@
+# encoding: utf-8
+"""
+游客 cookies 获取耗时对比：普通模式（networkidle + 固定等待）与快速模式（拦截静态资源 + 轮询关键 cookies）
+用本地模拟页面代替小红书首页：服务端下发 webId，页面脚本稍后写入 a1，图片/样式/字体/视频都故意放慢
+用法: python benchmarks/guest_cookie_bench.py --rounds 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from apis.browser_pool import BrowserPool
+
+SLOW_RESOURCE_DELAY = 1.5
+SDK_DELAY = 0.3
+STAND_IN_PAGE = b'''<!DOCTYPE html>
+<html>
+<head>
+  <link rel="stylesheet" href="/static/app.css">
+  <style>@font-face { font-family: f; src: url(/static/font.woff2); } body { font-family: f; }</style>
+  <script src="/static/sdk.js"></script>
+</head>
+<body>
+  <img src="/static/1.jpg"><img src="/static/2.jpg"><img src="/static/3.jpg"><img src="/static/4.jpg">
+  <video src="/static/v.mp4" autoplay muted></video>
+</body>
+</html>'''
+SDK_SCRIPT = b"document.cookie = 'a1=19a2b3c4d5e6f7; path=/'; document.cookie = 'xsecappid=xhs-pc-web; path=/';"
+CONTENT_TYPES = {'.css': 'text/css', '.woff2': 'font/woff2', '.jpg': 'image/jpeg', '.mp4': 'video/mp4', '.js': 'application/javascript'}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/':
+            body = STAND_IN_PAGE
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Set-Cookie', f'webId={int(time.time() * 1000)}; Path=/')
+        else:
+            ext = os.path.splitext(self.path)[1]
+            if ext == '.js':
+                time.sleep(SDK_DELAY)
+                body = SDK_SCRIPT
+            else:
+                time.sleep(SLOW_RESOURCE_DELAY)
+                body = b'\0' * 2048
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPES.get(ext, 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(pool: BrowserPool, url: str, rounds: int, fast: bool, wait_time: float):
+    timings = []
+    for _ in range(rounds):
+        start = time.monotonic()
+        success, _, cookies_dict = pool.get_guest_cookies(wait_time=wait_time, retry_count=1, url=url, fast=fast)
+        timings.append(time.monotonic() - start)
+        if not success or 'a1' not in cookies_dict:
+            print(f'  ⚠️  未拿到 a1: {sorted(cookies_dict)}')
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='游客 cookies 获取耗时对比')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--wait-time', type=float, default=3, help='普通模式页面加载后的固定等待秒数')
+    parser.add_argument('--port', type=int, default=8799)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{args.port}/'
+    pool = BrowserPool(size=1)
+    try:
+        # 先取一次让浏览器启动，之后只比较页面加载部分
+        start = time.monotonic()
+        success, _, _ = pool.get_guest_cookies(wait_time=0, retry_count=1, url=url, fast=True)
+        if not success:
+            print('❌ 浏览器无法启动，请先执行 playwright install chromium')
+            return
+        print(f'浏览器冷启动 + 首次获取: {time.monotonic() - start:.2f}s')
+        results = {
+            'normal (networkidle + wait)': measure(pool, url, args.rounds, False, args.wait_time),
+            'fast (block + poll)': measure(pool, url, args.rounds, True, args.wait_time),
+        }
+    finally:
+        pool.close()
+        server.shutdown()
+
+    print(f"\n{'mode':<30}{'mean':>8}{'p50':>8}{'min':>8}{'max':>8}")
+    for mode, timings in results.items():
+        print(f'{mode:<30}{statistics.mean(timings):>8.2f}{statistics.median(timings):>8.2f}{min(timings):>8.2f}{max(timings):>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
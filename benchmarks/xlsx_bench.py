@@ -0,0 +1,83 @@
+# encoding: utf-8
+"""
+excel 导出耗时与内存对比：原来的内存 Workbook（全部单元格 norm_text(str(v)) 后最后一次保存）与流式 write_only 写入
+每个用例在独立子进程里运行，峰值内存取子进程的 ru_maxrss（仅类 Unix 系统）
+用法: python benchmarks/xlsx_bench.py --rows 10000 100000 1000000 --legacy-max 100000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def fake_notes(count: int):
+    for i in range(count):
+        yield {
+            'note_id': f'65f1a2b3000000001{i:07d}', 'note_url': f'https://www.xiaohongshu.com/explore/65f1a2b3000000001{i:07d}',
+            'note_type': '图集', 'user_id': '5e8a7b6c000000000100a1b2', 'home_url': 'https://www.xiaohongshu.com/user/profile/5e8a7b6c000000000100a1b2',
+            'nickname': '测试用户', 'avatar': 'https://sns-avatar-qc.xhscdn.com/avatar/1040g2jo30s0', 'title': f'第 {i} 篇笔记的标题',
+            'desc': '今天去了一家很好吃的店，推荐给大家 #美食[话题]# #探店[话题]#' * 3, 'liked_count': i % 5000, 'collected_count': i % 700,
+            'comment_count': i % 90, 'share_count': i % 30, 'video_cover': None, 'video_addr': None,
+            'image_list': [f'https://sns-webpic-qc.xhscdn.com/202404121854/abc/1040g008310cs1hii{j}' for j in range(4)],
+            'tags': ['美食', '探店'], 'upload_time': '2024-04-12 18:54:00', 'ip_location': '上海',
+        }
+
+
+def legacy_save(datas, file_path):
+    import openpyxl
+    from xhs_utils.data_util import norm_text
+    from xhs_utils.excel_util import XLSX_HEADERS
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(XLSX_HEADERS['note'])
+    for data in datas:
+        data = {k: norm_text(str(v)) for k, v in data.items()}
+        ws.append(list(data.values()))
+    wb.save(file_path)
+
+
+def run_case(mode: str, rows: int):
+    from xhs_utils.data_util import save_to_xlsx
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'bench.xlsx')
+        start = time.monotonic()
+        if mode == 'legacy':
+            legacy_save(fake_notes(rows), file_path)
+            files = [file_path]
+        else:
+            files = save_to_xlsx(fake_notes(rows), file_path)
+        elapsed = time.monotonic() - start
+        size = sum(os.path.getsize(f) for f in files)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{elapsed:.2f} {peak:.0f} {len(files)} {size / 1024 / 1024:.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='excel 导出耗时与内存对比')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--legacy-max', type=int, default=100000, help='原实现只跑不超过这个行数的用例，太大会耗尽内存')
+    parser.add_argument('--case', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        run_case(args.case[0], int(args.case[1]))
+        return
+
+    print(f"{'rows':>10}{'mode':>12}{'seconds':>10}{'peak MB':>10}{'files':>7}{'xlsx MB':>9}")
+    for rows in args.rows:
+        for mode in ('legacy', 'streaming'):
+            if mode == 'legacy' and rows > args.legacy_max:
+                print(f'{rows:>10}{mode:>12}{"skipped":>10}')
+                continue
+            output = subprocess.run([sys.executable, __file__, '--case', mode, str(rows)], capture_output=True, text=True, check=True).stdout
+            elapsed, peak, files, size = output.split()[-4:]
+            print(f'{rows:>10}{mode:>12}{elapsed:>10}{peak:>10}{files:>7}{size:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,38 @@
-from fastapi import FastAPI, Query
-from typing import Optional
+from fastapi import FastAPI, Query, Body
+from typing import Optional, List
 import json
 import time
 import os
+import mimetypes
 import requests
+import urllib.parse
+from loguru import logger
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.responses import HTMLResponse
-from apis.playwright_cookies import test_cookie_getter
+from apis.guest_cookies import GuestCookieManager, GuestIdentityPool
 from apis.xhs_pc_apis import XHS_Apis
+from apis.crawl_jobs import CrawlJobManager
 from fastapi.responses import Response
 from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse
 from fastapi import Request
+from xhs_utils.stream_util import stream_pages, STREAM_MEDIA_TYPES, STREAM_HEADERS
+from xhs_utils.batch_util import run_batch, BATCH_MAX_ITEMS
+from xhs_utils.admission_util import AdmissionController, AdmissionMiddleware
+from xhs_utils.scheduler_util import UpstreamContextMiddleware, upstream_scheduler
+from xhs_utils.video_proxy_util import AsyncVideoProxy
+from xhs_utils.video_cache_util import open_cached_video, get_video_cache
+from xhs_utils.image_resize_util import ImageResizer, negotiate_format
+from xhs_utils.cookie_health_util import cookie_health
+from xhs_utils.media_cache_util import DiskLRUCache, stream_into_cache, is_not_modified, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_CONTROL
+from xhs_utils.download_util import get_media_downloader
+from xhs_utils.media_store_util import get_media_store
+from xhs_utils.archive_util import get_note_archive
+from xhs_utils.jsonl_util import get_raw_sink
+from xhs_utils.common_util import ARCHIVE_BASE_PATH
+from xhs_utils.data_util import handle_note_info, handle_user_info, comment_records
+from xhs_utils.sqlite_store_util import get_xhs_store, STORE_WRITE_THROUGH
 
 # ==============================
 # 🚀 应用初始化
@@ -22,6 +43,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 准入控制：按路由类别限制并发与排队，满载时直接返回 429/503
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+# 上游调度：按路由类别给本次请求的上游调用分配通道（批量/自动翻页走 bulk，X-Priority 只能调低），按 X-Tenant 分配租户
+app.add_middleware(UpstreamContextMiddleware, classify=admission.classify)
+
 # 挂载静态资源
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
@@ -41,6 +68,28 @@ async def custom_swagger_ui_html():
     )
 
 xhs_api = XHS_Apis()
+job_manager = CrawlJobManager()
+
+@app.on_event("startup")
+def start_job_manager():
+    job_manager.start()
+
+@app.on_event("shutdown")
+def stop_job_manager():
+    job_manager.shutdown()
+
+@app.on_event("shutdown")
+def close_raw_sink():
+    # 把还在内存里的一批原始响应写入归档
+    if get_raw_sink() is not None:
+        get_raw_sink().close()
+
+@app.on_event("shutdown")
+def flush_xhs_store():
+    # 把还在缓冲里的一批记录写入本地库，本进程没用过本地库就不用管
+    store = get_xhs_store(create=False)
+    if store is not None:
+        store.flush()
 
 # ==============================
 # 🧰 工具函数
@@ -54,55 +103,123 @@ def parse_proxies(proxies_str: Optional[str]) -> Optional[dict]:
     except json.JSONDecodeError:
         return {"error": "代理配置格式错误，应为JSON字符串"}
 
+def write_through(kind: str, make_records):
+    """开启 XHS_STORE_WRITE_THROUGH 时把整理后的记录写入本地库，整理或写入失败只记日志，不影响接口返回"""
+    if not STORE_WRITE_THROUGH:
+        return
+    try:
+        get_xhs_store().add_many(kind, make_records())
+    except Exception as e:
+        logger.warning(f'写入本地库失败 {kind}: {e}')
+
+def stream_response(request: Request, pages, fmt: str):
+    """把分页生成器包装为 NDJSON / SSE 流式响应"""
+    return StreamingResponse(stream_pages(request, pages, fmt), media_type=STREAM_MEDIA_TYPES[fmt], headers=STREAM_HEADERS)
+
+image_cache = DiskLRUCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+def cached_image_headers(meta: dict) -> dict:
+    return {"ETag": meta["etag"], "Last-Modified": meta["last_modified"], "Cache-Control": IMAGE_CACHE_CONTROL}
+
+IMAGE_PROXY_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://www.xiaohongshu.com/",
+}
+
+image_resizer = ImageResizer()
+
+@app.on_event("shutdown")
+def close_image_resizer():
+    image_resizer.shutdown()
+
+def resized_image_response(request: Request, url: str, w: int, q: int):
+    """返回缩放/转码后的图片，原图先完整拉进缓存；无法转换时返回 None，退回原图"""
+    fmt = negotiate_format(request.headers.get("accept"))
+    if fmt is None:
+        return None
+    src_key = DiskLRUCache.key_for(url)
+    if image_cache.get(src_key) is None:
+        resp = requests.get(url, headers=IMAGE_PROXY_HEADERS, timeout=10, stream=True)
+        if resp.status_code != 200:
+            resp.close()
+            return None
+        meta = {"url": url, "content_type": resp.headers.get("Content-Type", "image/jpeg")}
+        for _ in stream_into_cache(resp.iter_content(chunk_size=64 * 1024), image_cache, src_key, meta, resp.close):
+            pass
+    width, quality = ImageResizer.normalize(w, q)
+    key, meta = image_resizer.get_variant(image_cache, url, src_key, width, quality, fmt)
+    if key is None:
+        return None
+    headers = dict(cached_image_headers(meta), Vary="Accept")
+    if is_not_modified(request.headers, meta):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(image_cache.data_path(key), media_type=meta["content_type"], headers=headers)
+
 @app.get("/proxy/image", summary="🖼️ 代理小红书图片（绕过 403）")
-def proxy_image(url: str = Query(..., description="原始图片 URL")):
-    """代理图片请求，添加合法 headers 绕过反爬"""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Referer": "https://www.xiaohongshu.com/",
-    }
+def proxy_image(
+    request: Request,
+    url: str = Query(..., description="原始图片 URL"),
+    w: Optional[int] = Query(None, ge=1, description="输出宽度（等比缩小，不放大）"),
+    q: Optional[int] = Query(None, ge=1, le=95, description="输出质量 1-95"),
+):
+    """代理图片请求，添加合法 headers 绕过反爬；边转发边写入磁盘 LRU 缓存，命中时直接从磁盘返回。
+    带 w / q 参数时按 Accept 头输出 AVIF / WebP / JPEG，缩放结果同样缓存"""
+    if w is not None or q is not None:
+        try:
+            response = resized_image_response(request, url, w, q)
+            if response is not None:
+                return response
+        except Exception as e:
+            logger.warning(f"图片缩放失败，返回原图 {url}: {e}")
+    key = DiskLRUCache.key_for(url)
+    meta = image_cache.get(key)
+    if meta is not None:
+        if is_not_modified(request.headers, meta):
+            return Response(status_code=304, headers=cached_image_headers(meta))
+        return FileResponse(image_cache.data_path(key), media_type=meta["content_type"], headers=cached_image_headers(meta))
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = requests.get(url, headers=IMAGE_PROXY_HEADERS, timeout=10, stream=True)
         if resp.status_code == 200:
-            return Response(content=resp.content, media_type="image/jpeg")
+            meta = {"url": url, "content_type": resp.headers.get("Content-Type", "image/jpeg")}
+            response_headers = {"Cache-Control": IMAGE_CACHE_CONTROL}
+            for name, key_name in (("ETag", "etag"), ("Last-Modified", "last_modified")):
+                if name in resp.headers:
+                    meta[key_name] = response_headers[name] = resp.headers[name]
+            if "Content-Length" in resp.headers:
+                response_headers["Content-Length"] = resp.headers["Content-Length"]
+            chunks = resp.iter_content(chunk_size=64 * 1024)
+            return StreamingResponse(stream_into_cache(chunks, image_cache, key, meta, resp.close), media_type=meta["content_type"], headers=response_headers)
+        resp.close()
     except:
         pass
     return {"success": False, "msg": "Proxy failed"}
 
+video_proxy = AsyncVideoProxy()
+video_cache = get_video_cache()
+
+@app.on_event("shutdown")
+async def close_video_proxy():
+    await video_proxy.close()
+
 @app.get("/proxy/video", summary="🎥 代理小红书视频（支持拖拽）")
 async def proxy_video(request: Request, url: str = Query(..., description="原始视频 URL")):
-    """支持 Range 请求的视频代理，解决 403 和无法拖拽问题"""
+    """支持 Range 请求的视频代理，解决 403 和无法拖拽问题；全程异步，不阻塞事件循环。
+    视频按 1MB 分块缓存，重复拖拽到看过的位置直接读本地，只向上游请求缺失的块"""
     try:
         # 获取客户端 Range 头（用于拖拽）
         range_header = request.headers.get("range")
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Referer": "https://www.xiaohongshu.com/",
-        }
-        if range_header:
-            headers["Range"] = range_header
-
-        # 发起流式请求（stream=True）
-        resp = requests.get(url, headers=headers, stream=True, timeout=10)
-
-        # 构建响应头
-        response_headers = {
-            "Content-Type": "video/mp4",
-            "Accept-Ranges": "bytes",
-        }
-        if "Content-Length" in resp.headers:
-            response_headers["Content-Length"] = resp.headers["Content-Length"]
-        if "Content-Range" in resp.headers:
-            response_headers["Content-Range"] = resp.headers["Content-Range"]
-
-        # 状态码：206（部分）或 200（完整）
-        status_code = 206 if range_header and resp.status_code == 206 else 200
-
-        # ✅ 正确返回流式响应
+        cached = await open_cached_video(video_proxy, video_cache, url, range_header)
+        if cached is not None:
+            status_code, response_headers, body = cached
+            if body is None:
+                return Response(status_code=status_code, headers=response_headers)
+            return StreamingResponse(body, media_type=response_headers["Content-Type"], status_code=status_code, headers=response_headers)
+        # 上游不支持 Range，原样透传
+        resp, response_headers = await video_proxy.open(url, range_header)
         return StreamingResponse(
-            resp.iter_content(chunk_size=8192),
-            media_type="video/mp4",
-            status_code=status_code,
+            video_proxy.iter_body(resp),
+            media_type=response_headers["Content-Type"],
+            status_code=resp.status_code,
             headers=response_headers
         )
     except Exception as e:
@@ -111,38 +228,42 @@ async def proxy_video(request: Request, url: str = Query(..., description="原
 # ==============================
 # 🎫 游客 Cookies 接口（带缓存）
 # ==============================
-_guest_cookies_cache = {"value": "", "expires_at": 0}
+guest_cookie_manager = GuestCookieManager()
+
+@app.on_event("startup")
+def start_guest_cookie_manager():
+    guest_cookie_manager.start()
+
+@app.on_event("shutdown")
+def stop_guest_cookie_manager():
+    guest_cookie_manager.shutdown()
+
+# 接口的 cookies_str 传 "guest" 时从游客身份池轮流取一份游客 cookies
+guest_identity_pool = GuestIdentityPool()
+
+@app.on_event("startup")
+def start_guest_identity_pool():
+    guest_identity_pool.start()
+
+@app.on_event("shutdown")
+def stop_guest_identity_pool():
+    guest_identity_pool.shutdown()
 
 @app.get(
     "/guestcookies",
     summary="🎫 获取游客 cookies",
-    description="返回有效的游客 cookies，用于免登录访问公开内容。内部缓存 5 分钟，避免频繁请求。"
+    description="返回有效的游客 cookies，用于免登录访问公开内容。后台在过期前自动刷新，过期后先返回旧值再刷新，不会让请求等待浏览器启动。"
 )
-@app.get("/guestcookies", summary="获取小红书游客cookies")
 def get_guest_cookies():
     """获取小红书游客cookies"""
-    global _guest_cookies_cache
-    now = time.time()
-    # 缓存 5 分钟（300 秒）
-    if _guest_cookies_cache["value"] and _guest_cookies_cache["expires_at"] > now:
-        return {"success": 200, "data": _guest_cookies_cache["value"]}
-    success, data = test_cookie_getter()
-    _guest_cookies_cache["value"] = data
-    _guest_cookies_cache["expires_at"] = now + 300  # 5分钟缓存
-    return {"success": success, "data": data}
+    success, msg, data = guest_cookie_manager.get()
+    return {"success": success, "msg": msg, "data": data}
 
 @app.get("/guestcookies/refresh", summary="🔄 强制刷新游客 cookies")
 def refresh_guest_cookies():
-    """强制清除缓存并重新获取游客 cookies"""
-    global _guest_cookies_cache
-    _guest_cookies_cache["value"] = ""
-    _guest_cookies_cache["expires_at"] = 0
-    # 立即重新获取
-    success, data = test_cookie_getter()
-    now = time.time()
-    _guest_cookies_cache["value"] = data
-    _guest_cookies_cache["expires_at"] = now + 300
-    return {"success": success, "data": data}
+    """立即重新获取游客 cookies；已有刷新在进行时等待并复用其结果，失败时保留原有 cookies"""
+    success, msg, data = guest_cookie_manager.refresh()
+    return {"success": success, "msg": msg, "data": data}
 # ==============================
 # 🏠 主页相关接口
 # ==============================
@@ -214,8 +335,42 @@ def user_info(
     if isinstance(proxies_dict, dict) and "error" in proxies_dict:
         return {"success": False, "msg": proxies_dict["error"], "data": None}
     success, msg, data = xhs_api.get_user_info(user_id, cookies_str, proxies_dict)
+    if success:
+        write_through('user', lambda: [handle_user_info(data['data'], user_id)])
     return {"success": success, "msg": msg, "data": data}
 
+@app.post(
+    "/user/info/batch",
+    summary="👥 批量获取用户公开信息",
+    description=f"一次传入多个用户ID（最多 {BATCH_MAX_ITEMS} 个），并发获取，结果按用户ID返回，每条带独立的 success 标记"
+)
+def user_info_batch(
+    user_ids: List[str] = Body(..., embed=True, description="用户ID列表"),
+    handle: bool = Query(False, description="是否用 handle_user_info 整理为精简字段"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > BATCH_MAX_ITEMS:
+        return {"success": False, "msg": f"一次最多 {BATCH_MAX_ITEMS} 个用户", "data": None}
+
+    def fetch(user_id):
+        success, msg, data = xhs_api.get_user_info(user_id, cookies_str, proxies_dict)
+        if success and handle:
+            try:
+                data = handle_user_info(data['data'], user_id)
+            except Exception as e:
+                success, msg, data = False, str(e), None
+        if success:
+            write_through('user', lambda: [data if handle else handle_user_info(data['data'], user_id)])
+        return {"success": success, "msg": msg, "data": data}
+
+    results = run_batch(fetch, user_ids)
+    return {"success": True, "msg": "成功", "data": dict(zip(user_ids, results))}
+
 @app.get(
     "/user/self-info",
     summary="🧍 获取当前用户信息（基础）",
@@ -368,8 +523,48 @@ def note_info(
     if isinstance(proxies_dict, dict) and "error" in proxies_dict:
         return {"success": False, "msg": proxies_dict["error"], "data": None}
     success, msg, data = xhs_api.get_note_info(url, cookies_str, proxies_dict)
+    if success:
+        write_through('note', lambda: [handle_note_info(dict(data['data']['items'][0], url=url))])
     return {"success": success, "msg": msg, "data": data}
 
+@app.post(
+    "/note/info/batch",
+    summary="📚 批量获取笔记详情",
+    description=f"一次传入多个笔记 URL（最多 {BATCH_MAX_ITEMS} 个），并发获取，结果按笔记ID返回，每条带独立的 success 标记"
+)
+def note_info_batch(
+    urls: List[str] = Body(..., embed=True, description="笔记完整 URL 列表，含 xsec_token"),
+    handle: bool = Query(False, description="是否用 handle_note_info 整理为精简字段"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    # 按笔记ID去重，同一笔记的多个链接（xsec_token 不同）只取第一个，避免结果互相覆盖
+    note_urls = {}
+    for url in urls:
+        note_urls.setdefault(urllib.parse.urlparse(url).path.split("/")[-1], url)
+    note_ids, urls = list(note_urls.keys()), list(note_urls.values())
+    if len(urls) > BATCH_MAX_ITEMS:
+        return {"success": False, "msg": f"一次最多 {BATCH_MAX_ITEMS} 个笔记", "data": None}
+
+    def fetch(url):
+        success, msg, data = xhs_api.get_note_info(url, cookies_str, proxies_dict)
+        if success and handle:
+            try:
+                note_info = data['data']['items'][0]
+                note_info['url'] = url
+                data = handle_note_info(note_info)
+            except Exception as e:
+                success, msg, data = False, str(e), None
+        if success:
+            write_through('note', lambda: [data if handle else handle_note_info(dict(data['data']['items'][0], url=url))])
+        return {"success": success, "msg": msg, "data": data}
+
+    results = run_batch(fetch, urls)
+    return {"success": True, "msg": "成功", "data": dict(zip(note_ids, results))}
+
 @app.get(
     "/note/comments",
     summary="💬 获取笔记全部评论",
@@ -384,6 +579,8 @@ def note_all_comments(
     if isinstance(proxies_dict, dict) and "error" in proxies_dict:
         return {"success": False, "msg": proxies_dict["error"], "data": None}
     success, msg, data = xhs_api.get_note_all_comment(url, cookies_str, proxies_dict)
+    if success:
+        write_through('comment', lambda: comment_records(url, data))
     return {"success": success, "msg": msg, "data": data}
 
 @app.get(
@@ -685,6 +882,438 @@ def new_connections_page(
     success, msg, data = xhs_api.get_new_connections(cursor, cookies_str, proxies_dict)
     return {"success": success, "msg": msg, "data": data}
 
+# ==============================
+# 📡 流式接口（逐页推送 NDJSON / SSE）
+# ==============================
+STREAM_FORMAT_DESC = "输出格式：ndjson 或 sse，每条数据一个 item 事件，每页一个 page 事件，最后一个 summary 事件"
+
+@app.get(
+    "/user/notes/stream",
+    summary="📡 流式获取用户所有笔记",
+    description="边翻页边推送用户发布的全部笔记"
+)
+def user_all_notes_stream(
+    request: Request,
+    user_url: str = Query(..., description="用户主页 URL，含 xsec_token"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_user_all_notes(user_url, cookies_str, proxies_dict), fmt)
+
+@app.get(
+    "/user/likes/stream",
+    summary="📡 流式获取用户所有喜欢的笔记",
+    description="边翻页边推送用户点赞过的全部笔记"
+)
+def user_all_likes_stream(
+    request: Request,
+    user_url: str = Query(..., description="用户主页 URL，含 xsec_token"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_user_all_like_note_info(user_url, cookies_str, proxies_dict), fmt)
+
+@app.get(
+    "/user/collections/stream",
+    summary="📡 流式获取用户所有收藏的笔记",
+    description="边翻页边推送用户收藏的全部笔记"
+)
+def user_all_collections_stream(
+    request: Request,
+    user_url: str = Query(..., description="用户主页 URL，含 xsec_token"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_user_all_collect_note_info(user_url, cookies_str, proxies_dict), fmt)
+
+@app.get(
+    "/note/comments/stream",
+    summary="📡 流式获取笔记全部评论",
+    description="边翻页边推送笔记的一级评论，每条一级评论都已补全二级评论"
+)
+def note_all_comments_stream(
+    request: Request,
+    url: str = Query(..., description="笔记完整 URL，含 xsec_token"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_note_all_comment(url, cookies_str, proxies_dict), fmt)
+
+@app.get(
+    "/search/note/by-num/stream",
+    summary="📡 流式按数量搜索笔记",
+    description="边翻页边推送搜索结果，支持高级筛选"
+)
+def search_some_note_stream(
+    request: Request,
+    query: str = Query(..., description="搜索关键词"),
+    require_num: int = Query(20, ge=1, le=1000, description="需要获取的笔记数量（1-1000）"),
+    sort_type_choice: int = Query(0, ge=0, le=4, description="排序：0-综合 1-最新 2-最热 3-最多评论 4-最多收藏"),
+    note_type: int = Query(0, ge=0, le=2, description="类型：0-不限 1-视频 2-图文"),
+    note_time: int = Query(0, ge=0, le=3, description="时间：0-不限 1-1天 2-1周 3-半年"),
+    note_range: int = Query(0, ge=0, le=3, description="范围：0-不限 1-已看 2-未看 3-已关注"),
+    pos_distance: int = Query(0, ge=0, le=2, description="位置：0-不限 1-同城 2-附近"),
+    geo: str = Query("", description="地理位置，JSON 格式如 {\"latitude\":39.9,\"longitude\":116.4}"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    geo_data = json.loads(geo) if geo else None
+    pages = xhs_api.iter_search_some_note(query, require_num, cookies_str, sort_type_choice, note_type, note_time, note_range, pos_distance, geo_data, proxies_dict)
+    return stream_response(request, pages, fmt)
+
+@app.get(
+    "/message/mentions/stream",
+    summary="📡 流式获取所有@和评论提醒",
+    description="边翻页边推送全部被@和评论提醒"
+)
+def get_all_metions_stream(
+    request: Request,
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_all_metions(cookies_str, proxies_dict), fmt)
+
+@app.get(
+    "/message/likes-collects/stream",
+    summary="📡 流式获取所有赞和收藏通知",
+    description="边翻页边推送他人点赞/收藏你内容的通知"
+)
+def get_all_likes_and_collects_stream(
+    request: Request,
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_all_likesAndcollects(cookies_str, proxies_dict), fmt)
+
+@app.get(
+    "/message/new-connections/stream",
+    summary="📡 流式获取所有新增关注",
+    description="边翻页边推送关注你的新用户列表"
+)
+def get_all_new_connections_stream(
+    request: Request,
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串"),
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$", description=STREAM_FORMAT_DESC)
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    return stream_response(request, xhs_api.iter_all_new_connections(cookies_str, proxies_dict), fmt)
+
+# ==============================
+# 🗂️ 异步爬取任务接口
+# ==============================
+@app.post(
+    "/jobs/user-notes",
+    summary="🗂️ 提交任务：用户所有笔记",
+    description="后台翻页获取用户发布的全部笔记，返回 job_id，通过 /jobs/{job_id} 查询进度"
+)
+def submit_user_notes_job(
+    user_url: str = Query(..., description="用户主页 URL，含 xsec_token"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    job_id = job_manager.submit('user_notes', {"user_url": user_url, "cookies_str": cookies_str, "proxies": proxies_dict})
+    return {"success": True, "msg": "任务已提交", "data": {"job_id": job_id}}
+
+@app.post(
+    "/jobs/search-notes",
+    summary="🗂️ 提交任务：按数量搜索笔记",
+    description="后台翻页搜索笔记，返回 job_id"
+)
+def submit_search_notes_job(
+    query: str = Query(..., description="搜索关键词"),
+    require_num: int = Query(20, ge=1, le=10000, description="需要获取的笔记数量"),
+    sort_type_choice: int = Query(0, ge=0, le=4, description="排序：0-综合 1-最新 2-最热 3-最多评论 4-最多收藏"),
+    note_type: int = Query(0, ge=0, le=2, description="类型：0-不限 1-视频 2-图文"),
+    note_time: int = Query(0, ge=0, le=3, description="时间：0-不限 1-1天 2-1周 3-半年"),
+    note_range: int = Query(0, ge=0, le=3, description="范围：0-不限 1-已看 2-未看 3-已关注"),
+    pos_distance: int = Query(0, ge=0, le=2, description="位置：0-不限 1-同城 2-附近"),
+    geo: str = Query("", description="地理位置，JSON 格式如 {\"latitude\":39.9,\"longitude\":116.4}"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    params = {
+        "query": query, "require_num": require_num, "sort_type_choice": sort_type_choice, "note_type": note_type,
+        "note_time": note_time, "note_range": note_range, "pos_distance": pos_distance,
+        "geo": json.loads(geo) if geo else None, "cookies_str": cookies_str, "proxies": proxies_dict,
+    }
+    job_id = job_manager.submit('search_notes', params)
+    return {"success": True, "msg": "任务已提交", "data": {"job_id": job_id}}
+
+@app.post(
+    "/jobs/note-comments",
+    summary="🗂️ 提交任务：笔记全部评论",
+    description="后台翻页获取笔记的全部一级和二级评论，返回 job_id；指定 save_choice 时完成后导出到 excel、按笔记 id 分区的 parquet 或本地 SQLite 库"
+)
+def submit_note_comments_job(
+    url: str = Query(..., description="笔记完整 URL，含 xsec_token"),
+    save_choice: str = Query("", pattern="^(|excel|parquet|sqlite)$", description="不导出 / excel / parquet / sqlite"),
+    excel_name: str = Query("", description="excel 文件名，默认为 job_id"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    params = {"url": url, "save_choice": save_choice, "excel_name": excel_name, "cookies_str": cookies_str, "proxies": proxies_dict}
+    job_id = job_manager.submit('note_comments', params)
+    return {"success": True, "msg": "任务已提交", "data": {"job_id": job_id}}
+
+@app.post(
+    "/jobs/spider",
+    summary="🗂️ 提交任务：爬取并保存笔记",
+    description="与 Data_Spider（apis/data_spider.py）相同的爬取流程：笔记列表 / 用户主页 / 搜索关键词三选一，按 save_choice 保存媒体、excel、parquet 或本地 SQLite 库"
+)
+def submit_spider_job(
+    notes: Optional[List[str]] = Query(None, description="笔记 URL 列表"),
+    user_url: str = Query("", description="用户主页 URL，含 xsec_token"),
+    query: str = Query("", description="搜索关键词"),
+    require_num: int = Query(20, ge=1, le=10000, description="搜索时需要获取的笔记数量"),
+    save_choice: str = Query("all", pattern="^(all|excel|media|media-video|media-image|archive|archive-media|parquet|sqlite)$", description="all / excel / media / media-video / media-image / archive / archive-media / parquet / sqlite"),
+    excel_name: str = Query("", description="excel 文件名，默认为 job_id"),
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    if len([x for x in (notes, user_url, query) if x]) != 1:
+        return {"success": False, "msg": "notes、user_url、query 必须且只能指定一个", "data": None}
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    params = {
+        "notes": notes, "user_url": user_url, "query": query, "require_num": require_num, "save_choice": save_choice,
+        "excel_name": excel_name, "cookies_str": cookies_str, "proxies": proxies_dict,
+    }
+    job_id = job_manager.submit('spider', params)
+    return {"success": True, "msg": "任务已提交", "data": {"job_id": job_id}}
+
+@app.get(
+    "/jobs",
+    summary="📋 任务列表",
+    description="按创建时间倒序列出任务"
+)
+def list_jobs(
+    status: Optional[str] = Query(None, description="按状态过滤：pending / running / succeeded / failed / cancelled"),
+    limit: int = Query(50, ge=1, le=500, description="返回数量")
+):
+    jobs = [job_manager.public_job(job) for job in job_manager.store.list(status, limit)]
+    return {"success": True, "msg": "成功", "data": jobs}
+
+@app.get(
+    "/jobs/{job_id}",
+    summary="🔍 查询任务状态",
+    description="返回任务状态、已获取条数等进度信息"
+)
+def get_job(job_id: str):
+    job = job_manager.public_job(job_manager.store.get(job_id))
+    if job is None:
+        return {"success": False, "msg": "任务不存在", "data": None}
+    return {"success": True, "msg": "成功", "data": job}
+
+@app.get(
+    "/jobs/{job_id}/results",
+    summary="📦 分页获取任务结果",
+    description="从本地存储中分页读取任务结果，任务执行中也可读取已完成的部分"
+)
+def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="起始序号"),
+    limit: int = Query(100, ge=1, le=1000, description="返回数量")
+):
+    job = job_manager.store.get(job_id)
+    if job is None:
+        return {"success": False, "msg": "任务不存在", "data": None}
+    items = job_manager.store.results(job_id, offset, limit)
+    return {"success": True, "msg": "成功", "data": {"status": job["status"], "progress": job["progress"], "offset": offset, "items": items}}
+
+@app.post(
+    "/jobs/{job_id}/cancel",
+    summary="⛔ 取消任务",
+    description="取消排队中或执行中的任务，执行中的任务会在当前页完成后停止"
+)
+def cancel_job(job_id: str):
+    if not job_manager.cancel(job_id):
+        return {"success": False, "msg": "任务不存在或已结束", "data": None}
+    return {"success": True, "msg": "已取消", "data": None}
+
+# ==============================
+# 🗄️ 归档查询
+# ==============================
+@app.get(
+    "/archive/notes/{note_id}",
+    summary="🗄️ 读取归档的笔记",
+    description="save_choice 为 archive / archive-media 时笔记写入分片归档，这里按索引直接定位，返回笔记信息和归档的文件列表"
+)
+def get_archived_note(note_id: str):
+    archive = get_note_archive(ARCHIVE_BASE_PATH)
+    note = archive.get_note(note_id)
+    if note is None:
+        return {"success": False, "msg": "笔记未归档", "data": None}
+    return {"success": True, "msg": "成功", "data": {"note": note, "files": archive.members(note_id)}}
+
+@app.get(
+    "/archive/notes/{note_id}/files/{name}",
+    summary="🗄️ 读取归档的文件",
+    description="按索引定位分片偏移，流式返回归档中的单个文件（图片、视频、detail.txt 等）"
+)
+def get_archived_file(note_id: str, name: str):
+    chunks = get_note_archive(ARCHIVE_BASE_PATH).iter_member(note_id, name)
+    if chunks is None:
+        return {"success": False, "msg": "文件不存在", "data": None}
+    return StreamingResponse(chunks, media_type=mimetypes.guess_type(name)[0] or "application/octet-stream")
+
+# ==============================
+# 🗃️ 本地数据查询
+# ==============================
+@app.get(
+    "/store/notes",
+    summary="🗃️ 查询本地库中的笔记",
+    description="查询 save_choice 为 sqlite 或开启 XHS_STORE_WRITE_THROUGH 后写入本地 SQLite 库的笔记，可按作者、标签、发布时间范围和关键词过滤，按发布时间倒序"
+)
+def store_query_notes(
+    user_id: Optional[str] = Query(None, description="作者用户ID"),
+    tag: Optional[str] = Query(None, description="标签"),
+    since: Optional[str] = Query(None, description="发布时间起点（含），如 2024-01-01 或 2024-01-01 08:00:00"),
+    until: Optional[str] = Query(None, description="发布时间终点（不含）"),
+    keyword: Optional[str] = Query(None, description="标题或描述中的关键词"),
+    limit: int = Query(50, ge=1, le=1000, description="返回条数"),
+    offset: int = Query(0, ge=0, description="跳过条数")
+):
+    data = get_xhs_store().query_notes(user_id, tag, since, until, keyword, limit, offset)
+    return {"success": True, "msg": "成功", "data": data}
+
+@app.get(
+    "/store/notes/{note_id}",
+    summary="🗃️ 读取本地库中的笔记",
+    description="按笔记ID读取本地库中最近一次写入的笔记信息"
+)
+def store_get_note(note_id: str):
+    data = get_xhs_store().get('note', note_id)
+    if data is None:
+        return {"success": False, "msg": "笔记不在本地库中", "data": None}
+    return {"success": True, "msg": "成功", "data": data}
+
+@app.get(
+    "/store/users/{user_id}",
+    summary="🗃️ 读取本地库中的用户",
+    description="按用户ID读取本地库中的用户信息"
+)
+def store_get_user(user_id: str):
+    data = get_xhs_store().get('user', user_id)
+    if data is None:
+        return {"success": False, "msg": "用户不在本地库中", "data": None}
+    return {"success": True, "msg": "成功", "data": data}
+
+@app.get(
+    "/store/comments",
+    summary="🗃️ 查询本地库中的评论",
+    description="按笔记ID或评论用户ID查询本地库中的评论，按评论时间倒序"
+)
+def store_query_comments(
+    note_id: Optional[str] = Query(None, description="笔记ID"),
+    user_id: Optional[str] = Query(None, description="评论用户ID"),
+    limit: int = Query(100, ge=1, le=1000, description="返回条数"),
+    offset: int = Query(0, ge=0, description="跳过条数")
+):
+    data = get_xhs_store().query_comments(note_id, user_id, limit, offset)
+    return {"success": True, "msg": "成功", "data": data}
+
+@app.get(
+    "/store/tags",
+    summary="🗃️ 本地库中的热门标签",
+    description="统计本地库中笔记（或用户）标签出现的次数"
+)
+def store_top_tags(
+    kind: str = Query("note", pattern="^(note|user)$", description="note / user"),
+    limit: int = Query(50, ge=1, le=1000, description="返回条数")
+):
+    return {"success": True, "msg": "成功", "data": get_xhs_store().top_tags(kind, limit)}
+
+# ==============================
+# 🩺 cookies 健康状态
+# ==============================
+@app.get(
+    "/admin/cookie-health",
+    summary="🩺 查看 cookies 健康状态",
+    description="列出预检和正常请求结果记录下来的每份 cookies 的状态（a1 已脱敏），已判定失效的 cookies 会在签名前直接被拒绝"
+)
+def cookie_health_table():
+    return {"success": True, "msg": "成功", "data": cookie_health.table()}
+
+@app.get(
+    "/admin/cookie-health/check",
+    summary="🩺 预检 cookies 是否可用",
+    description="用一次轻量请求（获取自己的信息）检查 cookies，结果按有效期缓存；force=true 时忽略缓存重新检查"
+)
+def cookie_health_check(
+    cookies_str: str = Query(..., description="用户的 cookies 字符串"),
+    force: bool = Query(False, description="是否忽略缓存重新检查"),
+    proxies: Optional[str] = Query(None, description="代理配置，JSON 字符串")
+):
+    proxies_dict = parse_proxies(proxies)
+    if isinstance(proxies_dict, dict) and "error" in proxies_dict:
+        return {"success": False, "msg": proxies_dict["error"], "data": None}
+    success, msg, data = xhs_api.check_cookies(cookies_str, proxies_dict, force)
+    return {"success": success, "msg": msg, "data": data}
+
+# ==============================
+# 📈 运行指标
+# ==============================
+@app.get("/metrics", summary="📈 运行指标", description="各路由类别的并发、排队与拒绝情况，上游各优先级通道的排队深度与等待时间，以及各类缓存的命中情况")
+def metrics():
+    media_store = get_media_store()
+    raw_sink = get_raw_sink()
+    xhs_store = get_xhs_store(create=False)
+    return {"success": True, "msg": "成功", "data": {
+        "admission": admission.stats(),
+        "upstream": upstream_scheduler.stats(),
+        "image_cache": image_cache.stats(),
+        "image_resizer": image_resizer.stats(),
+        "video_proxy": video_proxy.stats(),
+        "video_cache": video_cache.stats(),
+        "guest_cookies": guest_cookie_manager.stats(),
+        "guest_identities": guest_identity_pool.stats(),
+        "media_download": get_media_downloader().stats(),
+        "media_store": media_store.stats() if media_store else None,
+        "raw_sink": raw_sink.stats() if raw_sink else None,
+        "xhs_store": xhs_store.stats() if xhs_store else None,
+    }}
+
 # ==============================
 # 🌐 前端页面入口
 # ==============================
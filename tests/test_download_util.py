@@ -0,0 +1,260 @@
+# encoding: utf-8
+"""
+MediaDownloader 的分段规划、按位置写入和 Range / If-Range 续传测试，用假的 Session 代替 CDN
+用法: python -m pytest tests
+"""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from xhs_utils import download_util
+from xhs_utils.download_util import MediaDownloader, PART_SUFFIX, plan_segments, write_at
+
+RANGE_RE = re.compile(r'bytes=(\d+)-(\d*)')
+URL = 'https://sns-video-bd.xhscdn.com/test.mp4'
+
+
+class FakeResponse():
+    def __init__(self, status_code: int, body: bytes = b'', headers: dict = None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400 and self.status_code != 416:
+            raise download_util.requests.HTTPError(f'{self.status_code}', response=self)
+
+    def iter_content(self, chunk_size: int):
+        for offset in range(0, len(self.body), 1000):
+            yield self.body[offset:offset + 1000]
+
+
+class FakeSession():
+    def __init__(self, data: bytes, etag: str = '"v1"', ranges: bool = True):
+        """按 Range / If-Range 响应的假 CDN，记录每次请求的请求头"""
+        self.data = data
+        self.etag = etag
+        self.ranges = ranges
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        total = len(self.data)
+        match = RANGE_RE.match(headers.get('Range', ''))
+        if not self.ranges or match is None or ('If-Range' in headers and headers['If-Range'] != self.etag):
+            return FakeResponse(200, self.data, {'ETag': self.etag, 'Content-Length': str(total)})
+        start = int(match.group(1))
+        if start >= total:
+            return FakeResponse(416, headers={'Content-Range': f'bytes */{total}'})
+        end = min(int(match.group(2)) if match.group(2) else total - 1, total - 1)
+        return FakeResponse(206, self.data[start:end + 1], {'ETag': self.etag, 'Content-Range': f'bytes {start}-{end}/{total}'})
+
+
+@pytest.fixture
+def downloader():
+    return MediaDownloader(max_workers=4)
+
+
+def use_session(downloader: MediaDownloader, session: FakeSession):
+    downloader.session_for(URL)
+    host = download_util.urllib.parse.urlsplit(URL).netloc
+    downloader.sessions[host] = session
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# ==============================
+# plan_segments
+# ==============================
+@pytest.mark.parametrize('start,total,max_segments,segment_size', [
+    (0, 10, 4, 3),
+    (100, 1000, 4, 100),
+    (0, 1000, 3, 1),
+    (5, 6, 4, 100),
+    (0, 7 * 1024 * 1024 + 1, 4, 2 * 1024 * 1024),
+])
+def test_plan_segments_cover_range_contiguously(start, total, max_segments, segment_size):
+    segments = plan_segments(start, total, max_segments, segment_size)
+    assert segments[0][0] == start
+    assert segments[-1][1] == total - 1
+    for (_, end), (next_start, _) in zip(segments, segments[1:]):
+        assert next_start == end + 1
+    assert all(first <= last for first, last in segments)
+    assert 1 <= len(segments) <= max_segments
+
+
+def test_plan_segments_count_grows_with_size():
+    assert plan_segments(0, 100, 4, 100) == [(0, 99)]
+    assert len(plan_segments(0, 101, 4, 100)) == 2
+    assert len(plan_segments(0, 10000, 4, 100)) == 4
+
+
+@pytest.mark.parametrize('start,total', [(10, 10), (11, 10)])
+def test_plan_segments_empty_when_nothing_left(start, total):
+    assert plan_segments(start, total) == []
+
+
+# ==============================
+# write_at
+# ==============================
+def test_write_at_retries_short_pwrite(tmp_path, monkeypatch):
+    if not hasattr(os, 'pwrite'):
+        pytest.skip('平台没有 os.pwrite')
+    real_pwrite = os.pwrite
+    calls = []
+
+    def short_pwrite(fd, data, position):
+        calls.append(position)
+        return real_pwrite(fd, bytes(data[:3]), position)
+
+    monkeypatch.setattr(os, 'pwrite', short_pwrite)
+    fd = os.open(tmp_path / 'f', os.O_RDWR | os.O_CREAT)
+    try:
+        os.ftruncate(fd, 12)
+        write_at(fd, b'abcdefgh', 4)
+    finally:
+        os.close(fd)
+    assert read(tmp_path / 'f') == b'\0' * 4 + b'abcdefgh'
+    assert calls == [4, 7, 10]
+
+
+def test_write_at_fallback_retries_short_write(tmp_path, monkeypatch):
+    real_write = os.write
+    monkeypatch.delattr(os, 'pwrite', raising=False)
+    monkeypatch.setattr(os, 'write', lambda fd, data: real_write(fd, bytes(data[:2])))
+    fd = os.open(tmp_path / 'f', os.O_RDWR | os.O_CREAT)
+    try:
+        write_at(fd, b'hello', 3)
+    finally:
+        os.close(fd)
+    assert read(tmp_path / 'f') == b'\0' * 3 + b'hello'
+
+
+# ==============================
+# download_once：续传、416、If-Range
+# ==============================
+def test_download_once_resumes_part_file(tmp_path, downloader):
+    data = os.urandom(5000)
+    session = FakeSession(data)
+    use_session(downloader, session)
+    path = str(tmp_path / 'v.mp4')
+    with open(path + PART_SUFFIX, 'wb') as f:
+        f.write(data[:1200])
+    downloader.update_manifest(path, size=len(data), etag='"v1"', complete=False)
+    assert downloader.download_once(URL, path) == len(data) - 1200
+    assert session.requests[-1] == {'Range': 'bytes=1200-', 'If-Range': '"v1"'}
+    assert read(path) == data
+    assert downloader.is_complete(path)
+
+
+def test_download_once_if_range_mismatch_restarts(tmp_path, downloader):
+    """远端文件变了（ETag 不同）时返回 200 整个文件，覆盖而不是追加"""
+    data = os.urandom(5000)
+    use_session(downloader, FakeSession(data, etag='"v2"'))
+    path = str(tmp_path / 'v.mp4')
+    with open(path + PART_SUFFIX, 'wb') as f:
+        f.write(os.urandom(1200))
+    downloader.update_manifest(path, size=len(data), etag='"v1"', complete=False)
+    assert downloader.download_once(URL, path) == len(data)
+    assert read(path) == data
+    assert downloader.manifest_entry(path)['etag'] == '"v2"'
+
+
+def test_download_once_416_with_complete_part(tmp_path, downloader):
+    data = os.urandom(3000)
+    use_session(downloader, FakeSession(data))
+    path = str(tmp_path / 'v.mp4')
+    with open(path + PART_SUFFIX, 'wb') as f:
+        f.write(data)
+    assert downloader.download_once(URL, path) == 0
+    assert read(path) == data
+    assert downloader.is_complete(path)
+
+
+def test_download_once_416_with_oversized_part(tmp_path, downloader):
+    data = os.urandom(3000)
+    use_session(downloader, FakeSession(data))
+    path = str(tmp_path / 'v.mp4')
+    with open(path + PART_SUFFIX, 'wb') as f:
+        f.write(data + b'extra')
+    with pytest.raises(IOError):
+        downloader.download_once(URL, path)
+    assert not os.path.exists(path + PART_SUFFIX)
+    # 重试时从头下载
+    assert downloader.download_once(URL, path) == len(data)
+    assert read(path) == data
+
+
+def test_download_once_without_range_support_keeps_matching_file(tmp_path, downloader):
+    data = os.urandom(3000)
+    session = FakeSession(data, ranges=False)
+    use_session(downloader, session)
+    path = str(tmp_path / 'v.mp4')
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert downloader.download_once(URL, path) == 0
+    assert read(path) == data
+    assert downloader.is_complete(path)
+
+
+# ==============================
+# download_segmented
+# ==============================
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(download_util, 'DOWNLOAD_SEGMENT_SIZE', 1000)
+    monkeypatch.setattr(download_util, 'plan_segments', lambda start, total: plan_segments(start, total, 4, 1000))
+
+
+def test_download_segmented_assembles_file(tmp_path, downloader, small_segments):
+    data = os.urandom(10 * 1000 + 123)
+    session = FakeSession(data)
+    use_session(downloader, session)
+    path = str(tmp_path / 'v.mp4')
+    assert downloader.download_segmented(URL, path) == len(data)
+    assert read(path) == data
+    assert downloader.is_complete(path)
+    assert all(request.get('If-Range') == '"v1"' for request in session.requests[1:])
+    assert len(session.requests) == 5
+
+
+def test_download_segmented_if_range_mismatch_fails(tmp_path, downloader, small_segments):
+    """第一段之后远端文件变了，其余分段收到 200，整次下载失败且不留下 .part"""
+    data = os.urandom(5000)
+    session = FakeSession(data)
+    use_session(downloader, session)
+    real_get = session.get
+
+    def changing_get(url, headers=None, **kwargs):
+        response = real_get(url, headers, **kwargs)
+        session.etag = '"v2"'
+        return response
+
+    session.get = changing_get
+    path = str(tmp_path / 'v.mp4')
+    with pytest.raises(IOError):
+        downloader.download_segmented(URL, path)
+    assert not os.path.exists(path + PART_SUFFIX)
+    assert not os.path.exists(path)
+    # 清单标记为分段下载，退回单连接时不会把预分配的文件当作已下载部分
+    assert downloader.manifest_entry(path)['segmented']
+
+
+def test_download_segmented_without_range_support(tmp_path, downloader, small_segments):
+    use_session(downloader, FakeSession(os.urandom(5000), ranges=False))
+    assert downloader.download_segmented(URL, str(tmp_path / 'v.mp4')) is None
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from starlette.responses import JSONResponse
+
+# 路由分类：按顺序匹配，第一个命中的生效；轻量路由单独限流，避免被慢速爬取挤占
+ROUTE_CLASSES = [
+    ('light', r'^/($|static/|docs|openapi\.json|metrics|admin/|jobs|note/no-watermark/)'),
+    # 视频代理一次播放要持有名额直到流结束，单独成类，避免几个播放器就把图片缩略图的名额占满
+    ('video', r'^/proxy/video'),
+    ('media', r'^/proxy/'),
+    ('heavy', r'(/stream$|/batch$|/by-num$|^/note/comments(/inner/all)?$|^/user/(notes|likes|collections)$|^/message/(mentions|likes-collects|new-connections)$)'),
+    ('default', r''),
+]
+
+# 每类的默认配置 (最大并发, 最大排队数, 排队超时秒数)，可用环境变量 XHS_ADMISSION_<类名大写>="并发:排队:超时" 覆盖
+ADMISSION_DEFAULTS = {
+    'light': (32, 64, 5),
+    'video': (32, 16, 10),
+    'media': (16, 32, 10),
+    'heavy': (4, 8, 30),
+    'default': (16, 32, 15),
+}
+
+
+class AdmissionLimiter():
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        """
+        单个路由类别的准入控制：并发上限 + 有界等待队列
+        :param name: 类别名
+        :param max_concurrent: 最大并发数
+        :param max_queue: 最大排队数，队列满时直接拒绝
+        :param queue_timeout: 排队超时秒数，超时后拒绝
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = deque()
+        self.avg_duration = 1.0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    async def acquire(self):
+        """
+        申请一个并发名额
+        返回 'ok' 表示获得名额，'full' 表示队列已满，'timeout' 表示排队超时
+        """
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return 'ok'
+        if len(self.waiters) >= self.max_queue:
+            self.rejected_full += 1
+            return 'full'
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时的同时恰好被唤醒，名额已转交给自己，需要还回去
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_timeout += 1
+            return 'timeout'
+        self.admitted += 1
+        return 'ok'
+
+    def release(self, duration: float = None):
+        """释放名额；有人排队时直接把名额转交给队首"""
+        if duration is not None:
+            self.avg_duration = 0.9 * self.avg_duration + 0.1 * duration
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def retry_after(self):
+        """按平均耗时估算排队清空所需的秒数"""
+        backlog = len(self.waiters) + self.active
+        return max(1, int(self.avg_duration * backlog / self.max_concurrent + 0.5))
+
+    def stats(self):
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queued': len(self.waiters),
+            'avg_duration': round(self.avg_duration, 3),
+            'admitted': self.admitted,
+            'rejected_full': self.rejected_full,
+            'rejected_timeout': self.rejected_timeout,
+        }
+
+
+class AdmissionController():
+    def __init__(self, route_classes: list = None, defaults: dict = None):
+        """
+        按路由类别分配独立的 AdmissionLimiter
+        :param route_classes: [(类名, 路径正则)]
+        :param defaults: {类名: (最大并发, 最大排队数, 排队超时秒数)}
+        """
+        self.route_classes = [(name, re.compile(pattern)) for name, pattern in (route_classes or ROUTE_CLASSES)]
+        self.limiters = {}
+        for name, config in (defaults or ADMISSION_DEFAULTS).items():
+            env = os.getenv(f'XHS_ADMISSION_{name.upper()}')
+            if env:
+                max_concurrent, max_queue, queue_timeout = env.split(':')
+                config = (int(max_concurrent), int(max_queue), float(queue_timeout))
+            self.limiters[name] = AdmissionLimiter(name, *config)
+
+    def classify(self, path: str):
+        for name, pattern in self.route_classes:
+            if pattern.search(path):
+                return name
+        return 'default'
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+
+class AdmissionMiddleware():
+    def __init__(self, app, controller: AdmissionController):
+        """
+        ASGI 中间件：名额持有到响应体发送完毕（包括流式响应），满载时立即返回 429/503 和 Retry-After
+        """
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        limiter = self.controller.limiters[self.controller.classify(scope['path'])]
+        result = await limiter.acquire()
+        if result != 'ok':
+            status_code, msg = (429, '请求过多，排队已满') if result == 'full' else (503, '服务繁忙，排队超时')
+            response = JSONResponse({'success': False, 'msg': f'{msg}，请稍后重试', 'data': None}, status_code=status_code,
+                                    headers={'Retry-After': str(limiter.retry_after())})
+            await response(scope, receive, send)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - start)
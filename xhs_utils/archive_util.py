@@ -0,0 +1,182 @@
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+
+# 单个分片写到这个大小后换下一个分片，同一篇笔记不会跨分片
+ARCHIVE_SHARD_MAX_BYTES = int(os.getenv('XHS_ARCHIVE_SHARD_MAX_BYTES', 1024 * 1024 * 1024))
+ARCHIVE_INDEX_NAME = 'index.db'
+ARCHIVE_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def tar_data_size(size: int):
+    """tar 成员数据按 512 字节块对齐后占用的大小"""
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+class NoteArchive():
+    def __init__(self, root: str, shard_max_bytes: int = ARCHIVE_SHARD_MAX_BYTES):
+        """
+        分片归档：每篇笔记的 info.json、detail.txt 和媒体文件顺序追加到当前 tar 分片，
+        写满后换下一个分片；SQLite 索引记录每个文件所在的分片、偏移和大小，读取时直接定位，不用扫描分片
+        分片是标准 tar 格式，可以直接用 tar 命令查看和解压
+        :param root: 归档目录
+        :param shard_max_bytes: 单个分片的大小上限
+        """
+        self.root = root
+        self.shard_max_bytes = shard_max_bytes
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, ARCHIVE_INDEX_NAME), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS notes (
+                note_id TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                archived_at REAL NOT NULL
+            )''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS members (
+                note_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (note_id, name)
+            )''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS notes_shard ON notes (shard)')
+        self.tar = None
+        self.shard = None
+
+    def shard_path(self, shard: int):
+        return os.path.join(self.root, f'shard-{shard:05d}.tar')
+
+    def open_shard(self):
+        """
+        打开最后一个分片继续追加：先截断到索引记录的末尾，
+        去掉上次关闭时写的结束块和进程中断时写了一半的成员
+        """
+        row = self.conn.execute('SELECT MAX(shard) AS shard FROM notes').fetchone()
+        shard = row['shard'] or 0
+        row = self.conn.execute('SELECT MAX(offset + length) AS end FROM notes WHERE shard = ?', (shard,)).fetchone()
+        end = row['end'] or 0
+        if end >= self.shard_max_bytes:
+            shard, end = shard + 1, 0
+        path = self.shard_path(shard)
+        fileobj = open(path, mode='r+b' if os.path.exists(path) else 'wb')
+        fileobj.truncate(end)
+        fileobj.seek(end)
+        self.tar = tarfile.open(fileobj=fileobj, mode='w', format=tarfile.PAX_FORMAT)
+        self.shard = shard
+
+    def close_shard(self):
+        if self.tar is not None:
+            fileobj = self.tar.fileobj
+            self.tar.close()
+            fileobj.close()
+            self.tar = None
+
+    def write_note(self, note_id: str, files: list):
+        """
+        把一篇笔记的文件追加到当前分片并写入索引，重复写入时索引指向最新的一份
+        :param note_id: 笔记 id
+        :param files: [(文件名, bytes 内容或本地文件路径)]
+        """
+        with self.lock:
+            if self.tar is None:
+                self.open_shard()
+            elif self.tar.offset >= self.shard_max_bytes:
+                self.close_shard()
+                self.open_shard()
+            start = self.tar.offset
+            members = []
+            for name, data in files:
+                info = tarfile.TarInfo(f'{note_id}/{name}')
+                info.mtime = int(time.time())
+                if isinstance(data, bytes):
+                    info.size = len(data)
+                    self.tar.addfile(info, io.BytesIO(data))
+                else:
+                    info.size = os.path.getsize(data)
+                    with open(data, mode='rb') as f:
+                        self.tar.addfile(info, f)
+                members.append((note_id, name, self.shard, self.tar.offset - tar_data_size(info.size), info.size))
+            # 写模式下 TarFile 会一直累积成员列表，这里用不到，清掉避免大分片占用内存
+            self.tar.members = []
+            # 数据落盘后再写索引，中断时索引里不会有指向半截数据的记录
+            self.tar.fileobj.flush()
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO notes (note_id, shard, offset, length, archived_at) VALUES (?, ?, ?, ?, ?)',
+                                  (note_id, self.shard, start, self.tar.offset - start, time.time()))
+                self.conn.execute('DELETE FROM members WHERE note_id = ?', (note_id,))
+                self.conn.executemany('INSERT INTO members (note_id, name, shard, offset, size) VALUES (?, ?, ?, ?, ?)', members)
+
+    def has(self, note_id: str):
+        with self.lock:
+            return self.conn.execute('SELECT 1 FROM notes WHERE note_id = ?', (note_id,)).fetchone() is not None
+
+    def members(self, note_id: str):
+        """列出一篇笔记归档的文件 [{name, size}]，不存在时返回空列表"""
+        with self.lock:
+            rows = self.conn.execute('SELECT name, size FROM members WHERE note_id = ? ORDER BY rowid', (note_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def locate(self, note_id: str, name: str):
+        with self.lock:
+            return self.conn.execute('SELECT shard, offset, size FROM members WHERE note_id = ? AND name = ?', (note_id, name)).fetchone()
+
+    def iter_member(self, note_id: str, name: str, chunk_size: int = ARCHIVE_READ_CHUNK_SIZE):
+        """按索引定位并分块读取一个文件，不存在时返回 None"""
+        row = self.locate(note_id, name)
+        if row is None:
+            return None
+
+        def chunks():
+            remaining = row['size']
+            with open(self.shard_path(row['shard']), mode='rb') as f:
+                f.seek(row['offset'])
+                while remaining > 0:
+                    data = f.read(min(chunk_size, remaining))
+                    if not data:
+                        raise IOError(f'分片 {row["shard"]} 已损坏: {note_id}/{name}')
+                    remaining -= len(data)
+                    yield data
+
+        return chunks()
+
+    def read(self, note_id: str, name: str):
+        chunks = self.iter_member(note_id, name)
+        return None if chunks is None else b''.join(chunks)
+
+    def get_note(self, note_id: str):
+        """读取笔记的 info.json，不存在时返回 None"""
+        data = self.read(note_id, 'info.json')
+        return None if data is None else json.loads(data)
+
+    def close(self):
+        """写入 tar 结束块并关闭当前分片，下次写入时重新打开"""
+        with self.lock:
+            self.close_shard()
+
+    def stats(self):
+        with self.lock:
+            row = self.conn.execute('SELECT COUNT(*) AS notes, COUNT(DISTINCT shard) AS shards, COALESCE(SUM(length), 0) AS bytes FROM notes').fetchone()
+        return dict(row, root=self.root, current_shard=self.shard)
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def get_note_archive(root: str):
+    """同一个目录在进程内只打开一个归档，多个爬取任务共用"""
+    root = os.path.abspath(root)
+    with _archives_lock:
+        if root not in _archives:
+            _archives[root] = NoteArchive(root)
+        return _archives[root]
@@ -0,0 +1,21 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_MAX_ITEMS = int(os.getenv('XHS_BATCH_MAX_ITEMS', 50))
+BATCH_WORKERS = int(os.getenv('XHS_BATCH_WORKERS', 8))
+
+
+def run_batch(func, items, max_workers=BATCH_WORKERS):
+    """
+    用有界线程池并发执行 func，结果按输入顺序返回，工作线程沿用调用方的上游调度通道和租户
+    :param func: 单个条目的处理函数，需自行捕获异常，返回值原样放入结果列表（接口里返回 {success, msg, data} 字典）
+    :param items: 条目列表
+    :param max_workers: 最大并发数
+    """
+    items = list(items)
+    if not items:
+        return []
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(lambda context, item: context.run(func, item), contexts, items))
@@ -2,6 +2,10 @@ import os
 from loguru import logger
 from dotenv import load_dotenv
 
+# 归档目录和 parquet 目录在第一次使用时才创建
+ARCHIVE_BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/archive_datas'))
+PARQUET_BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/parquet_datas'))
+
 def load_env():
     load_dotenv()
     cookies_str = os.getenv('COOKIES')
@@ -18,5 +22,7 @@ def init():
     base_path = {
         'media': media_base_path,
         'excel': excel_base_path,
+        'archive': ARCHIVE_BASE_PATH,
+        'parquet': PARQUET_BASE_PATH,
     }
     return cookies_str, base_path
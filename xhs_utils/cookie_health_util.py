@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+import time
+from xhs_utils.cookie_util import COOKIE_ALIASES, mask_a1, trans_cookies
+
+# 检查结果的有效期（秒），过期后下次预检重新请求
+COOKIE_HEALTH_TTL = int(os.getenv('XHS_COOKIE_HEALTH_TTL', 600))
+# 判定为失效后多久内直接拒绝使用这份 cookies
+COOKIE_DEAD_TTL = int(os.getenv('XHS_COOKIE_DEAD_TTL', 3600))
+# 表示 cookies 已失效的业务 code：-100 登录已过期，300011 账号异常
+DEAD_RESPONSE_CODES = {-100, 300011}
+
+
+class CookieDeadError(Exception):
+    pass
+
+
+def health_key(cookies: dict):
+    """
+    健康状态按 (a1, web_session) 区分：a1 是设备标识，重新登录后不变，
+    只按 a1 记录会让重新登录后的新 web_session 也被当成失效
+    """
+    a1 = cookies.get('a1')
+    if not a1:
+        return None
+    web_session = cookies.get('web_session', '')
+    return f"{a1}:{hashlib.sha1(web_session.encode('utf-8')).hexdigest()[:12]}"
+
+
+class CookieHealthRegistry():
+    def __init__(self, ttl: int = COOKIE_HEALTH_TTL, dead_ttl: int = COOKIE_DEAD_TTL):
+        """
+        按 a1 + web_session 记录每份 cookies 的健康状态：预检主动检查一次并缓存，正常请求的响应结果被动更新，
+        已知失效的 cookies 在签名前就被拒绝，不浪费签名和上游配额
+        :param ttl: 存活结果的有效期
+        :param dead_ttl: 失效结果的有效期
+        """
+        self.ttl = ttl
+        self.dead_ttl = dead_ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.rejected = 0
+
+    def entry_for(self, key: str, a1: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = {
+                'a1': a1, 'session': key.split(':')[-1], 'status': 'unknown', 'source': None, 'checked_at': 0, 'last_code': None, 'last_msg': '',
+                'successes': 0, 'failures': 0, 'rejected': 0, 'checking': 0,
+            }
+        return entry
+
+    def is_fresh(self, entry: dict):
+        ttl = self.dead_ttl if entry['status'] == 'dead' else self.ttl
+        return entry['status'] != 'unknown' and time.time() - entry['checked_at'] < ttl
+
+    def mark(self, cookies: dict, alive: bool, source: str, code=None, msg: str = '', count: bool = True):
+        with self.lock:
+            if len(self.entries) > 1000:
+                self.entries = {key: entry for key, entry in self.entries.items() if self.is_fresh(entry)}
+            entry = self.entry_for(health_key(cookies), cookies['a1'])
+            entry.update(status='alive' if alive else 'dead', source=source, checked_at=time.time(), last_code=code, last_msg=msg)
+            if count:
+                if alive:
+                    entry['successes'] += 1
+                else:
+                    entry['failures'] += 1
+
+    def ensure_alive(self, cookies: dict):
+        """签名前调用：已知失效且未过期的 cookies 直接抛出 CookieDeadError"""
+        a1 = cookies.get('a1')
+        with self.lock:
+            entry = self.entries.get(health_key(cookies))
+            # 正在预检时放行，预检请求自己也要经过这里
+            if entry is None or entry['checking'] or entry['status'] != 'dead' or not self.is_fresh(entry):
+                return
+            entry['rejected'] += 1
+            self.rejected += 1
+            msg = entry['last_msg']
+        raise CookieDeadError(f'cookies 已失效（a1={mask_a1(a1)}，{msg}），请更换 cookies 后重试')
+
+    def record(self, cookies: dict, response):
+        """响应钩子：按正常请求的结果被动更新健康状态"""
+        if not cookies or not cookies.get('a1') or response.status_code != 200:
+            return
+        try:
+            res_json = response.json()
+        except ValueError:
+            return
+        if res_json.get('success'):
+            self.mark(cookies, True, 'passive')
+        elif res_json.get('code') in DEAD_RESPONSE_CODES:
+            self.mark(cookies, False, 'passive', res_json.get('code'), res_json.get('msg', ''))
+
+    def preflight(self, cookies_str: str, checker, force: bool = False):
+        """
+        预检 cookies 是否可用，结果在有效期内直接复用
+        :param checker: 无参函数，发出一次轻量请求并返回 (success, msg, res_json)
+        :param force: 忽略缓存重新检查
+        返回 (success, msg, 健康记录)
+        """
+        if cookies_str in COOKIE_ALIASES:
+            return True, '别名 cookies 不做预检', None
+        cookies = trans_cookies(cookies_str)
+        key = health_key(cookies)
+        if not key:
+            return False, 'cookies 中缺少 a1', None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not force and self.is_fresh(entry):
+                return entry['status'] == 'alive', entry['last_msg'] or '成功', self.public_entry(entry)
+            if entry is not None:
+                # 只标记正在检查，原状态保留：无法判断的结果不覆盖已知的失效
+                entry['checking'] += 1
+        try:
+            success, msg, res_json = checker()
+        finally:
+            if entry is not None:
+                with self.lock:
+                    entry['checking'] -= 1
+        code = res_json.get('code') if isinstance(res_json, dict) else None
+        # 预检请求本身已经被响应钩子计过数，这里只更新状态
+        if success:
+            self.mark(cookies, True, 'preflight', code, msg, count=False)
+        elif code in DEAD_RESPONSE_CODES:
+            self.mark(cookies, False, 'preflight', code, msg, count=False)
+        else:
+            # 网络错误等无法判断的情况不缓存
+            return False, f'cookies 预检失败: {msg}', None
+        with self.lock:
+            return success, msg, self.public_entry(self.entries[key])
+
+    def public_entry(self, entry: dict):
+        return dict(entry, a1=mask_a1(entry['a1']), fresh=self.is_fresh(entry))
+
+    def table(self):
+        with self.lock:
+            return {
+                'ttl': self.ttl,
+                'dead_ttl': self.dead_ttl,
+                'rejected': self.rejected,
+                'accounts': [self.public_entry(entry) for entry in self.entries.values()],
+            }
+
+
+cookie_health = CookieHealthRegistry()
@@ -1,6 +1,29 @@
+# cookies 别名：调用方传入别名（如 "guest"）时，由注册的函数换成一份真实的 cookies 字符串
+COOKIE_ALIASES = {}
+
+
+def register_cookie_alias(name, provider):
+    """
+    注册 cookies 别名
+    :param name: 别名
+    :param provider: 无参函数，返回 cookies 字符串
+    """
+    COOKIE_ALIASES[name] = provider
+
+
+def resolve_cookies(cookies_str):
+    provider = COOKIE_ALIASES.get(cookies_str.strip()) if cookies_str else None
+    return provider() if provider is not None else cookies_str
+
+
 def trans_cookies(cookies_str):
     if '; ' in cookies_str:
         ck = {i.split('=')[0]: '='.join(i.split('=')[1:]) for i in cookies_str.split('; ')}
     else:
         ck = {i.split('=')[0]: '='.join(i.split('=')[1:]) for i in cookies_str.split(';')}
     return ck
+
+
+def mask_a1(a1):
+    """日志和接口里展示 a1 时只保留首尾"""
+    return f'{a1[:6]}***{a1[-4:]}' if a1 and len(a1) > 10 else '***'
@@ -1,11 +1,14 @@
 import json
 import os
 import re
+import shutil
+import tempfile
 import time
-import openpyxl
-import requests
 from loguru import logger
-from retry import retry
+from xhs_utils.excel_util import StreamingXlsxWriter
+from xhs_utils.download_util import get_media_downloader, DOWNLOAD_MANIFEST
+from xhs_utils.media_store_util import get_media_store
+from xhs_utils.video_cache_util import VIDEO_CACHE_ON_DOWNLOAD, get_video_cache
 
 
 def norm_str(str):
@@ -175,35 +178,42 @@ def handle_comment_info(data):
         'ip_location': ip_location,
         'pictures': pictures,
     }
+def comment_records(note_url: str, comments):
+    """一级评论连同已展开的二级评论一起整理，comments 可以是生成器"""
+    for comment in comments:
+        for item in [comment] + comment.get('sub_comments', []):
+            yield handle_comment_info(dict(item, note_url=note_url))
+
 def save_to_xlsx(datas, file_path, type='note'):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    if type == 'note':
-        headers = ['笔记id', '笔记url', '笔记类型', '用户id', '用户主页url', '昵称', '头像url', '标题', '描述', '点赞数量', '收藏数量', '评论数量', '分享数量', '视频封面url', '视频地址url', '图片地址url列表', '标签', '上传时间', 'ip归属地']
-    elif type == 'user':
-        headers = ['用户id', '用户主页url', '用户名', '头像url', '小红书号', '性别', 'ip地址', '介绍', '关注数量', '粉丝数量', '作品被赞和收藏数量', '标签']
-    else:
-        headers = ['笔记id', '笔记url', '评论id', '用户id', '用户主页url', '昵称', '头像url', '评论内容', '评论标签', '点赞数量', '上传时间', 'ip归属地', '图片地址url列表']
-    ws.append(headers)
-    for data in datas:
-        data = {k: norm_text(str(v)) for k, v in data.items()}
-        ws.append(list(data.values()))
-    wb.save(file_path)
-    logger.info(f'数据保存至 {file_path}')
+    # 流式写入，datas 可以是生成器，超过行数上限自动拆分工作表/文件
+    with StreamingXlsxWriter(file_path, type) as writer:
+        writer.extend(datas)
+    logger.info(f'数据保存至 {writer.file_paths}')
+    return writer.file_paths
 
 def download_media(path, name, url, type):
+    downloader = get_media_downloader()
+    file_path = path + '/' + name + ('.jpg' if type == 'image' else '.mp4')
+    store = get_media_store()
+    key = None
+    if store is not None:
+        if downloader.is_complete(file_path):
+            return
+        key = store.key_for_url(url)
+        if store.has(key):
+            # 媒体库里已经有这个媒体，不发请求，直接链接到笔记目录
+            # 不支持硬链接时笔记目录里没有这个文件，只在清单里记录对应的对象
+            store.link_into(key, file_path)
+            downloader.update_manifest(file_path, size=os.path.getsize(store.object_path(key)), etag=None, complete=True, object=key)
+            return
     if type == 'image':
-        content = requests.get(url).content
-        with open(path + '/' + name + '.jpg', mode="wb") as f:
-            f.write(content)
+        downloader.download(url, file_path)
     elif type == 'video':
-        res = requests.get(url, stream=True)
-        size = 0
-        chunk_size = 1024 * 1024
-        with open(path + '/' + name + '.mp4', mode="wb") as f:
-            for data in res.iter_content(chunk_size=chunk_size):
-                f.write(data)
-                size += len(data)
+        # 开启 XHS_VIDEO_CACHE_ON_DOWNLOAD 时经过分块缓存下载，已经通过 /proxy/video 看过的部分不再重复请求
+        downloader.download(url, file_path, segmented=True, cache=get_video_cache() if VIDEO_CACHE_ON_DOWNLOAD else None)
+    if store is not None:
+        entry = downloader.manifest_entry(file_path) or {}
+        downloader.update_manifest(file_path, **dict(entry, object=store.adopt(file_path, key)))
 
 def save_user_detail(user, path):
     with open(f'{path}/detail.txt', mode="w", encoding="utf-8") as f:
@@ -221,32 +231,48 @@ def save_user_detail(user, path):
         f.write(f"作品被赞和收藏数量: {user['interaction']}\n")
         f.write(f"标签: {user['tags']}\n")
 
+def write_text_if_changed(file_path, text):
+    """内容没变就不写，变了先写临时文件再替换，重跑爬取和重试都不会留下半截文件"""
+    try:
+        with open(file_path, mode="r", encoding="utf-8") as f:
+            if f.read() == text:
+                return
+    except (OSError, UnicodeDecodeError):
+        pass
+    with open(file_path + '.tmp', mode="w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(file_path + '.tmp', file_path)
+
+def note_detail_text(note):
+    lines = [
+        f"笔记id: {note['note_id']}",
+        f"笔记url: {note['note_url']}",
+        f"笔记类型: {note['note_type']}",
+        f"用户id: {note['user_id']}",
+        f"用户主页url: {note['home_url']}",
+        f"昵称: {note['nickname']}",
+        f"头像url: {note['avatar']}",
+        f"标题: {note['title']}",
+        f"描述: {note['desc']}",
+        f"点赞数量: {note['liked_count']}",
+        f"收藏数量: {note['collected_count']}",
+        f"评论数量: {note['comment_count']}",
+        f"分享数量: {note['share_count']}",
+        f"视频封面url: {note['video_cover']}",
+        f"视频地址url: {note['video_addr']}",
+        f"图片地址url列表: {note['image_list']}",
+        f"标签: {note['tags']}",
+        f"上传时间: {note['upload_time']}",
+        f"ip归属地: {note['ip_location']}",
+    ]
+    # 逐行输出到txt里
+    return ''.join(line + '\n' for line in lines)
+
 def save_note_detail(note, path):
-    with open(f'{path}/detail.txt', mode="w", encoding="utf-8") as f:
-        # 逐行输出到txt里
-        f.write(f"笔记id: {note['note_id']}\n")
-        f.write(f"笔记url: {note['note_url']}\n")
-        f.write(f"笔记类型: {note['note_type']}\n")
-        f.write(f"用户id: {note['user_id']}\n")
-        f.write(f"用户主页url: {note['home_url']}\n")
-        f.write(f"昵称: {note['nickname']}\n")
-        f.write(f"头像url: {note['avatar']}\n")
-        f.write(f"标题: {note['title']}\n")
-        f.write(f"描述: {note['desc']}\n")
-        f.write(f"点赞数量: {note['liked_count']}\n")
-        f.write(f"收藏数量: {note['collected_count']}\n")
-        f.write(f"评论数量: {note['comment_count']}\n")
-        f.write(f"分享数量: {note['share_count']}\n")
-        f.write(f"视频封面url: {note['video_cover']}\n")
-        f.write(f"视频地址url: {note['video_addr']}\n")
-        f.write(f"图片地址url列表: {note['image_list']}\n")
-        f.write(f"标签: {note['tags']}\n")
-        f.write(f"上传时间: {note['upload_time']}\n")
-        f.write(f"ip归属地: {note['ip_location']}\n")
+    write_text_if_changed(f'{path}/detail.txt', note_detail_text(note))
 
 
 
-@retry(tries=3, delay=1)
 def download_note(note_info, path, save_choice):
     note_id = note_info['note_id']
     user_id = note_info['user_id']
@@ -258,19 +284,50 @@ def download_note(note_info, path, save_choice):
         title = f'无标题'
     save_path = f'{path}/{nickname}_{user_id}/{title}_{note_id}'
     check_and_create_path(save_path)
-    with open(f'{save_path}/info.json', mode='w', encoding='utf-8') as f:
-        f.write(json.dumps(note_info) + '\n')
+    write_text_if_changed(f'{save_path}/info.json', json.dumps(note_info) + '\n')
     note_type = note_info['note_type']
     save_note_detail(note_info, save_path)
+    tasks = []
     if note_type == '图集' and save_choice in ['media', 'media-image', 'all']:
         for img_index, img_url in enumerate(note_info['image_list']):
-            download_media(save_path, f'image_{img_index}', img_url, 'image')
+            tasks.append((save_path, f'image_{img_index}', img_url, 'image'))
     elif note_type == '视频' and save_choice in ['media', 'media-video', 'all']:
-        download_media(save_path, 'cover', note_info['video_cover'], 'image')
-        download_media(save_path, 'video', note_info['video_addr'], 'video')
+        tasks.append((save_path, 'cover', note_info['video_cover'], 'image'))
+        tasks.append((save_path, 'video', note_info['video_addr'], 'video'))
+    # 同一篇笔记的媒体并行下载，线程池和每个域名的连接数在所有笔记之间共享；
+    # 每个文件各自重试和续传，已下载完整的文件直接跳过
+    results = get_media_downloader().run_many(download_media, tasks)
+    failed = [(task[1], msg) for task, (success, msg, _) in zip(tasks, results) if not success]
+    if failed:
+        raise Exception(f'笔记 {note_id} 有 {len(failed)} 个文件下载失败: {failed}')
     return save_path
 
 
+def archive_note(note_info, archive, save_choice):
+    """
+    归档模式：笔记信息和媒体追加到分片归档，不再为每篇笔记建目录
+    save_choice 为 archive 时只归档信息，archive-media 时连同媒体一起归档；已归档的笔记直接跳过
+    """
+    note_id = note_info['note_id']
+    if archive.has(note_id):
+        return note_id
+    if save_choice != 'archive-media':
+        archive.write_note(note_id, [
+            ('info.json', (json.dumps(note_info) + '\n').encode('utf-8')),
+            ('detail.txt', note_detail_text(note_info).encode('utf-8')),
+        ])
+        return note_id
+    # 媒体先下载到临时目录（沿用并行、续传、媒体库去重），归档后删除
+    staging_path = tempfile.mkdtemp(prefix='staging-', dir=archive.root)
+    try:
+        save_path = download_note(note_info, staging_path, 'media')
+        names = ['info.json', 'detail.txt'] + sorted(name for name in os.listdir(save_path) if name not in ('info.json', 'detail.txt', DOWNLOAD_MANIFEST))
+        archive.write_note(note_id, [(name, os.path.join(save_path, name)) for name in names])
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)
+    return note_id
+
+
 def check_and_create_path(path):
     if not os.path.exists(path):
         os.makedirs(path)
@@ -0,0 +1,403 @@
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from xhs_utils.video_cache_util import iter_cached_range_sync
+
+DOWNLOAD_WORKERS = int(os.getenv('XHS_DOWNLOAD_WORKERS', 8))
+DOWNLOAD_PER_HOST = int(os.getenv('XHS_DOWNLOAD_PER_HOST', 6))
+DOWNLOAD_TIMEOUT = (10, 60)
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://www.xiaohongshu.com/",
+}
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# 单个文件的重试次数，间隔按 1s、2s、4s... 退避
+DOWNLOAD_RETRIES = int(os.getenv('XHS_DOWNLOAD_RETRIES', 3))
+DOWNLOAD_BACKOFF = float(os.getenv('XHS_DOWNLOAD_BACKOFF', 1))
+# 每个笔记目录下记录已下载文件大小和 ETag 的清单，重跑时据此跳过
+DOWNLOAD_MANIFEST = '.media.json'
+PART_SUFFIX = '.part'
+# 4xx 里只有超时和限流值得重试
+RETRYABLE_STATUS_CODES = {408, 429}
+CONTENT_RANGE_TOTAL_RE = re.compile(r'bytes (?:\d+-\d+|\*)/(\d+)')
+CONTENT_RANGE_START_RE = re.compile(r'bytes (\d+)-\d+/\d+')
+# 视频分段并行下载：第一段兼作探测请求，剩余部分按每段不小于 SEGMENT_SIZE 切分，最多 DOWNLOAD_SEGMENTS 段
+DOWNLOAD_SEGMENTS = int(os.getenv('XHS_DOWNLOAD_SEGMENTS', 4))
+DOWNLOAD_SEGMENT_SIZE = int(os.getenv('XHS_DOWNLOAD_SEGMENT_SIZE', 2 * 1024 * 1024))
+_seek_write_lock = threading.Lock()
+
+
+def write_at(fd: int, data: bytes, position: int):
+    """按位置写入，不移动共享的文件指针；没有 os.pwrite 的平台（Windows）加锁后 seek 再写"""
+    view = memoryview(data)
+    if hasattr(os, 'pwrite'):
+        while view:
+            written = os.pwrite(fd, view, position)
+            view = view[written:]
+            position += written
+    else:
+        with _seek_write_lock:
+            os.lseek(fd, position, os.SEEK_SET)
+            while view:
+                view = view[os.write(fd, view):]
+
+
+def plan_segments(start: int, total: int, max_segments: int = DOWNLOAD_SEGMENTS, segment_size: int = DOWNLOAD_SEGMENT_SIZE):
+    """
+    把 [start, total) 切成若干段，段数随文件大小增加，每段不小于 segment_size
+    返回 [(起始, 结束)]，结束位置包含在内
+    """
+    remaining = total - start
+    if remaining <= 0:
+        return []
+    count = max(1, min(max_segments, -(-remaining // segment_size)))
+    step = -(-remaining // count)
+    return [(offset, min(offset + step, total) - 1) for offset in range(start, total, step)]
+
+
+class MediaDownloader():
+    def __init__(self, max_workers: int = DOWNLOAD_WORKERS, per_host: int = DOWNLOAD_PER_HOST):
+        """
+        媒体下载器：每个 CDN 域名一个带连接池的 Session 并限制同时下载数，
+        所有笔记共用一个有界线程池，同一笔记的多张图片并行下载，统一流式写盘
+        :param max_workers: 全局同时下载的文件数
+        :param per_host: 单个域名同时下载的文件数
+        """
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='media-download')
+        # 分段请求单独一个线程池，避免占满下载线程池后互相等待
+        self.segment_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='media-segment')
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.host_limits = {}
+        self.manifest_lock = threading.Lock()
+        self.files = 0
+        self.failures = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.retries = 0
+        self.segmented = 0
+        self.bytes = 0
+        self.active = 0
+        self.busy_time = 0.0
+        self.busy_since = None
+
+    def session_for(self, url: str):
+        """返回该域名的 Session 和并发信号量"""
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(DOWNLOAD_HEADERS)
+                self.sessions[host] = session
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self.sessions[host], self.host_limits[host]
+
+    def begin(self):
+        with self.lock:
+            if self.active == 0:
+                self.busy_since = time.monotonic()
+            self.active += 1
+
+    def end(self, size: int, success: bool):
+        with self.lock:
+            self.active -= 1
+            if self.active == 0:
+                self.busy_time += time.monotonic() - self.busy_since
+            self.bytes += size
+            if success:
+                self.files += 1
+
+    def manifest_entry(self, file_path: str):
+        """读取文件在清单中的记录：{'size', 'etag', 'complete'}"""
+        directory, name = os.path.split(file_path)
+        with self.manifest_lock:
+            return self.load_manifest(directory).get(name)
+
+    def update_manifest(self, file_path: str, **entry):
+        directory, name = os.path.split(file_path)
+        with self.manifest_lock:
+            manifest = self.load_manifest(directory)
+            manifest[name] = entry
+            tmp_path = os.path.join(directory, DOWNLOAD_MANIFEST + '.tmp')
+            with open(tmp_path, mode='w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(directory, DOWNLOAD_MANIFEST))
+
+    def load_manifest(self, directory: str):
+        try:
+            with open(os.path.join(directory, DOWNLOAD_MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def is_complete(self, file_path: str):
+        """文件存在且大小与清单记录一致"""
+        entry = self.manifest_entry(file_path)
+        return bool(entry and entry.get('complete') and os.path.exists(file_path) and os.path.getsize(file_path) == entry['size'])
+
+    def finish(self, file_path: str, size: int, etag: str = None):
+        """.part 写完后改名为正式文件并记入清单"""
+        os.replace(file_path + PART_SUFFIX, file_path)
+        self.update_manifest(file_path, size=size, etag=etag, complete=True)
+
+    def download(self, url: str, file_path: str, segmented: bool = False, cache=None):
+        """
+        下载一个文件并按退避重试，返回本次写入的字节数，最终失败时抛出异常
+        已完整下载过的文件直接跳过；中断留下的 .part 文件用 Range 续传
+        :param url: 媒体地址
+        :param file_path: 保存路径
+        :param segmented: 是否分段并行下载（用于视频等大文件），服务端不支持 Range 时自动退回单连接
+        :param cache: VideoChunkCache，传入时经过分块缓存下载，已缓存的块不再请求，重试时只补缺失的块
+        """
+        if self.is_complete(file_path):
+            with self.lock:
+                self.skipped += 1
+            return 0
+        attempt = 0
+        while True:
+            try:
+                if cache is not None:
+                    size = self.download_cached(url, file_path, cache)
+                    if size is not None:
+                        return size
+                if segmented and not os.path.exists(file_path) and not os.path.exists(file_path + PART_SUFFIX):
+                    size = self.download_segmented(url, file_path)
+                    if size is not None:
+                        return size
+                return self.download_once(url, file_path)
+            except Exception as e:
+                status_code = e.response.status_code if isinstance(e, requests.HTTPError) and e.response is not None else None
+                retryable = status_code is None or status_code >= 500 or status_code in RETRYABLE_STATUS_CODES
+                if not retryable or attempt >= DOWNLOAD_RETRIES:
+                    with self.lock:
+                        self.failures += 1
+                    raise
+                delay = DOWNLOAD_BACKOFF * 2 ** attempt
+                attempt += 1
+                with self.lock:
+                    self.retries += 1
+                logger.warning(f'下载 {os.path.basename(file_path)} 失败，{delay:.0f}s 后第 {attempt} 次重试: {e}')
+                time.sleep(delay)
+
+    def download_cached(self, url: str, file_path: str, cache):
+        """
+        经过视频分块缓存下载：已缓存的块读本地，缺失的块用 Range 请求补齐并写入缓存，按顺序写入 .part 后改名
+        服务端不支持 Range 时返回 None
+        """
+        session, limit = self.session_for(url)
+        size = 0
+        success = False
+        self.begin()
+        try:
+            with limit:
+                cached = iter_cached_range_sync(cache, url, session, timeout=DOWNLOAD_TIMEOUT)
+                if cached is None:
+                    return None
+                total, chunks = cached
+                with open(file_path + PART_SUFFIX, mode='wb') as f:
+                    for data in chunks:
+                        f.write(data)
+                        size += len(data)
+            if size != total:
+                raise IOError(f'下载不完整: {size}/{total}')
+            self.finish(file_path, size)
+            success = True
+            return size
+        finally:
+            self.end(size, success)
+
+    def download_segmented(self, url: str, file_path: str):
+        """
+        分段并行下载：先请求第一段拿到文件总大小和 ETag，预分配 .part 文件，
+        其余部分切成若干段同时请求并按位置写入，全部写满后再改名
+        服务端不支持 Range 时返回 None
+        """
+        part_path = file_path + PART_SUFFIX
+        session, limit = self.session_for(url)
+        size = 0
+        success = False
+        fd = None
+        self.begin()
+        try:
+            with limit:
+                with session.get(url, headers={'Range': f'bytes=0-{DOWNLOAD_SEGMENT_SIZE - 1}'}, stream=True, timeout=DOWNLOAD_TIMEOUT) as res:
+                    res.raise_for_status()
+                    match = CONTENT_RANGE_TOTAL_RE.match(res.headers.get('Content-Range', ''))
+                    if res.status_code != 206 or not match:
+                        return None
+                    total = int(match.group(1))
+                    etag = res.headers.get('ETag')
+                    # 预分配的 .part 大小已经是完整大小，中断后不能按大小续传，清单里标记出来
+                    self.update_manifest(file_path, size=total, etag=etag, complete=False, segmented=True)
+                    fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+                    os.ftruncate(fd, total)
+                    size += self.write_segment(res, fd, 0, min(DOWNLOAD_SEGMENT_SIZE, total) - 1)
+            segments = plan_segments(DOWNLOAD_SEGMENT_SIZE, total)
+            futures = [self.segment_executor.submit(self.fetch_segment, session, limit, url, etag, fd, start, end)
+                       for start, end in segments]
+            error = None
+            for future in futures:
+                try:
+                    size += future.result()
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                raise error
+            if os.fstat(fd).st_size != total:
+                raise IOError(f'分段下载大小不一致: {os.fstat(fd).st_size}/{total}')
+            os.close(fd)
+            fd = None
+            self.finish(file_path, total, etag)
+            with self.lock:
+                self.segmented += 1
+            success = True
+            return size
+        finally:
+            if fd is not None:
+                os.close(fd)
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            self.end(size, success)
+
+    def fetch_segment(self, session, limit, url: str, etag: str, fd: int, start: int, end: int):
+        headers = {'Range': f'bytes={start}-{end}'}
+        if etag:
+            # 远端文件在分段之间变了会返回 200，不会拼出混合的内容
+            headers['If-Range'] = etag
+        with limit:
+            with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as res:
+                res.raise_for_status()
+                match = CONTENT_RANGE_START_RE.match(res.headers.get('Content-Range', ''))
+                if res.status_code != 206 or not match or int(match.group(1)) != start:
+                    raise IOError(f'分段 {start}-{end} 返回了非预期的内容: {res.status_code} {res.headers.get("Content-Range")}')
+                return self.write_segment(res, fd, start, end)
+
+    def write_segment(self, res, fd: int, start: int, end: int):
+        position = start
+        for data in res.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            write_at(fd, data, position)
+            position += len(data)
+        if position != end + 1:
+            raise IOError(f'分段 {start}-{end} 不完整: 收到 {position - start} 字节')
+        return position - start
+
+    def download_once(self, url: str, file_path: str):
+        part_path = file_path + PART_SUFFIX
+        entry = self.manifest_entry(file_path) or {}
+        if entry.get('segmented') and os.path.exists(part_path):
+            # 分段下载中断留下的是预分配的文件，大小不代表已下载的部分
+            os.remove(part_path)
+        if os.path.exists(file_path) and not os.path.exists(part_path):
+            # 没有清单记录的旧文件当作未完成的部分，用 Range 请求核对大小，完整时不会重新下载
+            os.replace(file_path, part_path)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            if entry.get('etag'):
+                # 远端文件变了就返回 200 整个文件，不会拼出错误的内容
+                headers['If-Range'] = entry['etag']
+        session, limit = self.session_for(url)
+        size = 0
+        success = False
+        self.begin()
+        try:
+            with limit:
+                with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as res:
+                    etag = res.headers.get('ETag')
+                    if res.status_code == 416:
+                        match = CONTENT_RANGE_TOTAL_RE.match(res.headers.get('Content-Range', ''))
+                        if match and int(match.group(1)) == offset:
+                            self.finish(file_path, offset, entry.get('etag'))
+                            success = True
+                            return 0
+                        # .part 比远端文件还大，丢掉后重试时重新下载
+                        os.remove(part_path)
+                        raise IOError('本地 .part 与远端文件不一致')
+                    res.raise_for_status()
+                    if res.status_code == 206:
+                        match = CONTENT_RANGE_TOTAL_RE.match(res.headers.get('Content-Range', ''))
+                        total = int(match.group(1)) if match else None
+                        mode = 'ab'
+                        with self.lock:
+                            self.resumed += 1
+                    else:
+                        # 压缩传输时 Content-Length 不是解压后的大小，无法校验
+                        total = int(res.headers['Content-Length']) if 'Content-Length' in res.headers and 'Content-Encoding' not in res.headers else None
+                        if offset and total == offset:
+                            # 服务端不支持 Range，但已有文件大小一致，不再重新下载
+                            self.finish(file_path, offset, etag)
+                            success = True
+                            return 0
+                        mode, offset = 'wb', 0
+                    self.update_manifest(file_path, size=total, etag=etag, complete=False)
+                    with open(part_path, mode=mode) as f:
+                        for data in res.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(data)
+                            size += len(data)
+            if total is not None and offset + size != total:
+                raise IOError(f'下载不完整: {offset + size}/{total}')
+            self.finish(file_path, offset + size, etag)
+            success = True
+            return size
+        finally:
+            self.end(size, success)
+
+    def run_many(self, func, tasks: list):
+        """
+        把一组下载任务放进共享线程池并等待全部完成，单个失败不影响其它任务
+        :param func: 单个任务的下载函数
+        :param tasks: 参数元组列表
+        返回 [(success, msg, result)]，与 tasks 顺序一致
+        """
+        futures = [self.executor.submit(func, *task) for task in tasks]
+        results = []
+        for future in futures:
+            try:
+                results.append((True, '成功', future.result()))
+            except Exception as e:
+                results.append((False, str(e), None))
+        return results
+
+    def stats(self):
+        with self.lock:
+            busy_time = self.busy_time + (time.monotonic() - self.busy_since if self.active else 0)
+            return {
+                'workers': self.max_workers,
+                'per_host': self.per_host,
+                'hosts': len(self.sessions),
+                'active': self.active,
+                'files': self.files,
+                'failures': self.failures,
+                'skipped': self.skipped,
+                'resumed': self.resumed,
+                'retries': self.retries,
+                'segmented': self.segmented,
+                'bytes': self.bytes,
+                'throughput': round(self.bytes / busy_time) if busy_time else 0,
+            }
+
+
+_media_downloader = None
+_media_downloader_lock = threading.Lock()
+
+
+def get_media_downloader():
+    """进程内共享的媒体下载器"""
+    global _media_downloader
+    with _media_downloader_lock:
+        if _media_downloader is None:
+            _media_downloader = MediaDownloader()
+        return _media_downloader
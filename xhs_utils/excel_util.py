@@ -0,0 +1,100 @@
+import os
+import openpyxl
+from loguru import logger
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+# 单个工作表最多写入的行数（Excel 上限 1048576 行，含表头），写满后换新工作表
+XLSX_MAX_ROWS_PER_SHEET = int(os.getenv('XHS_XLSX_MAX_ROWS_PER_SHEET', 1000000))
+# 单个文件最多的工作表数，写满后换新文件 {文件名}_2.xlsx、{文件名}_3.xlsx ...
+XLSX_MAX_SHEETS_PER_FILE = int(os.getenv('XHS_XLSX_MAX_SHEETS_PER_FILE', 1))
+# Excel 单元格最多 32767 个字符
+XLSX_MAX_CELL_LENGTH = 32767
+XLSX_HEADERS = {
+    'note': ['笔记id', '笔记url', '笔记类型', '用户id', '用户主页url', '昵称', '头像url', '标题', '描述', '点赞数量', '收藏数量', '评论数量', '分享数量', '视频封面url', '视频地址url', '图片地址url列表', '标签', '上传时间', 'ip归属地'],
+    'user': ['用户id', '用户主页url', '用户名', '头像url', '小红书号', '性别', 'ip地址', '介绍', '关注数量', '粉丝数量', '作品被赞和收藏数量', '标签'],
+    'comment': ['笔记id', '笔记url', '评论id', '用户id', '用户主页url', '昵称', '头像url', '评论内容', '评论标签', '点赞数量', '上传时间', 'ip归属地', '图片地址url列表'],
+}
+
+
+def to_cell(value):
+    """数字原样写入，其它转成字符串并去掉 Excel 不允许的控制字符"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    value = str(value)
+    if ILLEGAL_CHARACTERS_RE.search(value):
+        value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value[:XLSX_MAX_CELL_LENGTH]
+
+
+class StreamingXlsxWriter():
+    def __init__(self, file_path: str, type: str = 'note', max_rows_per_sheet: int = XLSX_MAX_ROWS_PER_SHEET, max_sheets_per_file: int = XLSX_MAX_SHEETS_PER_FILE):
+        """
+        流式写入 excel：使用 openpyxl 的 write_only 模式，行写入后落到临时文件，不在内存里保留，
+        内存占用与行数无关；超过行数上限换新工作表，超过工作表上限换新文件
+        :param file_path: 第一个文件的路径
+        :param type: note / user / comment，决定表头
+        :param max_rows_per_sheet: 单个工作表的数据行数上限
+        :param max_sheets_per_file: 单个文件的工作表数上限
+        """
+        self.file_path = file_path
+        self.headers = XLSX_HEADERS.get(type, XLSX_HEADERS['comment'])
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.max_sheets_per_file = max_sheets_per_file
+        self.file_paths = []
+        self.workbook = None
+        self.sheet = None
+        self.sheet_count = 0
+        self.sheet_rows = 0
+        self.rows = 0
+        self.closed = False
+
+    def next_file_path(self):
+        if not self.file_paths:
+            return self.file_path
+        stem, ext = os.path.splitext(self.file_path)
+        return f'{stem}_{len(self.file_paths) + 1}{ext}'
+
+    def new_sheet(self):
+        if self.workbook is None or self.sheet_count >= self.max_sheets_per_file:
+            self.save_file()
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.file_paths.append(self.next_file_path())
+            self.sheet_count = 0
+        self.sheet_count += 1
+        self.sheet = self.workbook.create_sheet(f'Sheet{self.sheet_count}')
+        self.sheet.append(self.headers)
+        self.sheet_rows = 0
+
+    def save_file(self):
+        if self.workbook is not None:
+            self.workbook.save(self.file_paths[-1])
+            logger.info(f'数据保存至 {self.file_paths[-1]}')
+            self.workbook = None
+
+    def append(self, data: dict):
+        if self.sheet is None or self.sheet_rows >= self.max_rows_per_sheet:
+            self.new_sheet()
+        self.sheet.append([to_cell(value) for value in data.values()])
+        self.sheet_rows += 1
+        self.rows += 1
+
+    def extend(self, datas):
+        for data in datas:
+            self.append(data)
+
+    def close(self):
+        """保存最后一个文件，没有数据时也输出只有表头的文件；返回写出的全部文件路径"""
+        if not self.closed:
+            if self.sheet is None:
+                self.new_sheet()
+            self.save_file()
+            self.closed = True
+        return self.file_paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
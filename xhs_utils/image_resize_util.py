@@ -0,0 +1,160 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from email.utils import formatdate
+from loguru import logger
+
+IMAGE_RESIZE_WORKERS = int(os.getenv('XHS_IMAGE_RESIZE_WORKERS', 2))
+IMAGE_MAX_WIDTH = int(os.getenv('XHS_IMAGE_MAX_WIDTH', 2048))
+IMAGE_DEFAULT_QUALITY = 80
+# 按优先级排列：客户端声明支持且本机 Pillow 能编码的第一个格式胜出
+IMAGE_FORMATS = [
+    ('avif', 'image/avif', 'AVIF'),
+    ('webp', 'image/webp', 'WEBP'),
+    ('jpeg', 'image/jpeg', 'JPEG'),
+]
+IMAGE_CONTENT_TYPES = {name: content_type for name, content_type, _ in IMAGE_FORMATS}
+
+_encodable_formats = None
+
+
+def encodable_formats():
+    """本机 Pillow 能编码的格式，没装 Pillow 时为空列表"""
+    global _encodable_formats
+    if _encodable_formats is None:
+        try:
+            from PIL import features
+        except ImportError:
+            logger.warning('未安装 Pillow，/proxy/image 不做缩放和格式转换')
+            _encodable_formats = []
+        else:
+            _encodable_formats = [name for name, _, _ in IMAGE_FORMATS if name == 'jpeg' or features.check(name)]
+    return _encodable_formats
+
+
+def negotiate_format(accept_header: str):
+    """
+    按 Accept 头选择输出格式
+    返回 avif / webp / jpeg，本机不支持转换时返回 None
+    """
+    formats = encodable_formats()
+    if not formats:
+        return None
+    accepted = set()
+    for part in (accept_header or '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        accepted.add(media_type.strip().lower())
+    for name in formats:
+        if name == 'jpeg' or IMAGE_CONTENT_TYPES[name] in accepted:
+            return name
+    return 'jpeg'
+
+
+def resize_image(src_path: str, width: int, quality: int, fmt: str):
+    """
+    在进程池里执行：按宽度等比缩小（不放大）并编码为指定格式
+    :param src_path: 缓存中的原图路径
+    :param width: 目标宽度，为 0 时保持原尺寸
+    :param quality: 编码质量 1-95
+    :param fmt: avif / webp / jpeg
+    """
+    from PIL import Image, ImageOps
+    with Image.open(src_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if width and image.width > width:
+            image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+        pil_format = {name: pil_format for name, _, pil_format in IMAGE_FORMATS}[fmt]
+        if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        output = io.BytesIO()
+        image.save(output, format=pil_format, quality=quality)
+        return output.getvalue()
+
+
+class ImageResizer():
+    def __init__(self, max_workers: int = IMAGE_RESIZE_WORKERS):
+        """
+        图片缩放/转码：在独立进程池里做，不占用事件循环和接口线程的 CPU；
+        结果写入图片缓存，同一尺寸同一格式只计算一次，并发的相同请求共享同一次计算
+        :param max_workers: 进程数
+        """
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.resized = 0
+        self.failed = 0
+        self.resize_time = 0.0
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    @staticmethod
+    def normalize(width: int, quality: int):
+        width = min(max(width or 0, 0), IMAGE_MAX_WIDTH)
+        quality = min(max(quality or IMAGE_DEFAULT_QUALITY, 1), 95)
+        return width, quality
+
+    def get_variant(self, cache, url: str, src_key: str, width: int, quality: int, fmt: str):
+        """
+        取缩放后的图片，缓存里没有就在进程池里生成并写入缓存
+        :param cache: DiskLRUCache，原图已在其中
+        :param src_key: 原图的缓存 key
+        返回 (key, meta)，失败返回 (None, None)
+        """
+        key = cache.key_for(url, width, quality, fmt)
+        meta = cache.get(key)
+        if meta is not None:
+            return key, meta
+        with self.lock:
+            pending = self.inflight.get(key)
+            if pending is None:
+                pending = self.inflight[key] = Future()
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                job = self.executor.submit(resize_image, cache.data_path(src_key), width, quality, fmt)
+            else:
+                job = None
+        if job is None:
+            return pending.result()
+        result = (None, None)
+        try:
+            start = time.monotonic()
+            content = job.result()
+            self.resized += 1
+            self.resize_time += time.monotonic() - start
+            meta = {
+                'url': url,
+                'content_type': IMAGE_CONTENT_TYPES[fmt],
+                'etag': f'"{hashlib.md5(content).hexdigest()}"',
+                'last_modified': formatdate(time.time(), usegmt=True),
+            }
+            result = (key, cache.put_bytes(key, content, meta))
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f'图片缩放失败 {url}: {e}')
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            pending.set_result(result)
+        return result
+
+    def stats(self):
+        return {
+            'workers': self.max_workers,
+            'formats': encodable_formats(),
+            'inflight': len(self.inflight),
+            'resized': self.resized,
+            'failed': self.failed,
+            'resize_avg': round(self.resize_time / self.resized, 4) if self.resized else 0,
+        }
@@ -0,0 +1,185 @@
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from loguru import logger
+
+# 原始响应归档目录，留空表示不启用
+RAW_SINK_DIR = os.getenv('XHS_RAW_SINK_DIR', '')
+# 压缩方式：gzip / zstd（需要安装 zstandard）/ none
+JSONL_CODEC = os.getenv('XHS_JSONL_CODEC', 'gzip')
+# 单个文件写入的未压缩字节数或打开时长超过上限后换下一个文件
+JSONL_ROTATE_BYTES = int(os.getenv('XHS_JSONL_ROTATE_BYTES', 512 * 1024 * 1024))
+JSONL_ROTATE_SECONDS = int(os.getenv('XHS_JSONL_ROTATE_SECONDS', 3600))
+# 攒够这么多条或距上次写入超过这么多秒时批量写一次
+JSONL_BATCH_SIZE = int(os.getenv('XHS_JSONL_BATCH_SIZE', 500))
+JSONL_FLUSH_INTERVAL = float(os.getenv('XHS_JSONL_FLUSH_INTERVAL', 5))
+JSONL_EXTENSIONS = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst', 'none': '.jsonl'}
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd 压缩需要安装 zstandard: pip install zstandard')
+    return zstandard
+
+
+def open_compressed(file_path: str, mode: str):
+    """按扩展名打开压缩文件，mode 为 ab（追加写）或 rb（读）"""
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, mode)
+    if file_path.endswith('.zst'):
+        zstandard = import_zstandard()
+        raw = open(file_path, mode)
+        if 'r' in mode:
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+    return open(file_path, mode)
+
+
+def iter_jsonl(path: str):
+    """
+    逐条读取 JSONL 文件，path 为目录时按文件名顺序读取其中全部 .jsonl / .jsonl.gz / .jsonl.zst 文件
+    只在迭代时读取，不会一次性加载；进程中断留下的不完整文件读到能读的部分为止
+    """
+    if os.path.isdir(path):
+        file_paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(tuple(JSONL_EXTENSIONS.values()))]
+    else:
+        file_paths = [path]
+    for file_path in file_paths:
+        with open_compressed(file_path, 'rb') as f:
+            try:
+                for line in io.BufferedReader(f) if file_path.endswith('.zst') else f:
+                    if line.strip():
+                        yield json.loads(line)
+            except (EOFError, ValueError) as e:
+                logger.warning(f'{file_path} 不完整，已读到末尾可用的部分: {e}')
+
+
+class JsonlSink():
+    def __init__(self, root: str, prefix: str = 'raw', codec: str = JSONL_CODEC, rotate_bytes: int = JSONL_ROTATE_BYTES,
+                 rotate_seconds: int = JSONL_ROTATE_SECONDS, batch_size: int = JSONL_BATCH_SIZE, flush_interval: float = JSONL_FLUSH_INTERVAL):
+        """
+        只追加的压缩 JSONL 归档：记录先在内存里攒成一批再一次写入，减少系统调用；
+        文件按大小或时长轮转，文件名带创建时间，按文件名排序即为写入顺序
+        :param root: 输出目录
+        :param prefix: 文件名前缀
+        :param codec: gzip / zstd / none
+        :param rotate_bytes: 单个文件的未压缩字节数上限
+        :param rotate_seconds: 单个文件的时长上限
+        :param batch_size: 每批条数
+        :param flush_interval: 距上次写入超过这个秒数时，下一条记录到来就写入
+        """
+        if codec not in JSONL_EXTENSIONS:
+            raise ValueError(f'不支持的压缩方式: {codec}')
+        if codec == 'zstd':
+            import_zstandard()
+        self.root = root
+        self.prefix = prefix
+        self.codec = codec
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.batch = []
+        self.file = None
+        self.file_path = None
+        self.file_bytes = 0
+        self.opened_at = 0
+        self.last_flush = time.monotonic()
+        self.seq = 0
+        self.records = 0
+        self.bytes = 0
+        self.files = 0
+
+    def write(self, record: dict):
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        with self.lock:
+            self.batch.append(line)
+            self.records += 1
+            if len(self.batch) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush_locked()
+
+    def record_response(self, cookies: dict, response):
+        """XHS_Apis 的响应钩子：记录每个原始响应（不含 cookies）"""
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        self.write({
+            'ts': time.time(),
+            'method': response.request.method,
+            'url': response.request.url,
+            'status': response.status_code,
+            'body': body,
+        })
+
+    def open_file(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.seq += 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.seq:04d}{JSONL_EXTENSIONS[self.codec]}"
+        self.file_path = os.path.join(self.root, name)
+        self.file = open_compressed(self.file_path, 'ab')
+        self.file_bytes = 0
+        self.opened_at = time.monotonic()
+        self.files += 1
+
+    def close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def flush_locked(self):
+        if self.batch:
+            if self.file is not None and (self.file_bytes >= self.rotate_bytes or time.monotonic() - self.opened_at >= self.rotate_seconds):
+                self.close_file()
+            if self.file is None:
+                self.open_file()
+            data = b''.join(self.batch)
+            self.file.write(data)
+            self.file.flush()
+            self.file_bytes += len(data)
+            self.bytes += len(data)
+            self.batch = []
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def close(self):
+        """写入剩余的记录并关闭当前文件"""
+        with self.lock:
+            self.flush_locked()
+            self.close_file()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'root': self.root,
+                'codec': self.codec,
+                'records': self.records,
+                'pending': len(self.batch),
+                'bytes': self.bytes,
+                'files': self.files,
+                'current_file': self.file_path if self.file is not None else None,
+            }
+
+
+_raw_sink = None
+_raw_sink_lock = threading.Lock()
+
+
+def get_raw_sink():
+    """进程内共享的原始响应归档，未配置 XHS_RAW_SINK_DIR 时返回 None"""
+    global _raw_sink
+    if not RAW_SINK_DIR:
+        return None
+    with _raw_sink_lock:
+        if _raw_sink is None:
+            _raw_sink = JsonlSink(RAW_SINK_DIR)
+        return _raw_sink
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from loguru import logger
+
+CACHE_BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/cache'))
+IMAGE_CACHE_DIR = os.getenv('XHS_IMAGE_CACHE_DIR', os.path.join(CACHE_BASE_PATH, 'images'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('XHS_IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+IMAGE_CACHE_CONTROL = 'public, max-age=604800, immutable'
+
+
+class DiskLRUCache():
+    def __init__(self, root: str, max_bytes: int):
+        """
+        按 key 存文件的磁盘 LRU 缓存，数据文件旁边放一个同名 .json 记录元信息，
+        总大小超过 max_bytes 时淘汰最久未访问的条目
+        :param root: 缓存目录
+        :param max_bytes: 缓存总大小上限
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self.load()
+
+    @staticmethod
+    def key_for(*parts):
+        return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def data_path(self, key: str):
+        return os.path.join(self.root, key[:2], key)
+
+    def meta_path(self, key: str):
+        return self.data_path(key) + '.json'
+
+    def load(self):
+        """启动时扫描缓存目录，按文件访问时间重建 LRU 顺序"""
+        found = []
+        for dir_name in os.listdir(self.root):
+            dir_path = os.path.join(self.root, dir_name)
+            if not os.path.isdir(dir_path):
+                continue
+            for name in os.listdir(dir_path):
+                path = os.path.join(dir_path, name)
+                if name.endswith('.json'):
+                    continue
+                if '.tmp' in name:
+                    os.remove(path)
+                    continue
+                if not os.path.exists(path + '.json'):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_atime, name, stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        if found:
+            logger.info(f'加载缓存 {self.root}: {len(found)} 个文件, {self.total_bytes} 字节')
+        self.evict()
+
+    def get(self, key: str):
+        """命中时返回元信息并刷新 LRU 顺序，未命中返回 None"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        try:
+            with open(self.meta_path(key), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            os.utime(self.data_path(key))
+            return meta
+        except OSError:
+            self.discard(key)
+            return None
+
+    def temp_path(self, key: str):
+        os.makedirs(os.path.dirname(self.data_path(key)), exist_ok=True)
+        return f'{self.data_path(key)}.{uuid.uuid4().hex}.tmp'
+
+    def put_file(self, key: str, temp_path: str, meta: dict):
+        """把写好的临时文件原子地放入缓存"""
+        size = os.path.getsize(temp_path)
+        meta = dict(meta, size=size)
+        with open(self.meta_path(key), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, self.data_path(key))
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+        self.evict()
+        return meta
+
+    def put_bytes(self, key: str, content: bytes, meta: dict):
+        temp_path = self.temp_path(key)
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        return self.put_file(key, temp_path, meta)
+
+    def discard(self, key: str):
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+        for path in (self.data_path(key), self.meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes or not self.entries:
+                    return
+                key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+            for path in (self.data_path(key), self.meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def stream_into_cache(chunks, cache: DiskLRUCache, key: str, meta: dict, on_close=None):
+    """
+    把上游数据块原样转发给客户端，同时写入缓存；
+    完整传完才入缓存，中途断开则丢弃临时文件
+    :param chunks: 上游数据块迭代器
+    :param meta: 缓存元信息，未带 etag / last_modified 时按内容补上
+    :param on_close: 结束时的回调，一般用来关闭上游连接
+    """
+    temp_path = cache.temp_path(key)
+    digest = hashlib.md5()
+    completed = False
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                yield chunk
+        completed = True
+    finally:
+        if on_close is not None:
+            on_close()
+        if completed:
+            meta.setdefault('etag', f'"{digest.hexdigest()}"')
+            meta.setdefault('last_modified', formatdate(time.time(), usegmt=True))
+            cache.put_file(key, temp_path, meta)
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def is_not_modified(request_headers, meta: dict):
+    """按 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效"""
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        etags = [etag.strip()[2:] if etag.strip().startswith('W/') else etag.strip() for etag in if_none_match.split(',')]
+        return '*' in etags or meta.get('etag') in etags
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_modified_since and meta.get('last_modified'):
+        try:
+            return parsedate_to_datetime(meta['last_modified']) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import urllib.parse
+
+# 内容寻址媒体库目录，留空表示不启用；启用后笔记目录里的媒体文件是库中对象的硬链接
+MEDIA_STORE_DIR = os.getenv('XHS_MEDIA_STORE_DIR', '')
+# 图片地址形如 /{时间戳}/{签名}/{媒体id}!{样式}，前两段每次请求都会变
+SIGNED_PATH_RE = re.compile(r'^/\d{12}/[0-9a-f]+/')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def media_id_from_url(url: str):
+    """
+    从小红书 CDN 地址中取出稳定的媒体 id，同一张图片/同一个视频在不同笔记、不同时间抓到的地址 id 相同
+    不是 CDN 地址时返回 None，由下载后的内容哈希去重
+    """
+    parts = urllib.parse.urlsplit(url)
+    if not parts.netloc.endswith('xhscdn.com'):
+        return None
+    path = SIGNED_PATH_RE.sub('/', parts.path).split('!')[0].strip('/')
+    return path or None
+
+
+def file_sha256(file_path: str):
+    digest = hashlib.sha256()
+    with open(file_path, mode='rb') as f:
+        for data in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class MediaStore():
+    def __init__(self, root: str = MEDIA_STORE_DIR):
+        """
+        内容寻址媒体库：每个媒体只存一份，按 CDN 媒体 id（或没有 id 时按内容 sha256）寻址，
+        笔记目录里放硬链接；不支持硬链接时（跨盘、文件系统限制）由调用方在清单里记录对象路径
+        :param root: 媒体库目录
+        """
+        self.root = root
+        self.lock = threading.Lock()
+        self.linked = 0
+        self.deduped = 0
+        self.stored = 0
+        self.unlinkable = 0
+
+    def key_for_url(self, url: str):
+        media_id = media_id_from_url(url)
+        if media_id is None:
+            return None
+        return 'id/' + hashlib.sha1(media_id.encode('utf-8')).hexdigest()
+
+    def object_path(self, key: str):
+        namespace, digest = key.split('/')
+        return os.path.join(self.root, 'objects', namespace, digest[:2], digest)
+
+    def has(self, key: str):
+        return key is not None and os.path.exists(self.object_path(key))
+
+    def count(self, name: str):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def link_into(self, key: str, file_path: str):
+        """
+        把库中对象硬链接到 file_path，已存在的同名文件被替换
+        返回 True 表示已链接，False 表示当前文件系统不支持硬链接
+        """
+        tmp_path = file_path + '.link'
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.link(self.object_path(key), tmp_path)
+        except OSError:
+            self.count('unlinkable')
+            return False
+        os.replace(tmp_path, file_path)
+        self.count('linked')
+        return True
+
+    def adopt(self, file_path: str, key: str = None):
+        """
+        把刚下载好的文件收进媒体库：没有媒体 id 时按内容哈希寻址；
+        库里已经有相同对象时，笔记目录里的文件换成指向已有对象的硬链接
+        返回对象的 key
+        """
+        if key is None:
+            key = 'sha256/' + file_sha256(file_path)
+        object_path = self.object_path(key)
+        if os.path.exists(object_path):
+            if not os.path.samefile(object_path, file_path) and self.link_into(key, file_path):
+                self.count('deduped')
+            return key
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        try:
+            os.link(file_path, object_path)
+        except FileExistsError:
+            # 另一个线程刚收进了同一个对象
+            if self.link_into(key, file_path):
+                self.count('deduped')
+            return key
+        except OSError:
+            # 媒体库和笔记目录不在同一个盘，复制一份进库
+            tmp_path = object_path + '.tmp'
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, object_path)
+        self.count('stored')
+        return key
+
+    def stats(self):
+        with self.lock:
+            return {
+                'root': self.root,
+                'stored': self.stored,
+                'linked': self.linked,
+                'deduped': self.deduped,
+                'unlinkable': self.unlinkable,
+            }
+
+
+_media_store = None
+_media_store_lock = threading.Lock()
+
+
+def get_media_store():
+    """进程内共享的媒体库，未配置 XHS_MEDIA_STORE_DIR 时返回 None"""
+    global _media_store
+    if not MEDIA_STORE_DIR:
+        return None
+    with _media_store_lock:
+        if _media_store is None:
+            _media_store = MediaStore()
+        return _media_store
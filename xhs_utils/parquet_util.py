@@ -0,0 +1,247 @@
+import datetime
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from loguru import logger
+
+# 每攒够这么多行写一个 row group，内存里最多保留一个 row group 的数据
+PARQUET_ROW_GROUP_SIZE = int(os.getenv('XHS_PARQUET_ROW_GROUP_SIZE', 10000))
+PARQUET_COMPRESSION = os.getenv('XHS_PARQUET_COMPRESSION', 'zstd')
+# 按笔记分区写评论时同时打开的文件数上限，超过后关闭最久没写的分区
+PARQUET_MAX_OPEN_PARTITIONS = int(os.getenv('XHS_PARQUET_MAX_OPEN_PARTITIONS', 32))
+COUNT_RE = re.compile(r'^([\d.]+)\s*(万|w|W|亿|千|k|K)?\+?$')
+COUNT_UNITS = {None: 1, '千': 1000, 'k': 1000, 'K': 1000, '万': 10000, 'w': 10000, 'W': 10000, '亿': 100000000}
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# 各类数据的列：string 字符串，count 数量（"1.2万" 转成 12000），time 时间，list 字符串列表
+PARQUET_COLUMNS = {
+    'note': [
+        ('note_id', 'string'), ('note_url', 'string'), ('note_type', 'string'), ('user_id', 'string'), ('home_url', 'string'),
+        ('nickname', 'string'), ('avatar', 'string'), ('title', 'string'), ('desc', 'string'), ('liked_count', 'count'),
+        ('collected_count', 'count'), ('comment_count', 'count'), ('share_count', 'count'), ('video_cover', 'string'),
+        ('video_addr', 'string'), ('image_list', 'list'), ('tags', 'list'), ('upload_time', 'time'), ('ip_location', 'string'),
+    ],
+    'user': [
+        ('user_id', 'string'), ('home_url', 'string'), ('nickname', 'string'), ('avatar', 'string'), ('red_id', 'string'),
+        ('gender', 'string'), ('ip_location', 'string'), ('desc', 'string'), ('follows', 'count'), ('fans', 'count'),
+        ('interaction', 'count'), ('tags', 'list'),
+    ],
+    'comment': [
+        ('note_id', 'string'), ('note_url', 'string'), ('comment_id', 'string'), ('user_id', 'string'), ('home_url', 'string'),
+        ('nickname', 'string'), ('avatar', 'string'), ('content', 'string'), ('show_tags', 'list'), ('like_count', 'count'),
+        ('upload_time', 'time'), ('ip_location', 'string'), ('pictures', 'list'),
+    ],
+}
+
+
+def import_pyarrow():
+    """pyarrow 只有导出 parquet 时才需要，按需导入"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('导出 parquet 需要安装 pyarrow: pip install pyarrow')
+    return pyarrow, pyarrow.parquet
+
+
+def parse_count(value):
+    """把 "1.2万"、"10万+"、"999" 这类数量转成整数，无法识别时返回 None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = COUNT_RE.match(str(value).strip())
+    if not match:
+        return None
+    try:
+        return round(float(match.group(1)) * COUNT_UNITS[match.group(2)])
+    except ValueError:
+        return None
+
+
+def parse_time(value):
+    """支持 timestamp_to_str 输出的字符串和毫秒时间戳"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value / 1000)
+    try:
+        return datetime.datetime.strptime(str(value), TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def parse_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+def parse_string(value):
+    return None if value is None else str(value)
+
+
+PARSERS = {'string': parse_string, 'count': parse_count, 'time': parse_time, 'list': parse_list}
+
+
+def parquet_schema(type: str):
+    pa, _ = import_pyarrow()
+    kinds = {'string': pa.string(), 'count': pa.int64(), 'time': pa.timestamp('s'), 'list': pa.list_(pa.string())}
+    return pa.schema([(name, kinds[kind]) for name, kind in PARQUET_COLUMNS[type]])
+
+
+class ParquetExporter():
+    def __init__(self, file_path: str, type: str = 'note', row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        """
+        列式导出：数量转成整数、时间转成 timestamp、列表保留为 list 列，每攒够一个 row group 就写入，
+        先写到临时文件，关闭时写完 footer 再改名
+        :param file_path: parquet 文件路径
+        :param type: note / user / comment
+        :param row_group_size: 每个 row group 的行数
+        """
+        self.pa, self.pq = import_pyarrow()
+        self.file_path = file_path
+        self.type = type
+        self.columns = PARQUET_COLUMNS[type]
+        self.schema = parquet_schema(type)
+        self.row_group_size = row_group_size
+        self.buffer = {name: [] for name, _ in self.columns}
+        self.buffered = 0
+        self.rows = 0
+        self.writer = None
+        self.closed = False
+
+    def append(self, data: dict):
+        for name, kind in self.columns:
+            self.buffer[name].append(PARSERS[kind](data.get(name)))
+        self.buffered += 1
+        self.rows += 1
+        if self.buffered >= self.row_group_size:
+            self.flush()
+
+    def extend(self, datas):
+        for data in datas:
+            self.append(data)
+
+    def flush(self):
+        if self.writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
+            self.writer = self.pq.ParquetWriter(self.file_path + '.tmp', self.schema, compression=PARQUET_COMPRESSION)
+        if self.buffered:
+            self.writer.write_table(self.pa.Table.from_pydict(self.buffer, schema=self.schema))
+            self.buffer = {name: [] for name, _ in self.columns}
+            self.buffered = 0
+
+    def close(self):
+        """写入剩余的行并关闭，没有数据时也输出只有 schema 的文件"""
+        if not self.closed:
+            self.flush()
+            if self.writer is not None:
+                self.writer.close()
+                os.replace(self.file_path + '.tmp', self.file_path)
+            self.closed = True
+        return self.file_path
+
+    def abort(self):
+        """导出中途出错时丢弃临时文件，不留下看起来完整的 parquet"""
+        if not self.closed:
+            if self.writer is not None:
+                self.writer.close()
+            if os.path.exists(self.file_path + '.tmp'):
+                os.remove(self.file_path + '.tmp')
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class PartitionedParquetExporter():
+    def __init__(self, root: str, type: str = 'comment', partition_by: str = 'note_id', max_open: int = PARQUET_MAX_OPEN_PARTITIONS):
+        """
+        按列分区导出（hive 风格目录 {root}/note_id=xxx/part-{时间}-{随机串}.parquet），评论默认按笔记分区，
+        分析时按笔记读取只需打开对应目录；重复导出同一分区时追加新的 part 文件
+        :param root: 输出目录
+        :param partition_by: 分区列
+        :param max_open: 同时打开的分区文件数上限
+        """
+        import_pyarrow()
+        self.root = root
+        self.type = type
+        self.partition_by = partition_by
+        self.max_open = max_open
+        self.exporters = OrderedDict()
+        self.file_paths = []
+
+    def exporter_for(self, key: str):
+        exporter = self.exporters.get(key)
+        if exporter is not None:
+            self.exporters.move_to_end(key)
+            return exporter
+        if len(self.exporters) >= self.max_open:
+            _, oldest = self.exporters.popitem(last=False)
+            oldest.close()
+        directory = os.path.join(self.root, f'{self.partition_by}={key}')
+        # 文件名带时间和随机串，多个任务同时写同一分区时各写各的文件
+        name = f'part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet'
+        exporter = ParquetExporter(os.path.join(directory, name), self.type)
+        self.exporters[key] = exporter
+        self.file_paths.append(exporter.file_path)
+        return exporter
+
+    def append(self, data: dict):
+        self.exporter_for(str(data.get(self.partition_by))).append(data)
+
+    def extend(self, datas):
+        for data in datas:
+            self.append(data)
+
+    def close(self):
+        while self.exporters:
+            _, exporter = self.exporters.popitem(last=False)
+            exporter.close()
+        return self.file_paths
+
+    def abort(self):
+        """丢弃本次导出的全部分区文件，包括因打开数超限已经提前关闭的"""
+        while self.exporters:
+            _, exporter = self.exporters.popitem(last=False)
+            exporter.abort()
+        for file_path in self.file_paths:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        self.file_paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def save_to_parquet(datas, file_path, type='note'):
+    with ParquetExporter(file_path, type) as exporter:
+        exporter.extend(datas)
+    logger.info(f'数据保存至 {file_path}，共 {exporter.rows} 行')
+    return file_path
+
+
+def save_comments_to_parquet(datas, root):
+    """评论按笔记 id 分区导出"""
+    with PartitionedParquetExporter(root, 'comment') as exporter:
+        exporter.extend(datas)
+    logger.info(f'评论保存至 {root}，共 {len(exporter.file_paths)} 个分区文件')
+    return exporter.file_paths
@@ -0,0 +1,190 @@
+import contextvars
+import heapq
+import os
+import queue
+import threading
+import time
+from loguru import logger
+
+PIPELINE_QUEUE_SIZE = int(os.getenv('XHS_PIPELINE_QUEUE_SIZE', 32))
+_STOP = object()
+
+
+class Stage():
+    def __init__(self, name: str, func, workers: int = 1, ordered: bool = False):
+        """
+        流水线的一个阶段
+        :param name: 阶段名，用于统计
+        :param func: 处理函数，接收上一阶段的结果并返回本阶段的结果；返回 None 表示丢弃，抛异常记为失败
+        :param workers: 并发线程数
+        :param ordered: 是否按输入顺序处理（只能单线程，一般用于最后的落盘阶段）
+        """
+        if ordered and workers != 1:
+            raise ValueError('ordered 阶段只能使用 1 个线程')
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.ordered = ordered
+        self.input = None
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.max_depth = 0
+
+    def stats(self, elapsed: float):
+        depth = self.input.qsize() if self.input is not None else 0
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'throughput': round(self.processed / elapsed, 2) if elapsed else 0,
+            'busy_avg': round(self.busy_time / self.processed, 4) if self.processed else 0,
+            'queue_depth': depth,
+            'queue_max': self.max_depth,
+        }
+
+
+class Pipeline():
+    def __init__(self, stages: list, queue_size: int = PIPELINE_QUEUE_SIZE, on_complete=None):
+        """
+        多阶段流水线：阶段之间用有界队列连接，每个阶段有自己的线程数，条目处理完一个阶段立刻进入下一阶段，
+        下游处理不过来时上游自然阻塞，内存占用只和队列长度有关
+        :param stages: Stage 列表，按顺序执行
+        :param queue_size: 每个阶段输入队列的长度
+        :param on_complete: 条目走完最后一个阶段后调用 on_complete(源条目, 结果, 失败原因)，失败或被丢弃时结果为 None；
+                            最后一个阶段是 ordered 时按输入顺序调用，可以用来推进断点
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_complete = on_complete
+        self.errors = {}
+        self.failures = []
+        self.failures_lock = threading.Lock()
+        self.start_time = None
+        self.end_time = None
+        self.fed = 0
+
+    def run(self, source):
+        """
+        从 source 逐个取条目送入流水线，阻塞到全部处理完
+        :param source: 可迭代对象，可以是边翻页边产出的生成器
+        返回 (失败列表 [{stage, item, msg}], 各阶段统计)
+        """
+        for stage in self.stages:
+            stage.input = queue.Queue(maxsize=self.queue_size)
+        self.start_time = time.monotonic()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            for _ in range(stage.workers):
+                # 工作线程沿用调用方的上游调度通道和租户
+                context = contextvars.copy_context()
+                thread = threading.Thread(target=context.run, args=(self.work, stage, next_stage), name=f'pipeline-{stage.name}', daemon=True)
+                thread.start()
+                threads.append((stage, thread))
+        try:
+            self.feed(source)
+        finally:
+            # 逐个阶段收尾：上一阶段全部线程退出后再通知下一阶段
+            for stage in self.stages:
+                for _ in range(stage.workers):
+                    stage.input.put(_STOP)
+                for owner, thread in threads:
+                    if owner is stage:
+                        thread.join()
+            self.end_time = time.monotonic()
+        stats = self.stats()
+        logger.info(f'流水线完成: {self.fed} 条, 耗时 {stats["elapsed"]}s, ' +
+                    ', '.join(f'{name} {s["processed"]}/{s["throughput"]}每秒' for name, s in stats['stages'].items()))
+        return self.failures, stats
+
+    def feed(self, source):
+        first = self.stages[0]
+        try:
+            for item in source:
+                self.put(first, (self.fed, item, item))
+                self.fed += 1
+        except Exception as e:
+            logger.exception('流水线数据源异常')
+            self.fail('source', None, None, e)
+
+    def put(self, stage: Stage, envelope):
+        stage.input.put(envelope)
+        depth = stage.input.qsize()
+        if depth > stage.max_depth:
+            stage.max_depth = depth
+
+    def fail(self, stage_name: str, seq: int, item, error):
+        with self.failures_lock:
+            self.failures.append({'stage': stage_name, 'item': item, 'msg': str(error)})
+            if seq is not None and self.on_complete is not None:
+                self.errors[seq] = str(error)
+
+    def work(self, stage: Stage, next_stage: Stage):
+        """
+        条目以 (序号, 源条目, 当前值) 流转；被丢弃或失败的条目值为 None 继续往下传，
+        保证 ordered 阶段能按序号连续放行
+        """
+        pending = []
+        next_seq = 0
+        while True:
+            envelope = stage.input.get()
+            if envelope is _STOP:
+                break
+            if stage.ordered:
+                # 序号唯一，堆只会比较序号
+                heapq.heappush(pending, envelope)
+                ready = []
+                while pending and pending[0][0] == next_seq:
+                    ready.append(heapq.heappop(pending))
+                    next_seq += 1
+            else:
+                ready = [envelope]
+            for envelope in ready:
+                self.advance(stage, next_stage, envelope)
+        # 数据源中途异常时序号可能不连续，剩余的按序号处理完
+        for envelope in sorted(pending, key=lambda envelope: envelope[0]):
+            self.advance(stage, next_stage, envelope)
+
+    def advance(self, stage: Stage, next_stage: Stage, envelope):
+        seq, source_item, value = envelope
+        if value is not None:
+            value = self.process(stage, seq, source_item, value)
+        if next_stage is not None:
+            self.put(next_stage, (seq, source_item, value))
+        elif self.on_complete is not None:
+            with self.failures_lock:
+                error = self.errors.pop(seq, None)
+            try:
+                self.on_complete(source_item, value, error)
+            except Exception:
+                logger.exception('流水线 on_complete 回调异常')
+
+    def process(self, stage: Stage, seq: int, source_item, value):
+        start = time.monotonic()
+        failed = False
+        try:
+            result = stage.func(value)
+        except Exception as e:
+            result, failed = None, True
+            self.fail(stage.name, seq, source_item, e)
+        with stage.lock:
+            stage.processed += 1
+            stage.busy_time += time.monotonic() - start
+            if failed:
+                stage.failed += 1
+            elif result is None:
+                stage.dropped += 1
+        return result
+
+    def stats(self):
+        elapsed = (self.end_time or time.monotonic()) - self.start_time if self.start_time else 0
+        return {
+            'fed': self.fed,
+            'elapsed': round(elapsed, 3),
+            'failed': len(self.failures),
+            'stages': {stage.name: stage.stats(elapsed) for stage in self.stages},
+        }
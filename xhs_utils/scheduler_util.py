@@ -0,0 +1,143 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 优先级通道及其权重：权重越大分到的上游请求份额越多，低优先级不会被完全饿死
+LANE_WEIGHTS = {
+    'interactive': 8,
+    'bulk': 2,
+    'background': 1,
+}
+# 路由类别（见 admission_util.ROUTE_CLASSES）对应的默认通道，未列出的为 interactive；自动翻页、批量、流式接口走 bulk
+ROUTE_LANES = {
+    'heavy': 'bulk',
+}
+UPSTREAM_CONCURRENCY = int(os.getenv('XHS_UPSTREAM_CONCURRENCY', 16))
+
+current_lane = contextvars.ContextVar('xhs_upstream_lane', default='interactive')
+current_tenant = contextvars.ContextVar('xhs_upstream_tenant', default='default')
+
+
+@contextmanager
+def upstream_context(lane: str = None, tenant: str = None):
+    """
+    指定当前线程/协程发出的上游请求所属的通道和租户
+    :param lane: interactive / bulk / background
+    :param tenant: 调用方标识，同一通道内按租户公平分配
+    """
+    tokens = []
+    if lane:
+        tokens.append((current_lane, current_lane.set(lane)))
+    if tenant:
+        tokens.append((current_tenant, current_tenant.set(tenant)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class UpstreamScheduler():
+    def __init__(self, max_concurrent: int = UPSTREAM_CONCURRENCY, lane_weights: dict = None):
+        """
+        上游请求调度器：限制同时在途的上游请求数，排队的请求按 (通道, 租户) 做加权公平排队（start-time fair queueing）
+        :param max_concurrent: 最大同时在途请求数
+        :param lane_weights: 各通道权重
+        """
+        self.max_concurrent = max_concurrent
+        self.lane_weights = lane_weights or LANE_WEIGHTS
+        self.cond = threading.Condition()
+        self.active = 0
+        self.queue = []
+        self.seq = itertools.count()
+        self.virtual_time = 0.0
+        self.flow_finish = {}
+        self.lane_stats = {lane: {'queued': 0, 'served': 0, 'wait_total': 0.0, 'wait_max': 0.0} for lane in self.lane_weights}
+
+    def acquire(self, lane: str = None, tenant: str = None):
+        lane = lane or current_lane.get()
+        tenant = tenant or current_tenant.get()
+        if lane not in self.lane_weights:
+            lane = 'interactive'
+        flow = (lane, tenant)
+        enqueue_time = time.monotonic()
+        with self.cond:
+            start_tag = max(self.virtual_time, self.flow_finish.get(flow, 0.0))
+            self.flow_finish[flow] = start_tag + 1.0 / self.lane_weights[lane]
+            entry = (start_tag, next(self.seq))
+            heapq.heappush(self.queue, entry)
+            stats = self.lane_stats[lane]
+            stats['queued'] += 1
+            while self.active >= self.max_concurrent or self.queue[0] != entry:
+                self.cond.wait()
+            heapq.heappop(self.queue)
+            self.active += 1
+            self.virtual_time = start_tag
+            wait = time.monotonic() - enqueue_time
+            stats['queued'] -= 1
+            stats['served'] += 1
+            stats['wait_total'] += wait
+            stats['wait_max'] = max(stats['wait_max'], wait)
+            if len(self.flow_finish) > 1000:
+                self.flow_finish = {k: v for k, v in self.flow_finish.items() if v > self.virtual_time}
+            self.cond.notify_all()
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str = None, tenant: str = None):
+        self.acquire(lane, tenant)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self.cond:
+            lanes = {}
+            for lane, stats in self.lane_stats.items():
+                lanes[lane] = {
+                    'weight': self.lane_weights[lane],
+                    'queued': stats['queued'],
+                    'served': stats['served'],
+                    'wait_avg': round(stats['wait_total'] / stats['served'], 4) if stats['served'] else 0,
+                    'wait_max': round(stats['wait_max'], 4),
+                }
+            return {'max_concurrent': self.max_concurrent, 'active': self.active, 'queued': len(self.queue), 'lanes': lanes}
+
+
+class UpstreamContextMiddleware():
+    def __init__(self, app, classify=None):
+        """
+        ASGI 中间件：按路由类别设置本次请求发出的上游调用所属的通道，X-Tenant（缺省为客户端 IP）设置租户；
+        请求头 X-Priority（interactive / bulk / background）只能把通道调低，不能调高
+        :param classify: 路径 → 路由类别的函数（AdmissionController.classify），类别按 ROUTE_LANES 映射到通道，未传时都按 interactive
+        """
+        self.app = app
+        self.classify = classify
+
+    def default_lane(self, path: str):
+        return ROUTE_LANES.get(self.classify(path), 'interactive') if self.classify else 'interactive'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+        lane = self.default_lane(scope['path'])
+        requested = headers.get('x-priority')
+        if requested in LANE_WEIGHTS and LANE_WEIGHTS[requested] < LANE_WEIGHTS[lane]:
+            lane = requested
+        tenant = headers.get('x-tenant') or (scope['client'][0] if scope.get('client') else 'default')
+        with upstream_context(lane, tenant):
+            await self.app(scope, receive, send)
+
+
+upstream_scheduler = UpstreamScheduler()
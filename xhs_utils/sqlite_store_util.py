@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from xhs_utils.parquet_util import PARQUET_COLUMNS, parse_count
+
+STORE_DB_PATH = os.getenv('XHS_STORE_DB', os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/xhs_store.db')))
+# 攒够这么多条记录后在一个事务里批量写入
+STORE_BATCH_SIZE = int(os.getenv('XHS_STORE_BATCH_SIZE', 200))
+# FastAPI 接口获取到的笔记、用户、评论是否顺便写入本地库
+STORE_WRITE_THROUGH = os.getenv('XHS_STORE_WRITE_THROUGH', '0') == '1'
+# 各类记录的表名和主键；列与 parquet 导出一致，数量存整数，列表存 JSON，时间存 "YYYY-mm-dd HH:MM:SS" 字符串便于排序
+STORE_TABLES = {
+    'note': ('notes', 'note_id'),
+    'user': ('users', 'user_id'),
+    'comment': ('comments', 'comment_id'),
+}
+STORE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS notes_user_id ON notes (user_id)',
+    'CREATE INDEX IF NOT EXISTS notes_upload_time ON notes (upload_time)',
+    'CREATE INDEX IF NOT EXISTS comments_note_id ON comments (note_id)',
+    'CREATE INDEX IF NOT EXISTS comments_user_id ON comments (user_id)',
+    'CREATE INDEX IF NOT EXISTS comments_upload_time ON comments (upload_time)',
+    'CREATE INDEX IF NOT EXISTS tags_owner ON tags (kind, owner_id)',
+]
+SQL_TYPES = {'string': 'TEXT', 'count': 'INTEGER', 'time': 'TEXT', 'list': 'TEXT'}
+
+
+def to_column(kind: str, value):
+    if value is None:
+        return None
+    if kind == 'count':
+        return parse_count(value)
+    if kind == 'list':
+        return json.dumps(list(value) if isinstance(value, (list, tuple)) else [value], ensure_ascii=False)
+    return str(value)
+
+
+class XhsStore():
+    def __init__(self, db_path: str = STORE_DB_PATH, batch_size: int = STORE_BATCH_SIZE):
+        """
+        本地结构化存储：handle_note_info / handle_user_info / handle_comment_info 的结果按主键 upsert 到 SQLite（WAL 模式），
+        笔记和用户的标签单独放在 tags 表里便于按标签查询；写入先缓冲，攒够一批后在一个事务里提交
+        :param db_path: sqlite 文件路径
+        :param batch_size: 每批写入的记录数
+        """
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = {kind: [] for kind in STORE_TABLES}
+        self.pending_count = 0
+        self.written = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock, self.conn:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            for kind, (table, key) in STORE_TABLES.items():
+                columns = ', '.join(f'"{name}" {SQL_TYPES[column_kind]}' + (' PRIMARY KEY' if name == key else '') for name, column_kind in PARQUET_COLUMNS[kind])
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns}, updated_at REAL NOT NULL)')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS tags (
+                tag TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                owner_id TEXT NOT NULL,
+                PRIMARY KEY (tag, kind, owner_id)
+            )''')
+            for sql in STORE_INDEXES:
+                self.conn.execute(sql)
+        self.upsert_sql = {}
+        for kind, (table, key) in STORE_TABLES.items():
+            names = [name for name, _ in PARQUET_COLUMNS[kind]] + ['updated_at']
+            updates = ', '.join(f'"{name}" = excluded."{name}"' for name in names if name != key)
+            quoted = ', '.join(f'"{name}"' for name in names)
+            placeholders = ', '.join('?' for _ in names)
+            self.upsert_sql[kind] = f'INSERT INTO {table} ({quoted}) VALUES ({placeholders}) ON CONFLICT ("{key}") DO UPDATE SET {updates}'
+
+    def add(self, kind: str, record: dict):
+        """
+        加入一条记录，攒够一批时写入
+        :param kind: note / user / comment
+        :param record: 整理后的记录
+        """
+        row = tuple(to_column(column_kind, record.get(name)) for name, column_kind in PARQUET_COLUMNS[kind]) + (time.time(),)
+        tags = record.get('tags') if kind != 'comment' else None
+        with self.lock:
+            self.pending[kind].append((row, tags))
+            self.pending_count += 1
+            if self.pending_count >= self.batch_size:
+                self.flush_locked()
+
+    def add_many(self, kind: str, records):
+        for record in records:
+            self.add(kind, record)
+
+    def flush_locked(self):
+        if not self.pending_count:
+            return
+        with self.conn:
+            for kind, items in self.pending.items():
+                if not items:
+                    continue
+                # 同一批里同一主键出现多次时保留最后一条
+                self.conn.executemany(self.upsert_sql[kind], [row for row, _ in items])
+                tagged = [(row[0], tags) for row, tags in items if tags is not None]
+                if tagged:
+                    self.conn.executemany('DELETE FROM tags WHERE kind = ? AND owner_id = ?', [(kind, owner_id) for owner_id, _ in tagged])
+                    self.conn.executemany('INSERT OR IGNORE INTO tags (tag, kind, owner_id) VALUES (?, ?, ?)',
+                                          [(str(tag), kind, owner_id) for owner_id, tags in tagged for tag in tags])
+        self.written += self.pending_count
+        self.pending = {kind: [] for kind in STORE_TABLES}
+        self.pending_count = 0
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def decode(self, kind: str, row):
+        if row is None:
+            return None
+        record = dict(row)
+        for name, column_kind in PARQUET_COLUMNS[kind]:
+            if column_kind == 'list' and record[name] is not None:
+                record[name] = json.loads(record[name])
+        return record
+
+    def query(self, kind: str, sql: str, args: list):
+        with self.lock:
+            # 先提交还在缓冲里的记录，查询结果包含刚写入的数据
+            self.flush_locked()
+            rows = self.conn.execute(sql, args).fetchall()
+        return [self.decode(kind, row) for row in rows]
+
+    def get(self, kind: str, key: str):
+        table, key_name = STORE_TABLES[kind]
+        rows = self.query(kind, f'SELECT * FROM {table} WHERE "{key_name}" = ?', [key])
+        return rows[0] if rows else None
+
+    def query_notes(self, user_id: str = None, tag: str = None, since: str = None, until: str = None, keyword: str = None, limit: int = 50, offset: int = 0):
+        """
+        按作者、标签、发布时间范围、标题/描述关键词查询笔记，按发布时间倒序
+        :param since: 起始时间（含），格式 YYYY-mm-dd 或 YYYY-mm-dd HH:MM:SS
+        :param until: 结束时间（不含）
+        """
+        sql, where, args = 'SELECT n.* FROM notes n', [], []
+        if tag:
+            sql += " JOIN tags t ON t.kind = 'note' AND t.owner_id = n.note_id AND t.tag = ?"
+            args.append(tag)
+        if user_id:
+            where.append('n.user_id = ?')
+            args.append(user_id)
+        if since:
+            where.append('n.upload_time >= ?')
+            args.append(since)
+        if until:
+            where.append('n.upload_time < ?')
+            args.append(until)
+        if keyword:
+            where.append('(n.title LIKE ? OR n."desc" LIKE ?)')
+            args += [f'%{keyword}%', f'%{keyword}%']
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return self.query('note', sql + ' ORDER BY n.upload_time DESC LIMIT ? OFFSET ?', args + [limit, offset])
+
+    def query_comments(self, note_id: str = None, user_id: str = None, limit: int = 100, offset: int = 0):
+        sql, where, args = 'SELECT * FROM comments', [], []
+        if note_id:
+            where.append('note_id = ?')
+            args.append(note_id)
+        if user_id:
+            where.append('user_id = ?')
+            args.append(user_id)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return self.query('comment', sql + ' ORDER BY upload_time DESC LIMIT ? OFFSET ?', args + [limit, offset])
+
+    def top_tags(self, kind: str = 'note', limit: int = 50):
+        with self.lock:
+            self.flush_locked()
+            rows = self.conn.execute('SELECT tag, COUNT(*) AS count FROM tags WHERE kind = ? GROUP BY tag ORDER BY count DESC LIMIT ?', (kind, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self.lock:
+            counts = {table: self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table, _ in STORE_TABLES.values()}
+            return dict(counts, db_path=self.db_path, pending=self.pending_count, written=self.written)
+
+    def close(self):
+        with self.lock:
+            self.flush_locked()
+            self.conn.close()
+
+
+_xhs_store = None
+_xhs_store_lock = threading.Lock()
+
+
+def get_xhs_store(create: bool = True):
+    """
+    进程内共享的本地库，Data_Spider 和 FastAPI 用同一份
+    :param create: 还没有打开过时是否创建；为 False 时返回 None，用于退出收尾和指标统计，避免凭空建库
+    """
+    global _xhs_store
+    with _xhs_store_lock:
+        if _xhs_store is None:
+            if not create:
+                return None
+            _xhs_store = XhsStore()
+        return _xhs_store
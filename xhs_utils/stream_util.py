@@ -0,0 +1,68 @@
+import json
+import time
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+STREAM_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # 关闭 nginx 等反向代理的响应缓冲，保证逐条推送
+    'X-Accel-Buffering': 'no',
+}
+
+
+def format_event(event, data, fmt='ndjson'):
+    """
+    把一条事件编码成 NDJSON 行或 SSE 消息
+    :param event: 事件类型 item / page / summary
+    :param data: 事件内容
+    :param fmt: ndjson 或 sse
+    """
+    if fmt == 'sse':
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({'type': event, 'data': data}, ensure_ascii=False) + '\n'
+
+
+async def stream_pages(request, pages, fmt='ndjson'):
+    """
+    把 XHS_Apis.iter_* 分页生成器转成流式响应体
+    每拿到一页就立即推送该页的所有条目，推完才去拉下一页（天然背压）；
+    客户端断开后停止翻页并关闭生成器，最后推送一条 summary 事件
+    :param request: fastapi 的 Request，用于检测客户端断开
+    :param pages: 产出 (success, msg, items, next_cursor) 的生成器
+    :param fmt: ndjson 或 sse
+    """
+    start = time.time()
+    success, msg = True, '成功'
+    count, page_count, cursor = 0, 0, ''
+    try:
+        while True:
+            if await request.is_disconnected():
+                logger.info(f'客户端已断开，停止流式翻页 {request.url.path}，已推送 {count} 条')
+                return
+            page = await run_in_threadpool(next, pages, None)
+            if page is None:
+                break
+            success, msg, items, next_cursor = page
+            if not success:
+                break
+            page_count += 1
+            cursor = next_cursor
+            for item in items:
+                count += 1
+                yield format_event('item', item, fmt)
+            yield format_event('page', {'page': page_count, 'count': len(items), 'cursor': cursor}, fmt)
+    finally:
+        pages.close()
+    yield format_event('summary', {
+        'success': success,
+        'msg': msg,
+        'count': count,
+        'pages': page_count,
+        'cursor': cursor,
+        'elapsed': round(time.time() - start, 3),
+    }, fmt)
@@ -0,0 +1,368 @@
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from xhs_utils.media_cache_util import CACHE_BASE_PATH, DiskLRUCache
+
+VIDEO_CACHE_DIR = os.getenv('XHS_VIDEO_CACHE_DIR', os.path.join(CACHE_BASE_PATH, 'videos'))
+VIDEO_CACHE_MAX_BYTES = int(os.getenv('XHS_VIDEO_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+VIDEO_CHUNK_SIZE = int(os.getenv('XHS_VIDEO_CHUNK_SIZE', 1024 * 1024))
+# download_media 下载视频时是否经过分块缓存（写入缓存，已缓存的块直接从本地读）
+VIDEO_CACHE_ON_DOWNLOAD = os.getenv('XHS_VIDEO_CACHE_ON_DOWNLOAD', '0') == '1'
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+def parse_range(range_header: str, size: int):
+    """
+    解析单段 Range 头
+    返回闭区间 (start, end)，没有 Range 头或无法满足时返回 None
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    start, _, end = range_header[6:].strip().partition('-')
+    try:
+        if start == '':
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+class VideoChunkCache():
+    def __init__(self, root: str = VIDEO_CACHE_DIR, max_bytes: int = VIDEO_CACHE_MAX_BYTES, chunk_size: int = VIDEO_CHUNK_SIZE):
+        """
+        按 chunk_size 对齐的稀疏视频缓存：每个 url 一个目录，meta.json 记录总大小，
+        每个块一个 {index}.chunk 文件，按块做 LRU 淘汰，读取时用 mmap 映射
+        :param root: 缓存目录
+        :param max_bytes: 缓存总大小上限
+        :param chunk_size: 块大小
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.key_chunks = {}
+        self.total_bytes = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+        os.makedirs(root, exist_ok=True)
+        self.load()
+
+    @staticmethod
+    def key_for(url: str):
+        # 签名参数会变化，只按路径区分同一个视频
+        return DiskLRUCache.key_for(url.split('?')[0])
+
+    def dir_path(self, key: str):
+        return os.path.join(self.root, key[:2], key)
+
+    def chunk_path(self, key: str, index: int):
+        return os.path.join(self.dir_path(key), f'{index}.chunk')
+
+    def load(self):
+        """启动时扫描缓存目录，按块文件访问时间重建 LRU 顺序，没有块的目录直接删掉"""
+        found = []
+        for prefix in os.listdir(self.root):
+            if not os.path.isdir(os.path.join(self.root, prefix)):
+                continue
+            for key in os.listdir(os.path.join(self.root, prefix)):
+                dir_path = os.path.join(self.root, prefix, key)
+                chunks = 0
+                for name in os.listdir(dir_path):
+                    path = os.path.join(dir_path, name)
+                    if name.endswith('.tmp'):
+                        os.remove(path)
+                    elif name.endswith('.chunk'):
+                        stat = os.stat(path)
+                        found.append((stat.st_atime, key, int(name.split('.')[0]), stat.st_size))
+                        chunks += 1
+                if chunks == 0:
+                    shutil.rmtree(dir_path, ignore_errors=True)
+        for _, key, index, size in sorted(found):
+            self.entries[(key, index)] = size
+            self.key_chunks[key] = self.key_chunks.get(key, 0) + 1
+            self.total_bytes += size
+        if found:
+            logger.info(f'加载视频分块缓存 {self.root}: {len(found)} 个块, {self.total_bytes} 字节')
+        self.evict()
+
+    def get_meta(self, key: str):
+        try:
+            with open(os.path.join(self.dir_path(key), 'meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set_meta(self, key: str, meta: dict):
+        os.makedirs(self.dir_path(key), exist_ok=True)
+        temp_path = os.path.join(self.dir_path(key), f'meta.{uuid.uuid4().hex}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, os.path.join(self.dir_path(key), 'meta.json'))
+
+    def chunk_count(self, size: int):
+        return (size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_bounds(self, index: int, size: int):
+        """第 index 块的闭区间字节范围"""
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, size) - 1
+
+    def has_chunk(self, key: str, index: int):
+        with self.lock:
+            return (key, index) in self.entries
+
+    def read_chunk(self, key: str, index: int, lo: int = 0, hi: int = None):
+        """用 mmap 读取块内 [lo, hi) 的字节，块已被淘汰时返回 None"""
+        with self.lock:
+            if (key, index) not in self.entries:
+                self.chunk_misses += 1
+                return None
+            self.entries.move_to_end((key, index))
+            self.chunk_hits += 1
+        try:
+            with open(self.chunk_path(key, index), 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return mm[lo:hi]
+        except (OSError, ValueError):
+            self.discard_chunk(key, index)
+            return None
+
+    def write_chunk(self, key: str, index: int, data: bytes):
+        os.makedirs(self.dir_path(key), exist_ok=True)
+        temp_path = f'{self.chunk_path(key, index)}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, self.chunk_path(key, index))
+        with self.lock:
+            if (key, index) in self.entries:
+                self.total_bytes -= self.entries.pop((key, index))
+            else:
+                self.key_chunks[key] = self.key_chunks.get(key, 0) + 1
+            self.entries[(key, index)] = len(data)
+            self.total_bytes += len(data)
+        self.evict()
+
+    def discard_chunk(self, key: str, index: int):
+        with self.lock:
+            if (key, index) not in self.entries:
+                return
+            self.total_bytes -= self.entries.pop((key, index))
+            self.key_chunks[key] -= 1
+            remove_dir = self.key_chunks[key] == 0
+            if remove_dir:
+                del self.key_chunks[key]
+        if remove_dir:
+            shutil.rmtree(self.dir_path(key), ignore_errors=True)
+        else:
+            try:
+                os.remove(self.chunk_path(key, index))
+            except OSError:
+                pass
+
+    def evict(self):
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes or not self.entries:
+                    return
+                key, index = next(iter(self.entries))
+            self.discard_chunk(key, index)
+
+    def stats(self):
+        with self.lock:
+            return {'videos': len(self.key_chunks), 'chunks': len(self.entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes,
+                    'chunk_hits': self.chunk_hits, 'chunk_misses': self.chunk_misses}
+
+
+class ChunkAssembler():
+    def __init__(self, cache: VideoChunkCache, key: str, first_index: int, size: int):
+        """
+        把一段从块边界开始的上游字节流切成完整的块，由调用方写入缓存（异步路径放到线程池里写，不阻塞事件循环）
+        :param first_index: 这段字节流对应的第一个块
+        :param size: 视频总大小
+        """
+        self.cache = cache
+        self.key = key
+        self.index = first_index
+        self.size = size
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes):
+        """喂入数据，返回本次凑满的 [(index, chunk_bytes)]"""
+        self.buffer += data
+        done = []
+        while self.index * self.cache.chunk_size < self.size:
+            start, end = self.cache.chunk_bounds(self.index, self.size)
+            length = end - start + 1
+            if len(self.buffer) < length:
+                break
+            chunk = bytes(self.buffer[:length])
+            del self.buffer[:length]
+            done.append((self.index, chunk))
+            self.index += 1
+        return done
+
+
+def missing_run_end(cache: VideoChunkCache, key: str, index: int, last_index: int):
+    """从 index 开始连续缺失的块一直到哪一块，合并成一次上游 Range 请求"""
+    end = index
+    while end < last_index and not cache.has_chunk(key, end + 1):
+        end += 1
+    return end
+
+
+def iter_cached_range_sync(cache: VideoChunkCache, url: str, session, headers: dict = None, timeout=30):
+    """
+    同步读取整个视频：已缓存的块直接读本地，缺失的块用 Range 请求补齐并写入缓存（供 download_media 使用）
+    上游不支持 Range 时返回 None，由调用方走普通下载
+    :param session: requests 或 requests.Session
+    返回 (视频总大小, 块迭代器)；总大小在这里确定，之后缓存被淘汰也不影响调用方校验
+    """
+    key = cache.key_for(url)
+    meta = cache.get_meta(key)
+    if meta is None:
+        resp = session.get(url, headers=dict(headers or {}, Range=f'bytes=0-{cache.chunk_size - 1}'), stream=True, timeout=timeout)
+        match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+        resp.close()
+        if resp.status_code != 206 or match is None:
+            return None
+        meta = {'url': url, 'size': int(match.group(3)), 'content_type': resp.headers.get('Content-Type', 'video/mp4')}
+        cache.set_meta(key, meta)
+    return meta['size'], _iter_cached_range_sync(cache, key, url, meta['size'], session, headers, timeout)
+
+
+def _iter_cached_range_sync(cache, key, url, size, session, headers, timeout):
+    last_index = cache.chunk_count(size) - 1
+    index = 0
+    while index <= last_index:
+        data = cache.read_chunk(key, index)
+        if data is not None:
+            yield data
+            index += 1
+            continue
+        run_end = missing_run_end(cache, key, index, last_index)
+        start, end = cache.chunk_bounds(index, size)[0], cache.chunk_bounds(run_end, size)[1]
+        resp = session.get(url, headers=dict(headers or {}, Range=f'bytes={start}-{end}'), stream=True, timeout=timeout)
+        try:
+            if resp.status_code != 206:
+                raise Exception(f'分块请求失败 {resp.status_code}')
+            assembler = ChunkAssembler(cache, key, index, size)
+            for data in resp.iter_content(chunk_size=256 * 1024):
+                for chunk_index, chunk in assembler.feed(data):
+                    cache.write_chunk(key, chunk_index, chunk)
+                    yield chunk
+        finally:
+            resp.close()
+        if assembler.index <= run_end:
+            raise Exception(f'分块数据不完整 {url}')
+        index = run_end + 1
+
+
+async def open_cached_video(proxy, cache: VideoChunkCache, url: str, range_header: str = None):
+    """
+    通过分块缓存响应视频请求：重叠的 Range 从缓存读取，只向上游请求缺失的块
+    上游不支持 Range 或拿不到总大小时返回 None，由调用方退回直连转发
+    :param proxy: AsyncVideoProxy，复用它的连接池
+    返回 (status_code, headers, body 异步迭代器)
+    缓存的文件读写（块、meta.json、淘汰）都放到线程池里执行，不阻塞事件循环
+    """
+    key = cache.key_for(url)
+    meta = await run_in_threadpool(cache.get_meta, key)
+    client = proxy.get_client()
+    if meta is None:
+        resp = await client.send(client.build_request('GET', url, headers={'Range': f'bytes=0-{cache.chunk_size - 1}'}), stream=True)
+        match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+        if resp.status_code != 206 or match is None:
+            await resp.aclose()
+            return None
+        meta = {'url': url, 'size': int(match.group(3)), 'content_type': resp.headers.get('Content-Type', 'video/mp4')}
+        await run_in_threadpool(cache.set_meta, key, meta)
+        # 探测请求拿到的第一块直接入缓存
+        assembler = ChunkAssembler(cache, key, 0, meta['size'])
+        try:
+            async for data in resp.aiter_raw():
+                for chunk_index, chunk in assembler.feed(data):
+                    await run_in_threadpool(cache.write_chunk, key, chunk_index, chunk)
+        finally:
+            await resp.aclose()
+    size = meta['size']
+    byte_range = parse_range(range_header, size)
+    if range_header and byte_range is None:
+        return 416, {'Content-Range': f'bytes */{size}'}, None
+    start, end = byte_range or (0, size - 1)
+    headers = {
+        'Content-Type': meta['content_type'],
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(end - start + 1),
+    }
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return (206 if byte_range else 200), headers, _iter_cached_range(proxy, cache, key, url, size, start, end)
+
+
+async def _iter_cached_range(proxy, cache, key, url, size, start, end):
+    first_index, last_index = start // cache.chunk_size, end // cache.chunk_size
+    client = proxy.get_client()
+    proxy.active_streams += 1
+    proxy.total_streams += 1
+    completed = False
+    try:
+        index = first_index
+        while index <= last_index:
+            chunk_start, chunk_end = cache.chunk_bounds(index, size)
+            lo, hi = max(start, chunk_start) - chunk_start, min(end, chunk_end) - chunk_start + 1
+            data = await run_in_threadpool(cache.read_chunk, key, index, lo, hi)
+            if data is not None:
+                proxy.bytes_streamed += len(data)
+                yield data
+                index += 1
+                continue
+            run_end = missing_run_end(cache, key, index, last_index)
+            range_start, range_end = chunk_start, cache.chunk_bounds(run_end, size)[1]
+            resp = await client.send(client.build_request('GET', url, headers={'Range': f'bytes={range_start}-{range_end}'}), stream=True)
+            try:
+                if resp.status_code != 206:
+                    raise Exception(f'分块请求失败 {resp.status_code}')
+                assembler = ChunkAssembler(cache, key, index, size)
+                async for data in resp.aiter_raw():
+                    for chunk_index, chunk in assembler.feed(data):
+                        await run_in_threadpool(cache.write_chunk, key, chunk_index, chunk)
+                        chunk_start, chunk_end = cache.chunk_bounds(chunk_index, size)
+                        piece = chunk[max(start, chunk_start) - chunk_start:min(end, chunk_end) - chunk_start + 1]
+                        proxy.bytes_streamed += len(piece)
+                        yield piece
+            finally:
+                await resp.aclose()
+            if assembler.index <= run_end:
+                raise Exception(f'分块数据不完整 {url}')
+            index = run_end + 1
+        completed = True
+    finally:
+        proxy.active_streams -= 1
+        if not completed:
+            proxy.aborted_streams += 1
+
+
+_video_cache = None
+_video_cache_lock = threading.Lock()
+
+
+def get_video_cache():
+    """进程内共享的视频分块缓存，/proxy/video 和 download_media 用同一份"""
+    global _video_cache
+    with _video_cache_lock:
+        if _video_cache is None:
+            _video_cache = VideoChunkCache()
+        return _video_cache
@@ -0,0 +1,99 @@
+import os
+import httpx
+from loguru import logger
+
+VIDEO_PROXY_MAX_CONNECTIONS = int(os.getenv('XHS_VIDEO_PROXY_MAX_CONNECTIONS', 100))
+VIDEO_PROXY_MIN_CHUNK = 64 * 1024
+VIDEO_PROXY_MAX_CHUNK = 1024 * 1024
+VIDEO_PROXY_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Referer": "https://www.xiaohongshu.com/",
+    # 响应体按原始字节转发，不能让上游压缩
+    "Accept-Encoding": "identity",
+}
+# 从上游透传给客户端的响应头
+PASSTHROUGH_HEADERS = ['Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified']
+
+
+class AsyncVideoProxy():
+    def __init__(self, max_connections: int = VIDEO_PROXY_MAX_CONNECTIONS):
+        """
+        基于 httpx.AsyncClient 的视频代理，连接池复用同一 CDN 的 keep-alive 连接，
+        拖动进度条产生的多次 Range 请求不必每次重新握手
+        :param max_connections: 连接池最大连接数
+        """
+        self.max_connections = max_connections
+        self.client = None
+        self.active_streams = 0
+        self.total_streams = 0
+        self.aborted_streams = 0
+        self.bytes_streamed = 0
+
+    def get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                headers=VIDEO_PROXY_HEADERS,
+                timeout=httpx.Timeout(10.0, read=30.0),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections // 2),
+                follow_redirects=True,
+            )
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def open(self, url: str, range_header: str = None):
+        """
+        向上游发起流式请求，只读取响应头
+        :param url: 视频地址
+        :param range_header: 客户端的 Range 头，原样透传
+        返回 (上游响应, 透传给客户端的响应头)
+        """
+        headers = {'Range': range_header} if range_header else {}
+        client = self.get_client()
+        resp = await client.send(client.build_request('GET', url, headers=headers), stream=True)
+        response_headers = {'Content-Type': resp.headers.get('Content-Type', 'video/mp4'), 'Accept-Ranges': 'bytes'}
+        for name in PASSTHROUGH_HEADERS:
+            if name in resp.headers:
+                response_headers[name] = resp.headers[name]
+        return resp, response_headers
+
+    async def iter_body(self, resp):
+        """
+        转发上游响应体：先发小块让播放器尽快起播，之后块大小逐步翻倍到上限以减少发送次数；
+        客户端断开时生成器被关闭，立即关闭上游连接
+        """
+        self.active_streams += 1
+        self.total_streams += 1
+        chunk_size = VIDEO_PROXY_MIN_CHUNK
+        buffer = bytearray()
+        completed = False
+        try:
+            async for data in resp.aiter_raw():
+                buffer += data
+                if len(buffer) >= chunk_size:
+                    chunk = bytes(buffer)
+                    buffer.clear()
+                    self.bytes_streamed += len(chunk)
+                    yield chunk
+                    chunk_size = min(chunk_size * 2, VIDEO_PROXY_MAX_CHUNK)
+            if buffer:
+                self.bytes_streamed += len(buffer)
+                yield bytes(buffer)
+            completed = True
+        finally:
+            self.active_streams -= 1
+            if not completed:
+                self.aborted_streams += 1
+                logger.info(f'视频流提前结束，关闭上游连接 {resp.url}')
+            await resp.aclose()
+
+    def stats(self):
+        return {
+            'active_streams': self.active_streams,
+            'total_streams': self.total_streams,
+            'aborted_streams': self.aborted_streams,
+            'bytes_streamed': self.bytes_streamed,
+        }
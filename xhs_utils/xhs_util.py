@@ -2,7 +2,8 @@ import json
 import math
 import random
 import execjs
-from xhs_utils.cookie_util import trans_cookies
+from xhs_utils.cookie_util import trans_cookies, resolve_cookies, COOKIE_ALIASES
+from xhs_utils.cookie_health_util import cookie_health
 
 try:
     js = execjs.compile(open(r'../static/xhs_xs_xsc_56.js', 'r', encoding='utf-8').read())
@@ -88,7 +89,10 @@ def generate_headers(a1, api, data=''):
     return headers, data
 
 def generate_request_params(cookies_str, api, data=''):
-    cookies = trans_cookies(cookies_str)
+    cookies = trans_cookies(resolve_cookies(cookies_str))
+    if cookies_str.strip() not in COOKIE_ALIASES:
+        # 游客等别名 cookies 由各自的池按响应结果轮换，不在这里拦截
+        cookie_health.ensure_alive(cookies)
     a1 = cookies['a1']
     headers, data = generate_headers(a1, api, data)
     return headers, cookies, data